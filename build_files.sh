@@ -1,4 +1,5 @@
 #!/usr/bin/env bash
+set -e
 
 echo "Installing project dependencies..."
 python3 -m venv .venv
@@ -10,6 +11,20 @@ echo "Making database migrations..."
 python3 manage.py makemigrations --noinput
 python3 manage.py migrate --noinput
 
+echo "Rendering Markdown fields..."
+python3 manage.py render_markdown
+
+echo "Building entry documents..."
+python3 manage.py build_entry_documents
+
+echo "Exporting the read-only database..."
+python3 manage.py export_readonly_db
+# The public lambda includes it (vercel.json).
+if [ ! -f "${READONLY_DB:-readonly.sqlite3}" ]; then
+  echo "The read-only database wasn't exported." >&2
+  exit 1
+fi
+
 echo "Collecting static files..."
 python3 manage.py collectstatic --noinput
 
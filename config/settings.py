@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+from copy import deepcopy
 from pathlib import Path
 from dotenv import load_dotenv
 from django.utils.translation import gettext_lazy as _
@@ -35,6 +36,112 @@ ALLOWED_HOSTS = os.getenv("DJANGO_ALLOWED_HOSTS").split(",")
 if 'DJANGO_CSRF_TRUSTED_ORIGINS' in os.environ:
     CSRF_TRUSTED_ORIGINS = os.getenv("DJANGO_CSRF_TRUSTED_ORIGINS").split(",")
 
+# Bearer token required to read api/metrics/. Without it, the metrics are
+# only served with DEBUG.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Maximum number of database queries per request of each view (by URL name).
+# Requests over budget are logged as warnings and counted in api/metrics/.
+QUERY_BUDGETS = {
+    "index": 0,
+    "entry-list": 10,
+    "entry-detail": 20,
+    "author-list": 5,
+    "author-entry-list": 10,
+    "category-list": 5,
+    "entry-by-category-list": 10,
+    "category-entry-list": 10,
+    "search": 5,
+    "about": 0,
+    "concordance": 3,
+    "robots": 0,
+    "language": 0,
+    # The session and the user, when signed in.
+    "account-nav": 2,
+    "sitemap-index": 3,
+    "sitemap-pages": 0,
+    "sitemap": 2,
+    "api-status": 3,
+    "api-metrics": 0,
+    "api-definitions": 2,
+    "api-changes": 1,
+    "api-concordance": 2,
+    "api-entry-graph": 5,
+    "api-synonym-cluster": 5,
+}
+
+# Statement timeout (ms) of the queries of the views that can get slow, by
+# URL name, set per transaction (voc.timeouts). Their cancelled queries are
+# counted in api/metrics/, and the views degrade instead of failing.
+STATEMENT_TIMEOUTS = {
+    "entry-list": 2000,
+    "author-list": 1000,
+    "author-entry-list": 2000,
+    "category-list": 1000,
+    "entry-by-category-list": 2000,
+    "category-entry-list": 2000,
+    "search": 1000,
+    "concordance": 2000,
+    "api-concordance": 2000,
+}
+
+# Queries slower than this are saved, fingerprinted, in the admin's Slow
+# Queries page (only the last SLOW_QUERY_BUFFER_SIZE), and with
+# BACKGROUND_JOBS, a fraction of the slow SELECTs get their EXPLAIN (ANALYZE,
+# BUFFERS) plan, which the worker captures by running them again.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", 0.1))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", 500))
+
+# Public pages are served from an in-memory snapshot of the vocabulary
+# (voc.snapshot), whose freshness is checked against the database at most
+# every LEXICON_SNAPSHOT_CHECK_INTERVAL seconds.
+LEXICON_SNAPSHOT = os.getenv("LEXICON_SNAPSHOT", "true") == "true"
+LEXICON_SNAPSHOT_CHECK_INTERVAL = float(os.getenv("LEXICON_SNAPSHOT_CHECK_INTERVAL", 2))
+
+# Seconds browsers and shared caches may keep the public pages, which are
+# the same for every visitor (voc.views.public_page).
+PUBLIC_PAGE_MAX_AGE = int(os.getenv("PUBLIC_PAGE_MAX_AGE", 60))
+
+# The search is throttled per client (voc.throttle) to SEARCH_THROTTLE_RATE
+# requests per second, with bursts of SEARCH_THROTTLE_BURST (0 disables it).
+# Behind a proxy, CLIENT_IP_HEADER names the header with the client's address.
+CLIENT_IP_HEADER = os.getenv("CLIENT_IP_HEADER")
+SEARCH_THROTTLE_RATE = float(os.getenv("SEARCH_THROTTLE_RATE", 5))
+SEARCH_THROTTLE_BURST = int(os.getenv("SEARCH_THROTTLE_BURST", 20))
+
+# Search results are kept for SEARCH_CACHE_TTL seconds (the last
+# SEARCH_CACHE_SIZE queries) and narrowed for longer queries
+# (voc.search_cache); each kind of result stops at SEARCH_MAX_RESULTS.
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 30))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 1000))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 500))
+
+# With BACKGROUND_JOBS, the work that follows an edit (entry documents,
+# synonym clusters, homonym numbers) is queued for the run_jobs worker
+# (voc.jobs) instead of done after the commit, in the editor's request.
+# Failed jobs are retried JOB_MAX_ATTEMPTS times, JOB_RETRY_DELAY seconds
+# apart and doubling; jobs running for JOB_TIMEOUT seconds are run again.
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "false") == "true"
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", 10))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 600))
+
+# One JSON line per request from voc.middleware, on the console.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "voc": {
+            "handlers": ["console"],
+            "level": os.getenv("VOC_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -49,6 +156,9 @@ INSTALLED_APPS = [
 ] + (os.getenv("DJANGO_DEV_APPS").split(",") if "DJANGO_DEV_APPS" in os.environ else [])
 
 MIDDLEWARE = [
+    "voc.middleware.InstrumentationMiddleware",
+    "voc.middleware.ReadOnlyMiddleware",
+    "voc.middleware.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -56,6 +166,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "voc.middleware.AnonymousMiddleware",
+    "voc.middleware.SignedInCookieMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -64,7 +176,8 @@ ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Django's, timing the renders (voc.instrumentation).
+        "BACKEND": "voc.instrumentation.DjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -91,8 +204,78 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
+        # Check connections before reusing them, so a connection dropped while
+        # the lambda was frozen doesn't fail the next request.
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+}
+
+# Connection reuse across requests (and warm lambda invocations). With the
+# psycopg pool, each process keeps at most POSTGRES_POOL_MAX_SIZE connections
+# and lets idle ones go after POSTGRES_POOL_MAX_IDLE seconds. Without it,
+# each thread keeps its own connection open for POSTGRES_CONN_MAX_AGE seconds.
+if os.getenv("POSTGRES_POOL", "true") == "true":
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", 0)),
+        "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", 4)),
+        "max_idle": float(os.getenv("POSTGRES_POOL_MAX_IDLE", 300)),
+        "timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", 10)),
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("POSTGRES_CONN_MAX_AGE", 60))
+
+# Threads of the concurrent search lookups (voc.views), each on a connection
+# of its own: with the pool, one less than its size, so searches leave a
+# connection to the request's thread instead of waiting on the pool past
+# SEARCH_TIME_BUDGET. Lookups waiting for a thread are dropped at the budget.
+SEARCH_THREADS = max(
+    1, DATABASES["default"]["OPTIONS"].get("pool", {}).get("max_size", 4) - 1
+)
+
+# Behind a transaction-pooling PgBouncer (or compatible proxy), a client
+# connection may be served by a different server connection on each
+# transaction, which breaks server-side cursors.
+if os.getenv("POSTGRES_PGBOUNCER") == "true":
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+# Read replicas (voc.replicas): comma-separated "host[:port]" of servers
+# replicating the default database, which they share the other settings of.
+# Replicas more than REPLICA_MAX_LAG seconds behind aren't used, and editors
+# read from the primary for READ_YOUR_WRITES_SECONDS after writing.
+REPLICA_ALIASES = []
+for number, address in enumerate(filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1):
+    host, _sep, port = address.strip().partition(":")
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **deepcopy(DATABASES["default"]),
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
     }
+    REPLICA_ALIASES.append(alias)
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 10))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 5))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 30))
+
+# Read-only SQLite copy of the vocabulary, exported by build_files.sh and
+# shipped with the deployment (voc.readonly). Anonymous visitors read from it
+# while it's as recent as the database, which is checked at most every
+# READONLY_DB_CHECK_INTERVAL seconds: the first edit after a deploy sends them
+# back to Postgres until the next one. The export fails when the copy is over
+# READONLY_DB_MAX_SIZE bytes, the maxLambdaSize of the public lambda in
+# vercel.json.
+READONLY_DB = os.getenv("READONLY_DB", str(BASE_DIR / "readonly.sqlite3"))
+READONLY_DB_CHECK_INTERVAL = float(os.getenv("READONLY_DB_CHECK_INTERVAL", 5))
+READONLY_DB_MAX_SIZE = int(os.getenv("READONLY_DB_MAX_SIZE", 15 * 2**20))
+DATABASES["readonly"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": f"file:{READONLY_DB}?mode=ro&immutable=1",
+    "OPTIONS": {"init_command": f"PRAGMA mmap_size={256 * 2**20}"},
+    # Tests read the default database instead.
+    "TEST": {"MIRROR": "default"},
 }
+DATABASE_ROUTERS = ["voc.readonly.ReadOnlyRouter", "voc.replicas.ReplicaRouter"]
 
 STORAGES = {
     "default": {
@@ -0,0 +1,48 @@
+"""
+Slim settings for the public lambda.
+
+Only serves the public vocabulary pages and API to anonymous visitors, so it
+boots without the admin, auth, sessions and messages apps and their
+middleware. The admin keeps being served by the full settings
+(``config.settings``), see the routes in ``vercel.json``.
+"""
+
+from copy import deepcopy
+
+from config.settings import *  # noqa: F401,F403
+from config.settings import INSTALLED_APPS, MIDDLEWARE, TEMPLATES
+
+
+INSTALLED_APPS = [
+    app
+    for app in INSTALLED_APPS
+    if app
+    not in [
+        "django.contrib.admin",
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "django.contrib.sessions",
+        "django.contrib.messages",
+    ]
+]
+
+MIDDLEWARE = [
+    middleware
+    for middleware in MIDDLEWARE
+    if middleware
+    not in [
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
+        "voc.middleware.AnonymousMiddleware",
+        "django.contrib.messages.middleware.MessageMiddleware",
+    ]
+]
+
+TEMPLATES = deepcopy(TEMPLATES)
+TEMPLATES[0]["OPTIONS"]["context_processors"] = [
+    "django.template.context_processors.request",
+]
+
+ROOT_URLCONF = "config.urls_public"
+
+WSGI_APPLICATION = "config.wsgi_public.application"
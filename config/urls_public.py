@@ -0,0 +1,13 @@
+"""
+URL configuration of the public lambda (``config.settings_public``): the
+same as ``config.urls`` without the admin.
+"""
+
+from django.urls import path, include
+
+
+urlpatterns = [
+    path("", include("voc.urls")),
+    path("api/", include("voc.api_urls")),
+    path("i18n/", include("django.conf.urls.i18n")),
+]
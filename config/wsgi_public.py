@@ -0,0 +1,15 @@
+"""
+WSGI config of the public lambda.
+
+Same as ``config.wsgi``, with the slim ``config.settings_public`` settings.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings_public")
+
+application = get_wsgi_application()
+
+app = application
@@ -0,0 +1,30 @@
+"""
+The "signed in" marker cookie.
+
+Public pages are the same for every visitor; account.js fetches the navbar
+links of signed-in users after the page loads, but only when this cookie is
+set. It isn't a credential (the session cookie is, and stays HttpOnly): it
+only spares the other visitors a request. It's set when a user signs in and
+deleted when they sign out, by ``SignedInCookieMiddleware``.
+"""
+
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+
+
+SIGNED_IN_COOKIE = "voc_signed_in"
+
+
+def signed_in(sender, request, user, **kwargs):
+    if request is not None:
+        request.signed_in = True
+
+
+def signed_out(sender, request, user, **kwargs):
+    if request is not None:
+        request.signed_in = False
+
+
+def connect():
+    uid = "voc.account"
+    user_logged_in.connect(signed_in, dispatch_uid=uid)
+    user_logged_out.connect(signed_out, dispatch_uid=uid)
@@ -5,6 +5,7 @@ from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.contrib.admin.widgets import AdminDateWidget
 from django.conf import settings
+from django.db.models import Exists, OuterRef
 from .models import *
 
 
@@ -33,6 +34,14 @@ class CotextAdminForm(forms.ModelForm):
             'text_date': AdminDateWidget(attrs={'placeholder': current_date_format}),
         }
 
+class ReferenceListFilter(admin.RelatedFieldListFilter):
+    """Reference filter labelled without a query per reference for its authors."""
+
+    def field_choices(self, field, request, model_admin):
+        references = Reference.objects.prefetch_related("authors")
+        return [(reference.pk, str(reference)) for reference in references]
+
+
 @admin.register(Cotext)
 class CotextAdmin(admin.ModelAdmin):
     form = CotextAdminForm
@@ -49,10 +58,14 @@ class CotextAdmin(admin.ModelAdmin):
     search_fields = ("id", "text", "reference__title", "reference__authors__last_name")
     list_filter = (
         "reference__authors",
-        "reference",
+        ("reference", ReferenceListFilter),
     )
+    list_select_related = ["reference"]
     autocomplete_fields = ["reference"]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("reference__authors")
+
     @admin.display(description=_("Edit"))
     def edit(self, obj):
         return _("Edit")
@@ -165,11 +178,23 @@ class EntryRelationsAdmin(admin.ModelAdmin):
     def edit(self, obj):
         return _("Edit")
 
+    def get_queryset(self, request):
+        symmetrical = EntryRelations.objects.filter(
+            entry=OuterRef("related_entry"),
+            type=OuterRef("type"),
+            related_entry=OuterRef("entry"),
+        )
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(symmetrical_exists=Exists(symmetrical))
+        )
+
     @admin.display(
-        description=_("Has Symmetrical"), boolean=True, ordering="has_symmetrical"
+        description=_("Has Symmetrical"), boolean=True, ordering="symmetrical_exists"
     )
     def has_symmetrical(self, obj):
-        return obj.has_symmetrical
+        return obj.symmetrical_exists
 
     @admin.display(description=_("View Entry On Site"))
     def view_entry_on_site(self, obj):
@@ -272,6 +297,21 @@ class EntryAdmin(admin.ModelAdmin):
         "term_gramm_class",
     ]
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .with_citation_data()
+            .select_related(
+                "term",
+                "term_gramm_class",
+                "general_char",
+                "trad_term",
+                "trad_relation",
+            )
+            .prefetch_related("term_def", "specific_char")
+        )
+
     @admin.display(description=_("Cotext"), ordering="cotext")
     def edit_cotext(self, obj):
         cotext = obj.cotext
@@ -315,3 +355,62 @@ class EntryAdmin(admin.ModelAdmin):
     @admin.display(description=_("Edit"))
     def edit(self, obj):
         return _("Edit")
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ["captured_at", "duration", "view", "call_site", "fingerprint"]
+    list_filter = ["view"]
+    search_fields = ["fingerprint", "sql", "call_site"]
+    # The parameters of a query waiting for its plan may be personal data.
+    exclude = ["to_explain"]
+    readonly_fields = [
+        field.name for field in SlowQuery._meta.fields if field.name != "to_explain"
+    ]
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_active and request.user.is_staff
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        from voc.slow_queries import summary
+
+        extra_context = {**(extra_context or {}), "summary": summary()}
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["task", "key", "status", "attempts", "run_after", "created_at"]
+    list_filter = ["status", "task"]
+    search_fields = ["key"]
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ["retry_now"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description=_("Retry the selected jobs now"))
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+
+        # A target that's pending already (or twice in the selection) is
+        # covered by that one job.
+        pending = set(Job.objects.filter(status=Job.PENDING).values_list("task", "key"))
+        retried, covered = [], []
+        for job in queryset.exclude(status=Job.PENDING):
+            target = (job.task, job.key)
+            (covered if target in pending else retried).append(job.pk)
+            pending.add(target)
+        Job.objects.filter(pk__in=covered).delete()
+        Job.objects.filter(pk__in=retried).update(
+            status=Job.PENDING, attempts=0, run_after=timezone.now()
+        )
@@ -5,4 +5,14 @@ from . import views
 
 urlpatterns = [
     path("status/", views.status, name="api-status"),
+    path("metrics/", views.prometheus_metrics, name="api-metrics"),
+    path("definitions/", views.definitions, name="api-definitions"),
+    path("changes/", views.changes, name="api-changes"),
+    path("concordance/", views.concordance_api, name="api-concordance"),
+    path("entries/<slug:slug>/graph/", views.entry_graph, name="api-entry-graph"),
+    path(
+        "synonym-clusters/<int:cluster>/",
+        views.synonym_cluster,
+        name="api-synonym-cluster",
+    ),
 ]
@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class VocConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "voc"
+
+    def ready(self):
+        from voc import (
+            account,
+            changes,
+            display,
+            documents,
+            graph,
+            readonly,
+            rich_text,
+            search_cache,
+            slow_queries,
+        )
+
+        # The display columns are refreshed before the change is recorded,
+        # so documents rebuilt right away (outside a transaction) see them.
+        rich_text.connect()
+        display.connect()
+        changes.connect()
+        graph.connect()
+        documents.connect()
+        search_cache.connect()
+        slow_queries.connect()
+        readonly.connect()
+        account.connect()
@@ -0,0 +1,87 @@
+"""
+Helpers shared by the benchmark management commands: timing summaries,
+JSON result files and comparison of two results to flag regressions.
+"""
+
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import django
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of ``values``, ``p`` between 0 and 100."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, round(p / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(samples):
+    """Summary statistics of a list of timings (or any other measure)."""
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "min": min(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(filename, benchmark, results, **params):
+    """Write ``results`` to ``filename`` with what's needed to compare them later."""
+    data = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "django": django.get_version(),
+        "params": params,
+        "results": results,
+    }
+    path = Path(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2) + "\n")
+    return data
+
+
+def load_results(filename):
+    return json.loads(Path(filename).read_text())
+
+
+def compare(baseline, current, metric="p50", tolerance=0.1):
+    """
+    Compare two ``{name: summary}`` result mappings and return the names
+    whose ``metric`` got worse by more than ``tolerance`` (a fraction), as
+    ``(name, before, after)`` tuples.
+    """
+    regressions = []
+    for name, summary in current.items():
+        before = baseline.get(name, {}).get(metric)
+        after = summary.get(metric)
+        if before and after is not None and after > before * (1 + tolerance):
+            regressions.append((name, before, after))
+    return regressions
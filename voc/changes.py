@@ -0,0 +1,172 @@
+"""
+Change log of the vocabulary.
+
+Every save, delete and many-to-many change of the ``voc`` models is recorded
+as a ``Change`` row, together with the ids of the entries it affects, so
+mirrors and indexers can sync incrementally through ``api/changes/``.
+
+Bulk operations (``QuerySet.update()``, ``bulk_create()``...) don't send
+signals and therefore aren't recorded.
+
+The feed is in commit order, not id order: a transaction that takes a while
+to commit records changes with lower ids than those of transactions that
+committed before it. On PostgreSQL, changes carry the id of the transaction
+that recorded them, and the feed serves them by transaction id, only up to
+the oldest transaction still running (the xmin of the current snapshot): no
+change can appear behind a consumer's cursor later. Other databases
+serialize their writes, so there ids are in commit order.
+"""
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from voc.models import (
+    Author,
+    Change,
+    Cotext,
+    Definition,
+    Entry,
+    EntryRelations,
+    GeneralChar,
+    GrammClass,
+    Reference,
+    SnapshotHorizon,
+    SpecificChar,
+    Term,
+    TradRelation,
+    TradTerm,
+)
+
+
+# Lookup from Entry to each tracked model, used to find the affected entries.
+ENTRY_LOOKUPS = {
+    Entry: "pk",
+    Term: "term",
+    Definition: "term_def",
+    Cotext: "cotext",
+    Reference: "cotext__reference",
+    Author: "cotext__reference__authors",
+    TradTerm: "trad_term",
+    GeneralChar: "general_char",
+    SpecificChar: "specific_char",
+    TradRelation: "trad_relation",
+    GrammClass: "term_gramm_class",
+}
+
+# Models whose rows point to entries directly, with their entry foreign keys.
+ENTRY_LINKS = {
+    EntryRelations: ["entry_id", "related_entry_id"],
+    Entry.term_def.through: ["entry_id"],
+    Entry.specific_char.through: ["entry_id"],
+}
+
+M2M_THROUGH_MODELS = [
+    Reference.authors.through,
+    Entry.term_def.through,
+    Entry.specific_char.through,
+]
+
+
+def entry_ids_for(model, pks):
+    """Return the ids of the entries affected by the given objects."""
+    pks = [pk for pk in pks if pk is not None]
+    if not pks:
+        return set()
+    if model is Entry:
+        return set(pks)
+    lookup = ENTRY_LOOKUPS[model]
+    return set(
+        Entry.objects.filter(**{f"{lookup}__in": pks}).values_list("pk", flat=True)
+    )
+
+
+def affected_entry_ids(instance):
+    model = type(instance)
+    if model in ENTRY_LINKS:
+        return {getattr(instance, field) for field in ENTRY_LINKS[model]}
+    return entry_ids_for(model, [instance.pk])
+
+
+def record(instance, action, entry_ids):
+    Change.objects.create(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        action=action,
+        entry_ids=sorted(entry_ids),
+    )
+
+
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    action = Change.CREATE if created else Change.UPDATE
+    record(instance, action, affected_entry_ids(instance))
+
+
+def collect_deleted(sender, instance, **kwargs):
+    # Related rows may be updated or deleted along with the instance, so the
+    # affected entries have to be found before the deletion happens.
+    instance._change_entry_ids = affected_entry_ids(instance)
+
+
+def record_delete(sender, instance, **kwargs):
+    entry_ids = getattr(instance, "_change_entry_ids", set())
+    # A deleted entry can't be re-read by consumers, but they must know it.
+    if isinstance(instance, Entry):
+        entry_ids = entry_ids | {instance.pk}
+    record(instance, Change.DELETE, entry_ids)
+
+
+def record_m2m(sender, instance, action, model, pk_set, **kwargs):
+    if action == "pre_clear":
+        instance._change_entry_ids = affected_entry_ids(instance)
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    entry_ids = affected_entry_ids(instance)
+    entry_ids |= getattr(instance, "_change_entry_ids", set())
+    entry_ids |= entry_ids_for(model, pk_set or [])
+    record(instance, Change.UPDATE, entry_ids)
+
+
+def parse_cursor(cursor):
+    """
+    The ``(transaction id, id)`` of a feed cursor. Plain ids (the cursors
+    from before transaction ids) point among the changes recorded before.
+    """
+    transaction_id, _sep, pk = str(cursor).rpartition(":")
+    return int(transaction_id or 0), int(pk)
+
+
+def format_cursor(transaction_id, pk):
+    return f"{transaction_id}:{pk}"
+
+
+def page(since, limit, horizon=None):
+    """
+    Up to ``limit`` changes after the ``(transaction id, id)`` cursor
+    ``since``, in commit order, and whether there are more: only the changes
+    of the transactions below ``horizon``, by default on PostgreSQL the xmin
+    of the query's own snapshot, so the page is one query.
+    """
+    transaction_id, pk = since
+    after = Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, pk__gt=pk)
+    changes = Change.objects.filter(after)
+    if horizon is None and connections[changes.db].vendor == "postgresql":
+        horizon = SnapshotHorizon()
+    if horizon is not None:
+        changes = changes.filter(transaction_id__lt=horizon)
+    found = list(changes.order_by("transaction_id", "pk")[: limit + 1])
+    return found[:limit], len(found) > limit
+
+
+def connect():
+    for model in [*ENTRY_LOOKUPS, *ENTRY_LINKS]:
+        uid = f"voc.changes.{model._meta.label_lower}"
+        post_save.connect(record_save, sender=model, dispatch_uid=uid)
+        pre_delete.connect(collect_deleted, sender=model, dispatch_uid=uid)
+        post_delete.connect(record_delete, sender=model, dispatch_uid=uid)
+    for through in M2M_THROUGH_MODELS:
+        uid = f"voc.changes.{through._meta.label_lower}"
+        m2m_changed.connect(record_m2m, sender=through, dispatch_uid=uid)
@@ -0,0 +1,110 @@
+"""
+Concordance of the cotexts.
+
+``page()`` finds every occurrence of a word or phrase in the cotexts and
+returns it as a keyword-in-context line: the occurrence with the ``window``
+characters on each side of it, and where the cotext comes from. Only whole
+words match, regardless of case.
+
+The candidate cotexts are found with ``icontains``, which PostgreSQL
+answers from a trigram index on the text (pg_trgm, see migration 0022)
+instead of reading every cotext; the occurrences are then located in the
+text of the candidates, which are read in batches until the page is full,
+since some only contain the query within longer words. Pages are runs of
+cotexts in id order after a cursor (``after``), never an OFFSET, so the
+last page costs what the first does.
+"""
+
+import re
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from voc.models import Cotext, Entry
+
+
+# Trigrams need at least three characters to narrow anything down.
+MIN_QUERY_LENGTH = 3
+
+DEFAULT_WINDOW = 40
+MAX_WINDOW = 200
+
+# Cotexts per page.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def normalize(query):
+    return " ".join(query.split())
+
+
+def pattern(query):
+    words = [re.escape(word) for word in query.split()]
+    return re.compile(r"(?<!\w)" + r"\s+".join(words) + r"(?!\w)", re.IGNORECASE)
+
+
+def cotexts(query, author=None, reference=None, date_from=None, date_to=None):
+    """The cotexts that contain ``query``, in id order."""
+    queryset = Cotext.objects.filter(text__icontains=query)
+    if author:
+        queryset = queryset.filter(reference__authors__slug=author)
+    if reference:
+        queryset = queryset.filter(reference=reference)
+    if date_from:
+        queryset = queryset.filter(text_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(text_date__lte=date_to)
+    return queryset.order_by("pk")
+
+
+def lines(cotext, compiled, window):
+    source = {
+        "cotext": cotext.pk,
+        "reference_id": cotext.reference_id,
+        "reference": str(cotext.reference) if cotext.reference else "",
+        "loc_in_ref": cotext.loc_in_ref or "",
+        "date": cotext.template_date_str_local if cotext.text_date else "",
+        "entries": [
+            {"slug": entry.slug, "name": str(entry)} for entry in cotext.entries.all()
+        ],
+    }
+    text = cotext.text
+    return [
+        {
+            "left": text[max(0, match.start() - window) : match.start()],
+            "keyword": match.group(),
+            "right": text[match.end() : match.end() + window],
+            **source,
+        }
+        for match in compiled.finditer(text)
+    ]
+
+
+def page(query, window=DEFAULT_WINDOW, after=0, limit=PAGE_SIZE, **filters):
+    """
+    The lines of the first ``limit`` cotexts after the ``after`` cursor
+    that contain ``query``, the cursor of the next page and whether there's
+    one.
+    """
+    query = normalize(query)
+    compiled = pattern(query)
+    candidates = cotexts(query, **filters).select_related("reference")
+    found, has_more, cursor = [], False, after
+    while not has_more:
+        batch = list(candidates.filter(pk__gt=cursor)[: limit + 1])
+        for cotext in batch:
+            if compiled.search(cotext.text):
+                if len(found) == limit:
+                    has_more = True
+                    break
+                found.append(cotext)
+        if len(batch) <= limit:
+            break
+        cursor = batch[-1].pk
+    prefetch_related_objects(
+        found, Prefetch("entries", queryset=Entry.objects.only("pk", "cotext", "slug", "display_name"))
+    )
+    return (
+        [line for cotext in found for line in lines(cotext, compiled, window)],
+        found[-1].pk if found else after,
+        has_more,
+    )
@@ -0,0 +1,325 @@
+"""
+Synthetic vocabulary for load and scaling tests.
+
+``generate()`` fills an empty database with a corpus shaped like the real
+one: terms whose numbers of homonyms follow a Zipf law, references with one
+to three authors, cotexts dated at every granularity, several definitions
+and specific characteristics per entry and symmetric relations between
+entries. The same options and seed always give the same corpus.
+
+Everything goes through ``bulk_create``, so ``save()`` and the signals
+don't run: the fields they would fill (slugs, homonym numbers, display
+columns, synonym clusters, the HTML of the Markdown fields) are computed
+here, the entry documents are built at the end (unless ``build_documents``
+is false, leaving them to ``build_entry_documents``), and the corpus leaves
+no trace in the change log.
+"""
+
+import datetime
+import random
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.text import slugify
+
+from voc import documents
+from voc.graph import SYNONYM, compute_clusters
+from voc.models import (
+    Author,
+    Cotext,
+    Definition,
+    Entry,
+    EntryRelations,
+    GeneralChar,
+    GrammClass,
+    Reference,
+    SpecificChar,
+    Term,
+    TradRelation,
+    TradTerm,
+    format_authors,
+    homonym_suffix,
+)
+from voc.rich_text import render_field
+
+
+SYLLABLES = [
+    "ba", "be", "bi", "bo", "bu", "ca", "ce", "ci", "co", "cu", "da", "de",
+    "di", "do", "du", "fa", "fe", "fi", "fo", "fu", "ga", "go", "la", "le",
+    "li", "lo", "lu", "ma", "me", "mi", "mo", "mu", "na", "ne", "ni", "no",
+    "pa", "pe", "pi", "po", "ra", "re", "ri", "ro", "sa", "se", "si", "so",
+    "ta", "te", "ti", "to", "va", "ve", "vi", "vo", "xa", "za", "ze", "zo",
+]
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "Cecília", "Clarice", "Graciliano", "Hilda", "João",
+    "Jorge", "Lygia", "Manuel", "Maria", "Mário", "Orides", "Paulo", "Rachel",
+]
+
+SOURCE_TYPES = ["BOOK", "ARTICLE", "CHAPTER", "THESIS", "ONLINE", "OTHER"]
+
+RELATION_TYPES = [SYNONYM, "NEAR-SYNONYM", "ANTONYM"]
+RELATION_WEIGHTS = [40, 35, 25]
+
+MAX_HOMONYMS = 20
+# Exponent of the Zipf law of the number of entries per term: most terms
+# have a single entry, a few have many homonyms.
+ZIPF_EXPONENT = 2.5
+
+# Relations link entries at most this many positions apart, which gives
+# the relation graph a local structure instead of a random one.
+RELATION_SPAN = 1000
+
+# Sizes of the other tables, relative to the number of entries or fixed.
+ENTRIES_PER_AUTHOR = 50
+ENTRIES_PER_REFERENCE = 10
+DEFINITIONS_PER_ENTRY = 0.8
+SPECIFIC_CHARS = 500
+TRAD_TERMS = 60
+GENERAL_CHARS = 20
+TRAD_RELATIONS = 8
+GRAMM_CLASSES = 12
+LEXICON_SIZE = 20000
+
+
+def word(n):
+    """A made-up word, different for every ``n``."""
+    syllables = []
+    n += len(SYLLABLES)  # At least two syllables.
+    while n:
+        n, index = divmod(n, len(SYLLABLES))
+        syllables.append(SYLLABLES[index])
+    return "".join(reversed(syllables))
+
+
+def sentence(rng, lexicon, n):
+    return " ".join(rng.choices(lexicon, k=n)).capitalize()
+
+
+def homonym_counts(rng, entries):
+    """Number of entries of each term, Zipf-distributed, adding up to ``entries``."""
+    counts = range(1, MAX_HOMONYMS + 1)
+    weights = [1 / count**ZIPF_EXPONENT for count in counts]
+    result, total = [], 0
+    while total < entries:
+        count = min(rng.choices(counts, weights)[0], entries - total)
+        result.append(count)
+        total += count
+    return result
+
+
+def plan_relations(rng, entries):
+    """
+    ``(entry, related_entry, type)`` positions of the relations, each pair
+    once, with ``entry < related_entry``: an entry's relations point to
+    distinct offsets, so no pair comes up twice.
+    """
+    relations = []
+    for i in range(entries - 1):
+        n = rng.choices([0, 1, 2], [50, 35, 15])[0]
+        span = min(RELATION_SPAN, entries - 1 - i)
+        for offset in rng.sample(range(1, span + 1), min(n, span)):
+            relations.append(
+                (i, i + offset, rng.choices(RELATION_TYPES, RELATION_WEIGHTS)[0])
+            )
+    return relations
+
+
+def random_date(rng, granularity):
+    if granularity == 0:
+        return None
+    year = rng.randint(1850, 2024)
+    month = rng.randint(1, 12) if granularity >= 2 else 1
+    day = rng.randint(1, 28) if granularity == 3 else 1
+    return datetime.date(year, month, day)
+
+
+def bulk_create(model, objects, batch_size):
+    return model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+def generate(entries, seed=0, batch_size=5000, log=print, build_documents=True):
+    """Create a synthetic corpus of ``entries`` entries, ``log``-ging progress."""
+    rng = random.Random(seed)
+    # Words of the texts; the terms are words of their own.
+    words = [word(n) for n in range(LEXICON_SIZE)]
+
+    with transaction.atomic():
+        gramm_classes = bulk_create(
+            GrammClass,
+            [GrammClass(text=f"classe {word(n)}") for n in range(GRAMM_CLASSES)],
+            batch_size,
+        )
+        general_chars = bulk_create(
+            GeneralChar,
+            [GeneralChar(text=sentence(rng, words, 2)) for _ in range(GENERAL_CHARS)],
+            batch_size,
+        )
+        trad_relations = bulk_create(
+            TradRelation,
+            [TradRelation(text=f"relação {word(n)}") for n in range(TRAD_RELATIONS)],
+            batch_size,
+        )
+        trad_terms = [
+            TradTerm(
+                text=f"categoria {word(n)}",
+                definition=sentence(rng, words, 8),
+                slug=slugify(f"categoria {word(n)}"),
+            )
+            for n in range(TRAD_TERMS)
+        ]
+        for trad_term in trad_terms:
+            trad_term.definition_html = render_field(TradTerm, "definition", trad_term.definition)
+        trad_terms = bulk_create(TradTerm, trad_terms, batch_size)
+        specific_chars = bulk_create(
+            SpecificChar,
+            [SpecificChar(text=sentence(rng, words, 3)) for _ in range(SPECIFIC_CHARS)],
+            batch_size,
+        )
+        definitions = bulk_create(
+            Definition,
+            [
+                Definition(text=sentence(rng, words, rng.randint(5, 20)))
+                for _ in range(max(int(entries * DEFINITIONS_PER_ENTRY), 1))
+            ],
+            batch_size,
+        )
+        log(f"{len(definitions)} definitions and the lookup tables.")
+
+        authors = []
+        for n in range(max(entries // ENTRIES_PER_AUTHOR, 1)):
+            author = Author(first_name=rng.choice(FIRST_NAMES), last_name=word(n).capitalize())
+            author.slug = slugify(str(author))
+            authors.append(author)
+        authors = bulk_create(Author, authors, batch_size)
+
+        references = bulk_create(
+            Reference,
+            [
+                Reference(
+                    title=sentence(rng, words, rng.randint(1, 6)),
+                    year=rng.randint(1850, 2024),
+                    source_type=rng.choice(SOURCE_TYPES),
+                )
+                for _ in range(max(entries // ENTRIES_PER_REFERENCE, 1))
+            ],
+            batch_size,
+        )
+        reference_authors = []
+        for reference in references:
+            count = min(rng.choices([1, 2, 3], [60, 30, 10])[0], len(authors))
+            chosen = rng.sample(authors, count)
+            reference_authors += [
+                Reference.authors.through(reference_id=reference.pk, author_id=author.pk)
+                for author in chosen
+            ]
+            chosen.sort(key=lambda author: (author.first_name, author.pk))
+            reference.authors_display = format_authors([str(a) for a in chosen])
+        bulk_create(Reference.authors.through, reference_authors, batch_size)
+        Reference.objects.bulk_update(references, ["authors_display"], batch_size=batch_size)
+        log(f"{len(authors)} authors, {len(references)} references.")
+
+    counts = homonym_counts(rng, entries)
+    terms = []
+    for n, count in enumerate(counts):
+        text = word(LEXICON_SIZE + n)
+        terms.append((Term(text=text, phonetic_transcription=f"/{text}/"), count))
+    bulk_create(Term, [term for term, count in terms], batch_size)
+    log(f"{len(terms)} terms.")
+
+    # Entries get their ids here, so the relations and synonym clusters
+    # (the smallest id of each group of synonyms) are known beforehand.
+    first_id = (Entry.objects.aggregate(Max("pk"))["pk__max"] or 0) + 1
+    relations = plan_relations(rng, entries)
+    clusters = compute_clusters(
+        (first_id + a, first_id + b) for a, b, type in relations if type == SYNONYM
+    )
+
+    homonyms = (
+        (term, number, count) for term, count in terms for number in range(1, count + 1)
+    )
+    for start in range(0, entries, batch_size):
+        batch = [next(homonyms) for _ in range(min(batch_size, entries - start))]
+        with transaction.atomic():
+            cotexts = []
+            for term, number, count in batch:
+                granularity = rng.randrange(4)
+                cotexts.append(
+                    Cotext(
+                        text=f'"{sentence(rng, words, 6)} {term.text} {sentence(rng, words, 6).lower()}"',
+                        text_date=random_date(rng, granularity),
+                        date_granularity=granularity,
+                        reference=rng.choice(references),
+                        loc_in_ref=f"p. {rng.randint(1, 400)}",
+                    )
+                )
+            bulk_create(Cotext, cotexts, batch_size)
+
+            new_entries = []
+            for n, ((term, number, count), cotext) in enumerate(zip(batch, cotexts)):
+                pk = first_id + start + n
+                slug = slugify(term.text)
+                new_entries.append(
+                    Entry(
+                        pk=pk,
+                        term=term,
+                        homonym_number=number,
+                        homonym_count=count,
+                        display_name=f"{term.text}{homonym_suffix(number, count)}",
+                        slug=slug if number == 1 else f"{slug}-{number}",
+                        cotext=cotext,
+                        concept_anl=sentence(rng, words, rng.randint(10, 40)),
+                        general_char=rng.choice(general_chars),
+                        trad_term=rng.choice(trad_terms),
+                        trad_relation=rng.choice(trad_relations),
+                        term_gramm_class=rng.choice(gramm_classes),
+                        note=sentence(rng, words, 8) if rng.random() < 0.1 else None,
+                        synonym_cluster=clusters.get(pk),
+                    )
+                )
+            for entry in new_entries:
+                entry.note_html = render_field(Entry, "note", entry.note)
+            bulk_create(Entry, new_entries, batch_size)
+
+            bulk_create(
+                Entry.term_def.through,
+                [
+                    Entry.term_def.through(entry_id=entry.pk, definition_id=definition.pk)
+                    for entry in new_entries
+                    for definition in rng.sample(definitions, min(rng.randint(1, 3), len(definitions)))
+                ],
+                batch_size,
+            )
+            bulk_create(
+                Entry.specific_char.through,
+                [
+                    Entry.specific_char.through(entry_id=entry.pk, specificchar_id=char.pk)
+                    for entry in new_entries
+                    for char in rng.sample(specific_chars, rng.randint(0, 3))
+                ],
+                batch_size,
+            )
+        log(f"{start + len(batch)}/{entries} entries.")
+
+    # Move the id sequence past the ids given above, as loaddata does.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Entry]):
+            cursor.execute(sql)
+
+    for start in range(0, len(relations), batch_size):
+        rows = []
+        for a, b, type in relations[start : start + batch_size]:
+            # Both directions, as EntryRelations.save() would.
+            rows.append(
+                EntryRelations(entry_id=first_id + a, related_entry_id=first_id + b, type=type)
+            )
+            rows.append(
+                EntryRelations(entry_id=first_id + b, related_entry_id=first_id + a, type=type)
+            )
+        bulk_create(EntryRelations, rows, batch_size)
+    log(f"{len(relations) * 2} relations.")
+
+    if build_documents:
+        built = documents.build(range(first_id, first_id + entries))
+        log(f"{built} entry documents.")
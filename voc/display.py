@@ -0,0 +1,186 @@
+"""
+Denormalized display columns.
+
+``Reference.authors_display``, ``Entry.display_name`` and
+``Entry.homonym_count`` hold what the labels of references and entries are
+made of, so rendering one needs no query. The handlers below keep them up
+to date when authors, references, terms and entries change.
+
+Bulk operations (``QuerySet.update()``, ``bulk_create()``...) don't send
+signals; ``check()`` (the ``verify_display_columns`` command) finds and
+fixes the columns they left stale.
+"""
+
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from voc import jobs
+from voc.models import Author, Entry, Reference, Term, renumber_homonyms
+
+
+def refresh_references(reference_ids, instance=None):
+    """
+    Recompute ``authors_display`` of the given references, and of
+    ``instance`` (one of them) in memory.
+    """
+    references = Reference.objects.filter(pk__in=reference_ids).prefetch_related(
+        "authors"
+    )
+    stale = []
+    for reference in references:
+        authors_display = reference.compute_authors_display()
+        if reference.authors_display != authors_display:
+            reference.authors_display = authors_display
+            stale.append(reference)
+        if instance is not None and reference.pk == instance.pk:
+            instance.authors_display = authors_display
+    Reference.objects.bulk_update(stale, ["authors_display"])
+
+
+def refresh_term_entries(term_id, instance=None):
+    """
+    Recompute ``homonym_count`` and ``display_name`` of the entries of a
+    term, and of ``instance`` (one of them) in memory.
+    """
+    entries = list(Entry.objects.filter(term_id=term_id).select_related("term"))
+    stale = []
+    for entry in entries:
+        before = (entry.homonym_count, entry.display_name)
+        entry.homonym_count = len(entries)
+        entry.display_name = entry.compute_display_name()
+        if (entry.homonym_count, entry.display_name) != before:
+            stale.append(entry)
+        if instance is not None and entry.pk == instance.pk:
+            instance.homonym_count = entry.homonym_count
+            instance.display_name = entry.display_name
+    Entry.objects.bulk_update(stale, ["homonym_count", "display_name"])
+
+
+def authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # The author's references are gone once cleared.
+        instance._display_reference_ids = set(
+            instance.references.values_list("pk", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        refresh_references(
+            (pk_set or set()) | getattr(instance, "_display_reference_ids", set())
+        )
+    else:
+        refresh_references([instance.pk])
+
+
+def reference_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # An instance loaded before its authors changed saves a stale label.
+    refresh_references([instance.pk], instance)
+
+
+def author_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_references(instance.references.values_list("pk", flat=True))
+
+
+def author_deleting(sender, instance, **kwargs):
+    instance._display_reference_ids = set(
+        instance.references.values_list("pk", flat=True)
+    )
+
+
+def author_deleted(sender, instance, **kwargs):
+    refresh_references(getattr(instance, "_display_reference_ids", set()))
+
+
+def term_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    refresh_term_entries(instance.pk)
+
+
+def entry_saving(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    # Entries moved to another term leave a homonym behind.
+    instance._display_previous_term_id = (
+        Entry.objects.filter(pk=instance.pk).values_list("term_id", flat=True).first()
+    )
+
+
+def entry_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_term_entries(instance.term_id, instance)
+    previous_term_id = getattr(instance, "_display_previous_term_id", None)
+    if previous_term_id not in (None, instance.term_id):
+        refresh_term_entries(previous_term_id)
+
+
+def entry_deleted(sender, instance, **kwargs):
+    refresh_term_entries(instance.term_id)
+    # The remaining homonyms are renumbered in the background (voc.jobs).
+    jobs.enqueue("homonyms", [instance.term_id])
+
+
+def check(fix=False, chunk_size=2000):
+    """
+    Compare the display columns with what they should hold and return the
+    ``(model, pk, field, stored, expected)`` differences, fixing them if
+    ``fix``.
+    """
+    differences = []
+
+    stale = []
+    references = Reference.objects.prefetch_related("authors").order_by("pk")
+    for reference in references.iterator(chunk_size=chunk_size):
+        expected = reference.compute_authors_display()
+        if reference.authors_display != expected:
+            differences.append(
+                (Reference, reference.pk, "authors_display", reference.authors_display, expected)
+            )
+            reference.authors_display = expected
+            stale.append(reference)
+    if fix:
+        Reference.objects.bulk_update(stale, ["authors_display"], batch_size=chunk_size)
+
+    counts = dict(
+        Entry.objects.order_by().values_list("term").annotate(count=Count("pk"))
+    )
+    stale = []
+    entries = Entry.objects.select_related("term").order_by("pk")
+    for entry in entries.iterator(chunk_size=chunk_size):
+        before = {"homonym_count": entry.homonym_count, "display_name": entry.display_name}
+        entry.homonym_count = counts[entry.term_id]
+        entry.display_name = entry.compute_display_name()
+        changed = False
+        for field, stored in before.items():
+            expected = getattr(entry, field)
+            if stored != expected:
+                differences.append((Entry, entry.pk, field, stored, expected))
+                changed = True
+        if changed:
+            stale.append(entry)
+    if fix:
+        Entry.objects.bulk_update(
+            stale, ["homonym_count", "display_name"], batch_size=chunk_size
+        )
+
+    return differences
+
+
+def connect():
+    jobs.register("homonyms", renumber_homonyms)
+    uid = "voc.display"
+    m2m_changed.connect(authors_changed, sender=Reference.authors.through, dispatch_uid=uid)
+    post_save.connect(reference_saved, sender=Reference, dispatch_uid=uid)
+    post_save.connect(author_saved, sender=Author, dispatch_uid=uid)
+    pre_delete.connect(author_deleting, sender=Author, dispatch_uid=uid)
+    post_delete.connect(author_deleted, sender=Author, dispatch_uid=uid)
+    post_save.connect(term_saved, sender=Term, dispatch_uid=uid)
+    pre_save.connect(entry_saving, sender=Entry, dispatch_uid=uid)
+    post_save.connect(entry_saved, sender=Entry, dispatch_uid=uid)
+    post_delete.connect(entry_deleted, sender=Entry, dispatch_uid=uid)
@@ -0,0 +1,237 @@
+"""
+Precomputed entry documents.
+
+An ``EntryDocument`` holds everything ``entry_detail.html`` shows for an
+entry in one language: the entry, its term, grammatical class, category,
+cotext, reference, authors, definitions and related entries. The detail page
+reads it with a single lookup by slug instead of joining a dozen tables.
+
+Documents are rebuilt after the transaction that changed one of their rows
+commits, by a background job (``voc.jobs``). Every ``Change`` recorded by
+``voc.changes`` lists the entries it affects; their ids, plus those of the
+entries that show them as related, are rebuilt together, in chunks, so an
+edit to a reference shared by many entries rebuilds each document once.
+
+Bulk operations don't record changes: ``build_entry_documents`` rebuilds
+the documents they left stale.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.db.models.signals import post_delete, post_save
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
+
+from voc import jobs
+from voc.models import Change, Entry, EntryDocument, EntryRelations
+
+
+# Bump when the content of the documents changes, so build_entry_documents
+# rebuilds the ones in the old format.
+VERSION = 2
+
+CHUNK_SIZE = 500
+
+# Order of the related entries on the page, and their labels.
+RELATED_TYPES = [
+    ("ANTONYM", _("antonym")),
+    ("HOMONYM", _("homonym")),
+    ("SYNONYM", _("synonym")),
+    ("NEAR-SYNONYM", _("near-synonym")),
+]
+
+
+def languages():
+    return [code for code, name in settings.LANGUAGES]
+
+
+def author_data(entry):
+    reference = entry.cotext.reference if entry.cotext else None
+    if reference is None:
+        return {"name": "", "slugs": []}
+    return {"name": str(reference.formatted_authors()), "slugs": entry.authors_slugs()}
+
+
+def document_data(entry, related):
+    """
+    The document of ``entry`` in the active language. ``related`` maps each
+    relation type (and "HOMONYM") to the related entries, fetched with their
+    citation data.
+    """
+    cotext = entry.cotext
+    reference = cotext.reference if cotext else None
+    return {
+        "pk": entry.pk,
+        "slug": entry.slug,
+        "name": str(entry),
+        "author": author_data(entry),
+        "date": cotext.template_date_str_local if cotext else "",
+        "has_date": bool(cotext and cotext.text_date),
+        "gramm_class": str(entry.term_gramm_class or ""),
+        "phonetic_transcription": entry.term.phonetic_transcription or "",
+        "category": {
+            "name": str(entry.trad_term or ""),
+            "slug": entry.trad_term.slug if entry.trad_term else "",
+        },
+        "definitions": [str(definition) for definition in entry.definitions()],
+        "cotext": cotext.text if cotext else "",
+        "citation_html": reference.citation_html if reference else "",
+        "loc_in_ref": (cotext.loc_in_ref or "") if cotext else "",
+        "note_html": entry.note_html,
+        "related_entries": [
+            {
+                "type": str(label),
+                "author": author_data(related_entry),
+                "entry": {
+                    "pk": related_entry.pk,
+                    "slug": related_entry.slug,
+                    "name": str(related_entry),
+                },
+            }
+            for type, label in RELATED_TYPES
+            for related_entry in related.get(type, [])
+        ],
+    }
+
+
+def build(entry_ids, chunk_size=CHUNK_SIZE):
+    """
+    Rebuild the documents of the given entries in every language, a chunk
+    at a time, and return how many entries were built. Ids of entries that
+    no longer exist are skipped.
+    """
+    entry_ids = sorted(set(entry_ids))
+    built = 0
+    for start in range(0, len(entry_ids), chunk_size):
+        built += build_chunk(entry_ids[start : start + chunk_size])
+    return built
+
+
+def build_chunk(entry_ids):
+    related_queryset = Entry.objects.all().with_citation_data().select_related("term")
+    entries = list(
+        Entry.objects.filter(pk__in=entry_ids)
+        .with_citation_data()
+        .select_related("term", "trad_term", "term_gramm_class")
+        .prefetch_related(
+            "term_def",
+            Prefetch(
+                "relations_as_source",
+                queryset=EntryRelations.objects.prefetch_related(
+                    Prefetch("related_entry", queryset=related_queryset)
+                ),
+            ),
+        )
+    )
+    homonyms = {}
+    for homonym in related_queryset.filter(
+        term__in={entry.term_id for entry in entries}
+    ).order_by("homonym_number"):
+        homonyms.setdefault(homonym.term_id, []).append(homonym)
+
+    documents = []
+    for entry in entries:
+        related = {
+            "HOMONYM": [h for h in homonyms.get(entry.term_id, []) if h.pk != entry.pk]
+        }
+        for relation in entry.relations_as_source.all():
+            related.setdefault(relation.type, []).append(relation.related_entry)
+        for language in languages():
+            with translation.override(language):
+                data = document_data(entry, related)
+            documents.append(
+                EntryDocument(
+                    entry=entry, language=language, slug=entry.slug, version=VERSION, data=data
+                )
+            )
+
+    with transaction.atomic():
+        EntryDocument.objects.filter(entry__in=entry_ids).delete()
+        # A document left behind by an entry whose slug changed.
+        EntryDocument.objects.filter(slug__in=[entry.slug for entry in entries]).delete()
+        EntryDocument.objects.bulk_create(documents)
+    return len(entries)
+
+
+def get(slug, language):
+    """
+    The document of the entry ``slug`` in ``language``, built on the spot if
+    it's missing; None if there's no such entry.
+    """
+    data = (
+        EntryDocument.objects.filter(slug=slug, language=language)
+        .values_list("data", flat=True)
+        .first()
+    )
+    if data is not None:
+        return data
+    entry_id = Entry.objects.filter(slug=slug).values_list("pk", flat=True).first()
+    if entry_id is None or language not in languages():
+        return None
+    build([entry_id])
+    return EntryDocument.objects.get(slug=slug, language=language).data
+
+
+def with_dependents(entry_ids):
+    """
+    ``entry_ids`` and the entries whose documents show one of them: their
+    homonyms and the entries related to them.
+    """
+    entry_ids = set(entry_ids)
+    if not entry_ids:
+        return entry_ids
+    terms = Entry.objects.filter(pk__in=entry_ids).values("term")
+    return (
+        entry_ids
+        | set(Entry.objects.filter(term__in=terms).values_list("pk", flat=True))
+        | set(
+            EntryRelations.objects.filter(related_entry__in=entry_ids).values_list(
+                "entry", flat=True
+            )
+        )
+    )
+
+
+def rebuild(entry_ids):
+    """Rebuild the documents of ``entry_ids`` and of the entries showing them."""
+    build(with_dependents(int(pk) for pk in entry_ids))
+
+
+def schedule(entry_ids):
+    """Rebuild the documents of ``entry_ids`` once the current transaction commits."""
+    jobs.enqueue("documents", entry_ids)
+
+
+def change_recorded(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    schedule(instance.entry_ids)
+
+
+def entry_deleted(sender, instance, **kwargs):
+    # The homonyms of a deleted entry no longer show it, and its id no
+    # longer leads to them.
+    schedule(
+        set(Entry.objects.filter(term=instance.term_id).values_list("pk", flat=True))
+    )
+
+
+def stale_entry_ids():
+    """Ids of the entries missing a document, or with one in an older format."""
+    complete = (
+        EntryDocument.objects.filter(version=VERSION, language__in=languages())
+        .values("entry")
+        .order_by()
+    )
+    complete = complete.annotate(count=Count("pk")).filter(count=len(languages()))
+    return set(
+        Entry.objects.exclude(pk__in=complete.values("entry")).values_list("pk", flat=True)
+    )
+
+
+def connect():
+    jobs.register("documents", rebuild)
+    uid = "voc.documents"
+    post_save.connect(change_recorded, sender=Change, dispatch_uid=uid)
+    post_delete.connect(entry_deleted, sender=Entry, dispatch_uid=uid)
@@ -0,0 +1,270 @@
+"""
+Relation graph of the entries.
+
+``EntryRelations`` rows form a symmetric graph between entries. This module
+answers neighborhood queries over it with a single recursive CTE and keeps
+``Entry.synonym_cluster`` up to date: the connected components of the
+synonym relations, identified by the smallest entry id they contain. New
+synonyms merge clusters on the spot; edits and removals, which may split
+one, recompute it in the background (``voc.jobs``).
+"""
+
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+
+from voc import jobs
+from voc.models import Entry, EntryRelations
+
+
+SYNONYM = "SYNONYM"
+RELATION_TYPES = [value for value, label in EntryRelations._meta.get_field("type").choices]
+
+# Bounds that keep neighborhood queries fast on large graphs: the recursive
+# CTE expands each entry once, at its distance from the start, and keeps at
+# most MAX_NODES entries per hop, so its cost grows with the entries within
+# MAX_DEPTH hops, and never more than MAX_NODES entries are returned.
+MAX_DEPTH = 4
+MAX_NODES = 500
+
+# One row per hop: the entries first reached at that distance (frontier),
+# sorted and bounded, and those reached before it (seen). The next frontier
+# is the neighbors of the current one that are in neither. PostgreSQL keeps
+# the entries in arrays, other databases (SQLite) in JSON arrays.
+NEIGHBORHOOD_SQL = {
+    "postgresql": """
+        WITH RECURSIVE hood (depth, frontier, seen) AS (
+            SELECT 0, ARRAY[%s]::bigint[], ARRAY[]::bigint[]
+            UNION ALL
+            SELECT
+                h.depth + 1,
+                ARRAY(
+                    SELECT DISTINCT r.related_entry_id
+                    FROM {relations} r
+                    WHERE r.entry_id = ANY(h.frontier)
+                        AND r.type IN ({types})
+                        AND r.related_entry_id <> ALL(h.frontier)
+                        AND r.related_entry_id <> ALL(h.seen)
+                    ORDER BY r.related_entry_id
+                    LIMIT %s
+                ),
+                h.seen || h.frontier
+            FROM hood h
+            WHERE h.depth < %s
+                AND cardinality(h.frontier) > 0
+                AND cardinality(h.seen) + cardinality(h.frontier) < %s
+        )
+        SELECT entry_id, h.depth
+        FROM hood h, unnest(h.frontier) AS entry_id
+        ORDER BY h.depth, entry_id
+        LIMIT %s
+    """,
+    None: """
+        WITH RECURSIVE hood (depth, frontier, seen) AS (
+            SELECT 0, json_array(%s), json_array()
+            UNION ALL
+            SELECT
+                h.depth + 1,
+                (
+                    SELECT json_group_array(related_entry_id) FROM (
+                        SELECT DISTINCT r.related_entry_id
+                        FROM {relations} r
+                        WHERE r.entry_id IN (SELECT value FROM json_each(h.frontier))
+                            AND r.type IN ({types})
+                            AND r.related_entry_id NOT IN (
+                                SELECT value FROM json_each(h.frontier)
+                                UNION ALL
+                                SELECT value FROM json_each(h.seen)
+                            )
+                        ORDER BY r.related_entry_id
+                        LIMIT %s
+                    )
+                ),
+                (
+                    SELECT json_group_array(value) FROM (
+                        SELECT value FROM json_each(h.seen)
+                        UNION ALL
+                        SELECT value FROM json_each(h.frontier)
+                    )
+                )
+            FROM hood h
+            WHERE h.depth < %s
+                AND json_array_length(h.frontier) > 0
+                AND json_array_length(h.seen) + json_array_length(h.frontier) < %s
+        )
+        SELECT entry.value, h.depth
+        FROM hood h, json_each(h.frontier) entry
+        ORDER BY h.depth, entry.value
+        LIMIT %s
+    """,
+}
+
+
+def neighborhood(entry_id, depth=1, types=None, limit=MAX_NODES):
+    """
+    Return ``{entry_id: distance}`` for all entries within ``depth`` hops of
+    the given entry, following only relations of the given ``types``.
+    Entries are ordered by distance and at most ``limit`` are returned.
+    """
+    depth = max(0, min(depth, MAX_DEPTH))
+    types = types or RELATION_TYPES
+    sql = NEIGHBORHOOD_SQL.get(connection.vendor, NEIGHBORHOOD_SQL[None]).format(
+        relations=EntryRelations._meta.db_table,
+        types=", ".join(["%s"] * len(types)),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [entry_id, *types, limit, depth, limit, limit])
+        return dict(cursor.fetchall())
+
+
+def edges_between(entry_ids, types=None):
+    """Return the relations among the given entries, once per symmetric pair."""
+    types = types or RELATION_TYPES
+    return list(
+        EntryRelations.objects.filter(
+            entry__in=entry_ids,
+            related_entry__in=entry_ids,
+            entry__lt=F("related_entry"),
+            type__in=types,
+        ).values_list("entry_id", "related_entry_id", "type")
+    )
+
+
+def nodes(entry_ids):
+    """Return the display data of the given entries, with a constant number of queries."""
+    entries = Entry.objects.filter(pk__in=entry_ids)
+    data = {}
+    for entry in entries:
+        data[entry.pk] = {
+            "id": entry.pk,
+            "slug": entry.slug,
+            "label": str(entry),
+            "url": entry.get_absolute_url(),
+            "cluster": entry.synonym_cluster,
+        }
+    return data
+
+
+def graph_json(entry_ids, distances=None, types=None):
+    """Return the nodes and edges of the subgraph of the given entries."""
+    node_data = nodes(entry_ids)
+    if distances:
+        for entry_id, node in node_data.items():
+            node["distance"] = distances[entry_id]
+    return {
+        "nodes": sorted(node_data.values(), key=lambda node: node["id"]),
+        "edges": [
+            {"source": source, "target": target, "type": type}
+            for source, target, type in edges_between(list(node_data), types)
+        ],
+    }
+
+
+# Synonym clusters
+
+
+def compute_clusters(edges):
+    """
+    Union-find over ``(entry_id, related_entry_id)`` pairs. Return a mapping
+    from each entry in the edges to the smallest entry id of its component.
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in edges:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return {x: find(x) for x in parent}
+
+
+def synonym_edges(**filters):
+    return EntryRelations.objects.filter(type=SYNONYM, **filters).values_list(
+        "entry_id", "related_entry_id"
+    )
+
+
+def apply_clusters(clusters, entry_ids):
+    """Store ``clusters`` for ``entry_ids``, entries missing from it get no cluster."""
+    by_cluster = {}
+    for entry_id in entry_ids:
+        by_cluster.setdefault(clusters.get(entry_id), []).append(entry_id)
+    for cluster, ids in by_cluster.items():
+        Entry.objects.filter(pk__in=ids).exclude(
+            synonym_cluster=cluster
+        ).update(synonym_cluster=cluster)
+
+
+def rebuild_synonym_clusters():
+    """Recompute every synonym cluster from scratch."""
+    clusters = compute_clusters(synonym_edges().iterator(chunk_size=10000))
+    stale = Entry.objects.filter(
+        Q(synonym_cluster__isnull=False) | Q(pk__in=list(clusters))
+    ).values_list("pk", flat=True)
+    apply_clusters(clusters, list(stale))
+    return clusters
+
+
+def merge_clusters(entry_id, related_entry_id):
+    """Join the clusters of two entries that just became synonyms."""
+    entries = Entry.objects.filter(pk__in=[entry_id, related_entry_id])
+    roots = {
+        cluster or pk for pk, cluster in entries.values_list("pk", "synonym_cluster")
+    }
+    if not roots:
+        return
+    Entry.objects.filter(
+        Q(pk__in=[entry_id, related_entry_id]) | Q(synonym_cluster__in=roots)
+    ).update(synonym_cluster=min(roots))
+
+
+def split_cluster(*entry_ids):
+    """Recompute the cluster(s) the given entries belonged to, after a removal."""
+    roots = set(
+        Entry.objects.filter(pk__in=entry_ids)
+        .exclude(synonym_cluster__isnull=True)
+        .values_list("synonym_cluster", flat=True)
+    )
+    members = set(
+        Entry.objects.filter(
+            Q(pk__in=entry_ids) | Q(synonym_cluster__in=roots)
+        ).values_list("pk", flat=True)
+    )
+    clusters = compute_clusters(synonym_edges(entry__in=members))
+    apply_clusters(clusters, members)
+
+
+def split_clusters(entry_ids):
+    split_cluster(*(int(pk) for pk in entry_ids))
+
+
+def synonyms_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        # The relation may have been edited into or out of a synonymy. The
+        # clusters are recomputed in the background (voc.jobs).
+        jobs.enqueue("synonym-clusters", [instance.entry_id, instance.related_entry_id])
+    elif instance.type == SYNONYM:
+        merge_clusters(instance.entry_id, instance.related_entry_id)
+
+
+def synonyms_deleted(sender, instance, **kwargs):
+    if instance.type != SYNONYM:
+        return
+    jobs.enqueue("synonym-clusters", [instance.entry_id, instance.related_entry_id])
+
+
+def connect():
+    jobs.register("synonym-clusters", split_clusters)
+    post_save.connect(synonyms_saved, sender=EntryRelations, dispatch_uid="voc.graph")
+    post_delete.connect(synonyms_deleted, sender=EntryRelations, dispatch_uid="voc.graph")
@@ -0,0 +1,106 @@
+"""
+Health snapshot of the database for ``api/status/``.
+
+Facts that can't change while the server runs (version, max connections)
+are read once per process. The number of open connections is refreshed at
+most every DYNAMIC_TTL seconds, under a hard QUERY_TIMEOUT, so uptime
+probes neither load the database nor hang when it is degraded. Requests
+run in event loops of their own under WSGI: one refreshes the facts while
+the others serve the previous ones.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, connection, transaction
+
+from voc import metrics
+
+
+DYNAMIC_TTL = 10
+QUERY_TIMEOUT = 1
+
+static_facts = {}
+dynamic_facts = {
+    "opened_connections": None,
+    "updated_at": None,
+    "error": None,
+}
+# time.monotonic() of the last refresh attempt, successful or not.
+last_check = None
+# Held by the request refreshing the facts.
+refreshing = threading.Lock()
+
+
+def read_database_facts(include_static):
+    """Query the database, giving up after QUERY_TIMEOUT seconds."""
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SET LOCAL statement_timeout = {int(QUERY_TIMEOUT * 1000)}"
+            )
+            facts = {}
+            if include_static:
+                cursor.execute("SHOW server_version;")
+                facts["version"] = cursor.fetchone()[0]
+                cursor.execute("SHOW max_connections;")
+                facts["max_connections"] = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT count(*)::int FROM pg_stat_activity WHERE datname = %s",
+                [os.getenv("POSTGRES_DB")],
+            )
+            facts["opened_connections"] = cursor.fetchone()[0]
+            return facts
+    finally:
+        # Runs in a worker thread of its own: give its connection back.
+        connection.close()
+
+
+async def refresh():
+    global last_check
+    last_check = time.monotonic()
+    read = sync_to_async(read_database_facts, thread_sensitive=False)
+    try:
+        facts = await asyncio.wait_for(read(not static_facts), QUERY_TIMEOUT)
+    except (asyncio.TimeoutError, DatabaseError) as error:
+        dynamic_facts["error"] = str(error) or "Timed out."
+        return
+    for key in ("version", "max_connections"):
+        if key in facts:
+            static_facts[key] = facts.pop(key)
+    dynamic_facts.update(
+        facts, updated_at=datetime.now().isoformat(), error=None
+    )
+
+
+def is_fresh():
+    return last_check is not None and time.monotonic() - last_check < DYNAMIC_TTL
+
+
+async def snapshot():
+    """
+    Return the database facts, refreshing them if they are too old and no
+    other request is already doing it.
+    """
+    fresh = is_fresh()
+    metrics.record_cache("status", hit=fresh)
+    if not fresh and refreshing.acquire(blocking=False):
+        try:
+            # Another request may have refreshed them since.
+            if not is_fresh():
+                await refresh()
+        finally:
+            refreshing.release()
+    return {**static_facts, **dynamic_facts}
+
+
+def pool_stats():
+    """Return the statistics of this process' connection pool, if it uses one."""
+    pool = getattr(connection, "pool", None)
+    if pool is None:
+        return None
+    return pool.get_stats()
@@ -0,0 +1,136 @@
+"""
+Per-request performance figures: database queries, view and template
+rendering time, and application cache hits and misses.
+
+``InstrumentationMiddleware`` creates a ``RequestStats`` for each request
+and makes it available to the rest of the code through ``current``, which
+threads started with ``sync_to_async`` inherit: the ones running queries
+on connections of their own count them with ``counting_queries()``. The
+templates are timed by the ``DjangoTemplates`` backend of ``TEMPLATES``,
+which ``render()``, ``render_to_string()`` and ``TemplateResponse`` all go
+through.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from voc.slow_queries import call_site
+
+
+current = contextvars.ContextVar("voc_request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_start = None
+        self.view_time = None
+        self.render_start = None
+        # Seconds spent rendering templates, nested renders counted once.
+        self.render_time = None
+        self.rendering = 0
+        # (sql, params, duration, call site, database) of the queries over
+        # the threshold.
+        self.slow_queries = []
+        self.slow_query_threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        # Queries can run in several threads at once (see voc.views.search).
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper()`` counting and timing the queries."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                self.query_time += duration
+                if duration > self.slow_query_threshold and not many:
+                    self.slow_queries.append(
+                        (sql, params, duration, call_site(), context["connection"].alias)
+                    )
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def view_started(self):
+        self.view_start = time.perf_counter()
+
+    def view_finished(self):
+        # Without the templates the view rendered itself.
+        if self.view_start is not None and self.view_time is None:
+            self.view_time = time.perf_counter() - self.view_start - (self.render_time or 0)
+
+    def render_started(self):
+        if not self.rendering:
+            self.render_start = time.perf_counter()
+        self.rendering += 1
+
+    def render_finished(self):
+        self.rendering -= 1
+        if not self.rendering:
+            self.render_time = (self.render_time or 0) + time.perf_counter() - self.render_start
+
+
+def record_cache(hit):
+    """Count a cache lookup for the current request, if any."""
+    stats = current.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+@contextmanager
+def counting_queries(stats=None):
+    """
+    Count the queries of the current thread's connections in ``stats``, by
+    default the current request's, if any.
+    """
+    stats = stats or current.get()
+    with ExitStack() as stack:
+        if stats is not None:
+            # Every database, counted once (test databases can mirror).
+            for wrapper in {id(c): c for c in connections.all()}.values():
+                stack.enter_context(wrapper.execute_wrapper(stats))
+        yield
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(context, request)
+        stats.render_started()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_finished()
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing the renders for the current request."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
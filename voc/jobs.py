@@ -0,0 +1,141 @@
+"""
+Background jobs.
+
+The work that follows an edit but isn't part of it (rebuilding entry
+documents, recomputing synonym clusters, renumbering homonyms) is queued
+with ``enqueue(task, keys)``, once the transaction commits, instead of
+being done in the editor's request. Each target (an entry, a term...) is a
+``Job`` row, and a target has at most one pending job per task, so editing
+an entry ten times before the worker gets to it rebuilds it once.
+
+The ``run_jobs`` command is the worker: its threads claim due jobs in
+batches (``SELECT ... FOR UPDATE SKIP LOCKED`` on PostgreSQL, so several
+workers share the queue), run each task once on all the keys claimed for
+it, and delete the jobs that succeed. A failed batch is retried after
+``JOB_RETRY_DELAY`` seconds, doubling each time, and is left ``FAILED``
+(visible in the admin) after ``JOB_MAX_ATTEMPTS``. Jobs left running for
+``JOB_TIMEOUT`` seconds by a worker that died are claimed again.
+
+Without ``BACKGROUND_JOBS`` (a deployment with no worker), tasks run right
+after the commit, in the thread that enqueued them, once per ``enqueue``
+call, as they always did.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from voc import metrics
+from voc.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Task name: function called with the list of keys to work on.
+TASKS = {}
+
+jobs_run = metrics.Counter(
+    "voc_jobs_total",
+    "Background jobs run, by task and result (done, retried, failed).",
+    ["task", "result"],
+)
+
+
+def register(task, function):
+    TASKS[task] = function
+
+
+def flush(task, keys):
+    """Queue (or run) ``task`` on ``keys``; called once the transaction commits."""
+    if settings.BACKGROUND_JOBS:
+        # Targets that already have a pending job are skipped.
+        Job.objects.bulk_create(
+            [Job(task=task, key=key) for key in keys], ignore_conflicts=True
+        )
+    else:
+        TASKS[task](keys)
+
+
+def enqueue(task, keys):
+    """
+    Run ``task`` on ``keys`` once the current transaction commits: in the
+    worker with ``BACKGROUND_JOBS``, else right away. The keys go with the
+    ``on_commit`` callback, so rolling back the savepoint they were enqueued
+    in drops them; the worker's queue holds one job per target however many
+    times it's enqueued.
+    """
+    keys = sorted({str(key) for key in keys})
+    if not keys:
+        return
+    # A failed task leaves stale derived data, not a failed request.
+    transaction.on_commit(partial(flush, task, keys), robust=True)
+
+
+def claim(batch_size):
+    """Mark up to ``batch_size`` due jobs as running and return them."""
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_after__lte=now) | Q(
+        status=Job.RUNNING, started_at__lt=now - timedelta(seconds=settings.JOB_TIMEOUT)
+    )
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True).filter(due).order_by("id")[
+                :batch_size
+            ]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=Job.RUNNING, started_at=now, attempts=F("attempts") + 1
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def retry(job, error):
+    """Put a failed job back in the queue, later, or give up on it."""
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        status, run_after, result = Job.FAILED, job.run_after, "failed"
+    else:
+        delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        status, run_after, result = Job.PENDING, timezone.now() + timedelta(seconds=delay), "retried"
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                status=status, run_after=run_after, last_error=error
+            )
+    except IntegrityError:
+        # The target was enqueued again meanwhile; that job covers it.
+        Job.objects.filter(pk=job.pk).delete()
+    jobs_run.inc(task=job.task, result=result)
+
+
+def run(jobs):
+    """Run the tasks of the claimed ``jobs``, one call per task."""
+    by_task = {}
+    for job in jobs:
+        by_task.setdefault(job.task, []).append(job)
+    for task, batch in by_task.items():
+        try:
+            TASKS[task]([job.key for job in batch])
+        except Exception:
+            logger.exception("The %s task failed on %d keys.", task, len(batch))
+            error = traceback.format_exc()
+            for job in batch:
+                retry(job, error)
+        else:
+            Job.objects.filter(pk__in=[job.pk for job in batch]).delete()
+            jobs_run.inc(len(batch), task=task, result="done")
+
+
+def work(batch_size):
+    """Claim and run one batch of due jobs; return how many there were."""
+    jobs = claim(batch_size)
+    if jobs:
+        run(jobs)
+    return len(jobs)
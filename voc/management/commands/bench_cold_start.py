@@ -0,0 +1,120 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voc.benchmarking import compare, load_results, save_results, summarize
+
+
+# Cold-start budget of the public lambda: median time from interpreter start
+# to the end of the first response, in milliseconds.
+COLD_START_BUDGET_MS = 1500
+
+# Run in a fresh interpreter: load the WSGI application and serve one request.
+CHILD_SCRIPT = """
+import importlib, io, json, sys, time
+start = time.perf_counter()
+application = importlib.import_module(sys.argv[1]).application
+loaded = time.perf_counter()
+from django.conf import settings
+environ = {
+    "REQUEST_METHOD": "GET",
+    "PATH_INFO": sys.argv[2],
+    "QUERY_STRING": "",
+    "SERVER_NAME": settings.ALLOWED_HOSTS[0],
+    "SERVER_PORT": "443",
+    "HTTP_HOST": settings.ALLOWED_HOSTS[0],
+    "wsgi.url_scheme": "https",
+    "wsgi.input": io.BytesIO(),
+    "wsgi.errors": sys.stderr,
+}
+status = []
+body = b"".join(application(environ, lambda s, h, *a: status.append(s)))
+served = time.perf_counter()
+print(json.dumps({
+    "status": status[0],
+    "load_ms": (loaded - start) * 1000,
+    "first_request_ms": (served - loaded) * 1000,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start of a WSGI application: fresh interpreter, "
+        "application load and first request, and check it against the budget."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="config.wsgi_public")
+        parser.add_argument(
+            "--path",
+            default="/about/",
+            help="Path of the first request. The default needs no database.",
+        )
+        parser.add_argument("--runs", type=int, default=10)
+        parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+        parser.add_argument("--output", help="Save the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="JSON results of a previous run to compare with."
+        )
+
+    def handle(self, *args, **options):
+        env = os.environ.copy()
+        # Let the WSGI module pick its own settings.
+        env.pop("DJANGO_SETTINGS_MODULE", None)
+
+        samples = {"total_ms": [], "load_ms": [], "first_request_ms": []}
+        for _ in range(options["runs"]):
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-c", CHILD_SCRIPT, options["module"], options["path"]],
+                capture_output=True,
+                text=True,
+                env=env,
+            )
+            total_ms = (time.perf_counter() - start) * 1000
+            if process.returncode != 0:
+                raise CommandError(process.stderr.strip().splitlines()[-1])
+            run = json.loads(process.stdout.strip().splitlines()[-1])
+            samples["total_ms"].append(total_ms)
+            samples["load_ms"].append(run["load_ms"])
+            samples["first_request_ms"].append(run["first_request_ms"])
+
+        results = {name: summarize(values) for name, values in samples.items()}
+        self.stdout.write(f"{options['module']} {options['path']} ({run['status']})")
+        for name, summary in results.items():
+            self.stdout.write(
+                f"  {name:<17} p50 {summary['p50']:8.1f}  p95 {summary['p95']:8.1f}"
+            )
+
+        if options["output"]:
+            save_results(
+                options["output"],
+                "cold_start",
+                results,
+                module=options["module"],
+                path=options["path"],
+                runs=options["runs"],
+            )
+        if options["compare"]:
+            baseline = load_results(options["compare"])["results"]
+            for name, before, after in compare(baseline, results):
+                self.stdout.write(
+                    self.style.WARNING(f"  regression: {name} {before:.1f} -> {after:.1f} ms")
+                )
+
+        median = results["total_ms"]["p50"]
+        if median > options["budget_ms"]:
+            raise CommandError(
+                f"Cold start of {median:.0f} ms is over the {options['budget_ms']:.0f} ms budget."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cold start of {median:.0f} ms is within the {options['budget_ms']:.0f} ms budget."
+            )
+        )
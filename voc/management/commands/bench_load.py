@@ -0,0 +1,340 @@
+import asyncio
+import io
+import logging
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from voc import metrics
+from voc.benchmarking import compare, load_results, save_results, summarize
+from voc.models import Author, Entry, TradTerm
+
+
+# Number of entries, authors and categories whose pages are requested.
+SAMPLE_SIZE = 50
+
+XHR = {"X-Requested-With": "XMLHttpRequest"}
+
+# Host of the requests, allowed whatever ALLOWED_HOSTS holds.
+HOST = "localhost"
+
+
+def sample(model, field, rng):
+    """Values of ``field`` of up to SAMPLE_SIZE rows spread over the table."""
+    last = model.objects.aggregate(Max("pk"))["pk__max"] or 0
+    pks = [rng.randint(1, last) for _ in range(SAMPLE_SIZE * 4)] if last else []
+    values = list(model.objects.filter(pk__in=pks).values_list(field, flat=True))
+    return values[:SAMPLE_SIZE] or list(
+        model.objects.values_list(field, flat=True)[:SAMPLE_SIZE]
+    )
+
+
+def endpoints(rng, session_cookie=None):
+    """``{name: (paths, headers)}`` of the pages to benchmark."""
+    entries = sample(Entry, "slug", rng)
+    authors = sample(Author, "slug", rng)
+    categories = sample(TradTerm, "slug", rng)
+    prefixes = sorted({slug[:3] for slug in entries})
+    entry_ids = sample(Entry, "pk", rng)
+    if not entries or not authors or not categories:
+        raise CommandError("The database has no vocabulary; see generate_corpus.")
+
+    result = {
+        "entry-list": ([reverse("entry-list") + f"?page={n}" for n in (1, 2, 3)], {}),
+        "entry-detail": ([reverse("entry-detail", args=[s]) for s in entries], {}),
+        "author-list": ([reverse("author-list")], {}),
+        "author-entry-list": (
+            [reverse("author-entry-list", args=[s]) for s in authors],
+            {},
+        ),
+        "category-list": ([reverse("category-list")], {}),
+        "entry-by-category-list": ([reverse("entry-by-category-list")], {}),
+        "category-entry-list": (
+            [reverse("category-entry-list", args=[s]) for s in categories],
+            {},
+        ),
+        "search": ([reverse("search") + f"?q={p}" for p in prefixes], {}),
+        "search-typeahead": ([reverse("search") + f"?q={p}" for p in prefixes], XHR),
+        "api-definitions": (
+            [
+                reverse("api-definitions")
+                + "?ids="
+                + ",".join(str(pk) for pk in entry_ids[n : n + 20])
+                for n in range(0, len(entry_ids), 20)
+            ],
+            {},
+        ),
+        "about": ([reverse("about")], {}),
+    }
+    if session_cookie:
+        cookie = {"Cookie": f"{settings.SESSION_COOKIE_NAME}={session_cookie}"}
+        for model in ["entry", "cotext", "entryrelations"]:
+            url = reverse(f"admin:voc_{model}_changelist")
+            result[f"admin-{model}"] = ([url, url + "?p=1"], cookie)
+    return result
+
+
+def wsgi_request(application, host, path, headers):
+    """Send a GET to a WSGI application, return its status and duration."""
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": host,
+        "SERVER_PORT": "443",
+        "HTTP_HOST": host,
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.url_scheme": "https",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        **{f"HTTP_{k.upper().replace('-', '_')}": v for k, v in headers.items()},
+    }
+    status = []
+    start = time.perf_counter()
+    response = application(environ, lambda s, h, *args: status.append(s))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+    return int(status[0].split()[0]), time.perf_counter() - start
+
+
+async def asgi_request(application, host, path, headers):
+    """Send a GET to an ASGI application, return its status and duration."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [
+            (b"host", host.encode()),
+            *[(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": (host, 443),
+    }
+    body_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected until the response is done.
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    duration = time.perf_counter() - start
+    disconnected.set()
+    return status[0], duration
+
+
+def run_wsgi(application, host, paths, headers, requests, concurrency):
+    urls = cycle(paths)
+    lock = Lock()
+
+    def next_url():
+        with lock:
+            return next(urls)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(
+            executor.map(
+                lambda _: wsgi_request(application, host, next_url(), headers),
+                range(requests),
+            )
+        )
+
+
+def run_asgi(application, host, paths, headers, requests, concurrency):
+    async def main():
+        urls = cycle(paths)
+        remaining = iter(range(requests))
+        results = []
+
+        async def worker():
+            for _ in remaining:
+                results.append(await asgi_request(application, host, next(urls), headers))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results
+
+    return asyncio.run(main())
+
+
+def total(metric):
+    with metric.lock:
+        return sum(metric.values.values())
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the public pages, the search typeahead and the admin "
+        "changelists through the WSGI and ASGI applications, in process, and "
+        "report throughput, latency percentiles and queries per request. Fails "
+        "if any request does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--server", choices=["wsgi", "asgi", "both"], default="both"
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per endpoint."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Unmeasured requests per endpoint."
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Only benchmark this endpoint (repeatable).",
+        )
+        parser.add_argument(
+            "--admin-user",
+            help="Username of a staff user, to benchmark the admin changelists.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Save the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="JSON results of a previous run to compare with."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.1,
+            help="Slowdown of the p95 latency reported as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        # Every request comes from the same address, so the search would be
+        # throttled.
+        with override_settings(
+            SEARCH_THROTTLE_RATE=0, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]
+        ):
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        session_cookie = None
+        if options["admin_user"]:
+            user = get_user_model().objects.get(username=options["admin_user"])
+            client = Client()
+            client.force_login(user)
+            session_cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        selected = endpoints(random.Random(options["seed"]), session_cookie)
+        if options["endpoint"]:
+            unknown = set(options["endpoint"]) - set(selected)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            selected = {name: selected[name] for name in options["endpoint"]}
+
+        servers = ["wsgi", "asgi"] if options["server"] == "both" else [options["server"]]
+        applications = {
+            "wsgi": (get_wsgi_application, run_wsgi),
+            "asgi": (get_asgi_application, run_asgi),
+        }
+
+        results = {}
+        for server in servers:
+            get_application, run = applications[server]
+            application = get_application()
+            # Every request would log a line. After loading the application,
+            # which configures logging again.
+            logging.getLogger("voc.requests").disabled = True
+            for name, (paths, headers) in selected.items():
+                run(application, HOST, paths, headers, options["warmup"], options["concurrency"])
+
+                requests_before = total(metrics.requests)
+                queries_before = total(metrics.db_queries)
+                start = time.perf_counter()
+                responses = run(
+                    application,
+                    HOST,
+                    paths,
+                    headers,
+                    options["requests"],
+                    options["concurrency"],
+                )
+                elapsed = time.perf_counter() - start
+                handled = total(metrics.requests) - requests_before
+
+                summary = summarize([duration * 1000 for status, duration in responses])
+                summary["throughput"] = len(responses) / elapsed
+                summary["errors"] = sum(1 for status, _ in responses if status >= 400)
+                summary["queries_per_request"] = (
+                    (total(metrics.db_queries) - queries_before) / handled
+                    if handled
+                    else None
+                )
+                key = f"{server}:{name}"
+                results[key] = summary
+                self.stdout.write(
+                    f"{key:<32} {summary['throughput']:7.1f} req/s"
+                    f"  p50 {summary['p50']:7.1f}  p95 {summary['p95']:7.1f}"
+                    f"  p99 {summary['p99']:7.1f} ms"
+                    f"  {summary['queries_per_request'] or 0:5.1f} queries"
+                    + (f"  {summary['errors']} errors" if summary["errors"] else "")
+                )
+
+        errors = sum(summary["errors"] for summary in results.values())
+        if errors:
+            # The figures of failed requests aren't worth comparing or keeping.
+            raise CommandError(f"{errors} requests failed.")
+
+        if options["output"]:
+            save_results(
+                options["output"],
+                "load",
+                results,
+                concurrency=options["concurrency"],
+                requests=options["requests"],
+                seed=options["seed"],
+                entries=Entry.objects.count(),
+            )
+        if options["compare"]:
+            baseline = load_results(options["compare"])["results"]
+            regressions = compare(baseline, results, "p95", options["tolerance"])
+            regressions += [
+                (f"{name} (queries)", before, after)
+                for name, before, after in compare(
+                    baseline, results, "queries_per_request", 0
+                )
+            ]
+            for name, before, after in regressions:
+                self.stdout.write(
+                    self.style.WARNING(f"  regression: {name} {before:.1f} -> {after:.1f}")
+                )
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions."))
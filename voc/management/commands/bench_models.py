@@ -0,0 +1,191 @@
+import datetime
+import statistics
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import translation
+
+from voc.admin import pretty_numbered_text
+from voc.benchmarking import compare, load_results, save_results, summarize
+from voc.models import Author, Cotext, Definition, Entry, Reference, Term
+
+
+BASELINE = settings.BASE_DIR / "benchmarks" / "models.json"
+
+
+def prefetched(instance, name, objects):
+    """Fill the prefetch cache of a relation, as prefetch_related() would."""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache = {
+        **getattr(instance, "_prefetched_objects_cache", {}),
+        name: queryset,
+    }
+    return instance
+
+
+def fixtures():
+    """
+    Unsaved objects shaped like the ones on a page, with their relations
+    and display columns in memory, so no benchmark touches the database.
+    """
+    authors = [
+        Author(pk=1, first_name="Clarice", last_name="Lispector"),
+        Author(pk=2, last_name="Machado de Assis", full_name="Machado de Assis"),
+        Author(pk=3, first_name="Hilda", last_name="Hilst"),
+    ]
+    references = [
+        prefetched(Reference(pk=n, title=f"Obra {n}", year=1950 + n), "authors", authors[:n])
+        for n in range(4)
+    ]
+    for reference in references:
+        reference.authors_display = reference.compute_authors_display()
+    cotexts = [
+        Cotext(
+            pk=n,
+            text='"A palavra é o meu domínio sobre o mundo, e escrever é uma '
+            'maneira de pensar com as mãos, devagar, até o fim da frase."',
+            text_date=datetime.date(1950 + n, 1 + n, 1 + n),
+            date_granularity=n,
+            reference=references[n],
+            loc_in_ref=f"p. {n * 10}",
+        )
+        for n in range(4)
+    ]
+    term = Term(pk=1, text="escrita")
+    entries = []
+    for number, homonyms in [(1, 1), (1, 3), (2, 3), (12, 12)]:
+        entry = Entry(
+            pk=number,
+            term=term,
+            homonym_number=number,
+            homonym_count=homonyms,
+            cotext=cotexts[0],
+        )
+        entry.display_name = entry.compute_display_name()
+        entries.append(entry)
+    definitions = [
+        [(n, Definition(text=f"Definição {n} do termo.")) for n in range(1, count + 1)]
+        for count in (0, 1, 3)
+    ]
+    return {
+        "references": references,
+        "cotexts": cotexts,
+        "entries": entries,
+        "definitions": definitions,
+    }
+
+
+def benchmarks(data):
+    """``{name: (function, number of calls it makes)}``."""
+    entries, cotexts = data["entries"], data["cotexts"]
+    references, definitions = data["references"], data["definitions"]
+    return {
+        "Entry.homonym_suffix": (
+            lambda: [entry.homonym_suffix for entry in entries],
+            len(entries),
+        ),
+        "Entry.__str__": (lambda: [str(entry) for entry in entries], len(entries)),
+        "Cotext.display_text": (
+            lambda: [cotext.display_text(max_length=50) for cotext in cotexts],
+            len(cotexts),
+        ),
+        "Cotext.template_date_str_local": (
+            lambda: [cotext.template_date_str_local for cotext in cotexts],
+            len(cotexts),
+        ),
+        "Reference.formatted_authors": (
+            lambda: [reference.formatted_authors() for reference in references],
+            len(references),
+        ),
+        "pretty_numbered_text": (
+            lambda: [pretty_numbered_text(numbered) for numbered in definitions],
+            len(definitions),
+        ),
+    }
+
+
+def measure(function, calls, repeat, min_time):
+    """
+    Time per call in microseconds, for each of ``repeat`` runs. Each run
+    loops for at least ``min_time`` seconds, with the garbage collector off
+    (timeit's default), after a first untimed run.
+    """
+    timer = timeit.Timer(function)
+    function()
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return [
+        elapsed / number / calls * 1e6 for elapsed in timer.repeat(repeat, number)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the model methods called for every row of a page, "
+        "on in-memory objects, and compare them with the stored baseline."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=7)
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.2,
+            help="Minimum duration of each timed run, in seconds.",
+        )
+        parser.add_argument(
+            "--benchmark", action="append", help="Only run this benchmark (repeatable)."
+        )
+        parser.add_argument("--output", help="Save the results to this JSON file.")
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help=f"Save the results as the baseline ({BASELINE.relative_to(settings.BASE_DIR)}).",
+        )
+        parser.add_argument(
+            "--compare", help="JSON results to compare with (default: the baseline)."
+        )
+        parser.add_argument("--tolerance", type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        results = {}
+        with translation.override(settings.LANGUAGE_CODE):
+            for name, (function, calls) in benchmarks(fixtures()).items():
+                if options["benchmark"] and name not in options["benchmark"]:
+                    continue
+                samples = measure(function, calls, options["repeat"], options["min_time"])
+                results[name] = {
+                    **summarize(samples),
+                    "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+                }
+                self.stdout.write(
+                    f"{name:<32} min {results[name]['min']:7.3f}  "
+                    f"p50 {results[name]['p50']:7.3f} µs/call"
+                )
+
+        params = {"repeat": options["repeat"], "min_time": options["min_time"]}
+        if options["output"]:
+            save_results(options["output"], "models", results, **params)
+        if options["save_baseline"]:
+            save_results(BASELINE, "models", results, **params)
+            self.stdout.write(f"Baseline saved to {BASELINE}.")
+            return
+
+        compare_with = options["compare"] or (BASELINE if BASELINE.exists() else None)
+        if compare_with:
+            baseline = load_results(compare_with)["results"]
+            # The fastest run is the least disturbed by the rest of the machine.
+            regressions = compare(baseline, results, "min", options["tolerance"])
+            for name, before, after in regressions:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"  regression: {name} {before:.3f} -> {after:.3f} µs/call"
+                    )
+                )
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS("No regressions."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from voc.documents import CHUNK_SIZE, build, stale_entry_ids
+from voc.models import Entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the documents of the entry detail pages that are missing or "
+        "in an older format, or of every entry with --all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every document, e.g. after bulk updates.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            entry_ids = Entry.objects.values_list("pk", flat=True)
+        else:
+            entry_ids = stale_entry_ids()
+        built = build(entry_ids, chunk_size=options["chunk_size"])
+        self.stdout.write(f"{built} entries built.")
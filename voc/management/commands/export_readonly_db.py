@@ -0,0 +1,34 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from voc import readonly
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the vocabulary into the read-only SQLite copy served to "
+        "anonymous visitors (READONLY_DB)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not readonly.configured():
+            raise CommandError(f"No '{readonly.ALIAS}' database in DATABASES.")
+        readonly.export(
+            settings.READONLY_DB,
+            batch_size=options["batch_size"],
+            log=self.stdout.write,
+        )
+        size = os.path.getsize(settings.READONLY_DB)
+        if size > settings.READONLY_DB_MAX_SIZE:
+            # It wouldn't fit in the public lambda.
+            os.remove(settings.READONLY_DB)
+            raise CommandError(
+                f"The read-only copy takes {size} bytes, over READONLY_DB_MAX_SIZE "
+                f"({settings.READONLY_DB_MAX_SIZE})."
+            )
+        self.stdout.write(f"Exported to {settings.READONLY_DB} ({size} bytes).")
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voc.corpus import generate
+from voc.models import Entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a synthetic vocabulary for load and "
+        "scaling tests. The same options and seed give the same corpus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=100000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--no-documents",
+            action="store_false",
+            dest="documents",
+            help=(
+                "Don't build the entry documents, most of the run; build them "
+                "later with build_entry_documents."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if Entry.objects.exists():
+            raise CommandError(
+                "The database already has entries; empty it first (manage.py flush)."
+            )
+
+        start = last = time.perf_counter()
+
+        def log(message):
+            # Each step with the time it took.
+            nonlocal last
+            now = time.perf_counter()
+            self.stdout.write(f"{message} ({now - last:.1f} s)")
+            last = now
+
+        generate(
+            options["entries"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            log=log,
+            build_documents=options["documents"],
+        )
+        if not options["documents"]:
+            self.stdout.write("Entry documents not built; run build_entry_documents.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['entries']} entries in {time.perf_counter() - start:.0f} s."
+            )
+        )
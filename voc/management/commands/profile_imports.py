@@ -0,0 +1,67 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Line format of `python -X importtime`:
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| \s*(\S+)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the slowest imports of booting the app (django.setup() and "
+        "the WSGI application), measured in a fresh interpreter."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module",
+            default="config.wsgi_public",
+            help="Module to import, by default the public WSGI application.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=25, help="Number of imports to show."
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["cumulative", "self"],
+            default="cumulative",
+            help="Sort by time including sub-imports, or by own time only.",
+        )
+
+    def handle(self, *args, **options):
+        env = os.environ.copy()
+        # Let the imported module pick its own settings.
+        env.pop("DJANGO_SETTINGS_MODULE", None)
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {options['module']}"],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if process.returncode != 0:
+            raise CommandError(process.stderr.splitlines()[-1])
+
+        imports = []
+        for line in process.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                own, cumulative, name = match.groups()
+                imports.append((int(own), int(cumulative), name))
+
+        total = sum(own for own, _, _ in imports)
+        key = 1 if options["sort"] == "cumulative" else 0
+        slowest = sorted(imports, key=lambda i: i[key], reverse=True)[: options["limit"]]
+
+        self.stdout.write(
+            f"{len(imports)} modules imported in {total / 1000:.1f} ms "
+            f"(import {options['module']})\n"
+        )
+        self.stdout.write(f"{'self ms':>9} {'cumul. ms':>10}  module")
+        for own, cumulative, name in slowest:
+            self.stdout.write(f"{own / 1000:9.1f} {cumulative / 1000:10.1f}  {name}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from voc.graph import rebuild_synonym_clusters
+
+
+class Command(BaseCommand):
+    help = "Recompute the synonym cluster of every entry from the relation table."
+
+    def handle(self, *args, **options):
+        clusters = rebuild_synonym_clusters()
+        self.stdout.write(
+            f"{len(set(clusters.values()))} synonym clusters, "
+            f"{len(clusters)} entries with synonyms."
+        )
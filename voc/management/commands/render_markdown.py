@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from voc.rich_text import check
+
+
+class Command(BaseCommand):
+    help = (
+        "Render again the stored HTML of the Markdown fields whose source "
+        "changed without it (bulk updates, imports, a new rendering)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the stale HTML, and fail if there's any.",
+        )
+
+    def handle(self, *args, **options):
+        differences = check(fix=not options["check"])
+        for model, pk, field, stored, expected in differences[:50]:
+            self.stdout.write(
+                f"{model.__name__} {pk} {field}: {stored!r} instead of {expected!r}"
+            )
+        if len(differences) > 50:
+            self.stdout.write(f"... and {len(differences) - 50} more.")
+
+        if not differences:
+            self.stdout.write(self.style.SUCCESS("The Markdown fields are up to date."))
+        elif options["check"]:
+            raise CommandError(
+                f"{len(differences)} stale fields; run without --check to render them."
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rendered {len(differences)} fields."))
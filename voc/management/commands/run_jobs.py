@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from voc import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background jobs queued by voc.jobs (with BACKGROUND_JOBS), "
+        "in a pool of threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=2)
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Jobs claimed at a time."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2,
+            help="Seconds to wait when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once there are no due jobs."
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        done = []
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    try:
+                        count = jobs.work(options["batch_size"])
+                    except DatabaseError:
+                        # The database went away; try again later.
+                        jobs.logger.exception("Couldn't claim jobs.")
+                        count = 0
+                    done.append(count)
+                    if not count:
+                        if options["once"]:
+                            return
+                        stop.wait(options["poll_interval"])
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, name=f"voc-jobs-{i}", daemon=True)
+            for i in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(f"Ran {sum(done)} jobs.")
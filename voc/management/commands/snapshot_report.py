@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voc.snapshot import build
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a snapshot of the vocabulary, as the public pages use, and "
+        "report how long it took and the memory each part of it takes."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        snapshot = build()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(snapshot.entries)} entries, {len(snapshot.authors)} authors, "
+            f"{len(snapshot.categories)} categories and "
+            f"{len(snapshot.documents)} documents in {elapsed:.2f} s."
+        )
+        footprint = snapshot.footprint()
+        for part, size in footprint.items():
+            self.stdout.write(f"{part:<28} {size / 2**20:9.2f} MiB")
+        self.stdout.write(f"{'total':<28} {sum(footprint.values()) / 2**20:9.2f} MiB")
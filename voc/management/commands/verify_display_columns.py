@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from voc.display import check
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that the denormalized display columns of references and "
+        "entries match their authors, terms and homonyms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix", action="store_true", help="Rewrite the stale columns."
+        )
+
+    def handle(self, *args, **options):
+        differences = check(fix=options["fix"])
+        for model, pk, field, stored, expected in differences[:50]:
+            self.stdout.write(
+                f"{model.__name__} {pk} {field}: {stored!r} instead of {expected!r}"
+            )
+        if len(differences) > 50:
+            self.stdout.write(f"... and {len(differences) - 50} more.")
+
+        if not differences:
+            self.stdout.write(self.style.SUCCESS("The display columns are up to date."))
+        elif options["fix"]:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(differences)} columns."))
+        else:
+            raise CommandError(
+                f"{len(differences)} stale columns; run with --fix to rewrite them."
+            )
@@ -0,0 +1,150 @@
+"""
+Process-level metrics, exposed in the Prometheus text format by
+``api/metrics/``.
+
+Metrics live in the memory of each process (each lambda instance or
+worker), so Prometheus has to scrape or sum them per instance.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from voc import instrumentation
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def format_labels(self, key, **extra):
+        pairs = [*zip(self.labels, key), *extra.items()]
+        if not pairs:
+            return ""
+        escaped = (
+            (label, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for label, value in pairs
+        )
+        return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self.lock:
+            values = dict(self.values)
+        yield from self.render_values(values)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render_values(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{self.format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=()):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            # Counts per bucket, made cumulative when rendering.
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render_values(self, values):
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bucket, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                labels = self.format_labels(key, le=str(bucket))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{self.format_labels(key)} {total}"
+            yield f"{self.name}_count{self.format_labels(key)} {cumulative}"
+
+
+registry = []
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+process_start_time = Gauge(
+    "voc_process_start_time_seconds", "Start time of the process since the epoch."
+)
+process_start_time.set(time.time())
+
+requests = Counter(
+    "voc_requests_total",
+    "Requests handled, by view, method and response status.",
+    ["view", "method", "status"],
+)
+request_duration = Histogram(
+    "voc_request_duration_seconds",
+    "Time spent handling requests, by view.",
+    ["view"],
+    LATENCY_BUCKETS,
+)
+db_queries = Counter(
+    "voc_db_queries_total", "Database queries executed, by view.", ["view"]
+)
+db_query_duration = Counter(
+    "voc_db_query_duration_seconds_total",
+    "Time spent executing database queries, by view.",
+    ["view"],
+)
+query_budget_exceeded = Counter(
+    "voc_query_budget_exceeded_total",
+    "Requests that ran more queries than their view's budget, by view.",
+    ["view"],
+)
+cache_requests = Counter(
+    "voc_cache_requests_total",
+    "Lookups in the application caches, by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+
+def record_request(view, method, status, duration, queries, query_duration):
+    requests.inc(view=view, method=method, status=status)
+    request_duration.observe(duration, view=view)
+    db_queries.inc(queries, view=view)
+    db_query_duration.inc(query_duration, view=view)
+
+
+def record_cache(cache, hit):
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+    instrumentation.record_cache(hit)
+
+
+def render():
+    """All the metrics in the Prometheus text exposition format."""
+    lines = [line for metric in registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
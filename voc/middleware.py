@@ -0,0 +1,222 @@
+import json
+import logging
+
+from django.conf import settings
+
+from voc import account, instrumentation, metrics, readonly, replicas, slow_queries
+
+
+logger = logging.getLogger("voc.requests")
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.view_name
+
+
+def server_timing(stats, total):
+    """Value of the Server-Timing header for the request."""
+    timings = [
+        f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries"',
+    ]
+    if stats.view_time is not None:
+        timings.append(f"view;dur={stats.view_time * 1000:.1f}")
+    if stats.render_time is not None:
+        timings.append(f"tpl;dur={stats.render_time * 1000:.1f}")
+    timings.append(
+        f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"'
+    )
+    timings.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(timings)
+
+
+def is_staff(request):
+    user = getattr(request, "user", None)
+    return bool(user and user.is_staff)
+
+
+class InstrumentationMiddleware:
+    """
+    Measure each request (database queries, view, template rendering and
+    cache lookups), record it in ``voc.metrics``, log it, and flag it when
+    it runs more queries than its view's budget in ``QUERY_BUDGETS``.
+    Staff (and everyone while DEBUG) also get the figures in a Server-Timing
+    header. Should come first in MIDDLEWARE to time everything.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = instrumentation.RequestStats()
+        token = instrumentation.current.set(stats)
+        try:
+            with instrumentation.counting_queries(stats):
+                response = self.get_response(request)
+        finally:
+            instrumentation.current.reset(token)
+        stats.view_finished()
+        total = stats.elapsed
+
+        view = view_name(request)
+        metrics.record_request(
+            view=view,
+            method=request.method,
+            status=response.status_code,
+            duration=total,
+            queries=stats.queries,
+            query_duration=stats.query_time,
+        )
+
+        budget = settings.QUERY_BUDGETS.get(view)
+        over_budget = budget is not None and stats.queries > budget
+        record = {
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(total * 1000, 1),
+            "view_ms": round((stats.view_time or 0) * 1000, 1),
+            "template_ms": round((stats.render_time or 0) * 1000, 1),
+            "queries": stats.queries,
+            "query_ms": round(stats.query_time * 1000, 1),
+            "cache_hits": stats.cache_hits,
+            "cache_misses": stats.cache_misses,
+        }
+        if over_budget:
+            record["query_budget"] = budget
+            metrics.query_budget_exceeded.inc(view=view)
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+        slow_queries.save(stats.slow_queries, view)
+
+        if settings.DEBUG or is_staff(request):
+            response["Server-Timing"] = server_timing(stats, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        instrumentation.current.get().view_started()
+
+    def process_template_response(self, request, response):
+        # The template is rendered after the view returns.
+        instrumentation.current.get().view_finished()
+        return response
+
+
+def is_anonymous_read(request):
+    """A GET without a session cookie, which can only be anonymous."""
+    return (
+        request.method in ("GET", "HEAD")
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+class ReadOnlyMiddleware:
+    """
+    Read the vocabulary from the read-only SQLite copy (see voc.readonly)
+    during the GET requests of anonymous visitors, who have no session.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_anonymous_read(request):
+            return self.get_response(request)
+        with readonly.reading():
+            return self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """
+    Read from the replicas (see voc.replicas) during GET requests, except in
+    the admin and for a while after the visitor wrote something.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_ALIASES:
+            return self.get_response(request)
+        if request.method not in ("GET", "HEAD"):
+            response = self.get_response(request)
+            if response.status_code < 400:
+                response.set_cookie(
+                    replicas.WRITE_COOKIE,
+                    "1",
+                    max_age=settings.READ_YOUR_WRITES_SECONDS,
+                    secure=settings.SESSION_COOKIE_SECURE,
+                    httponly=True,
+                    samesite="Lax",
+                )
+            return response
+        if replicas.WRITE_COOKIE in request.COOKIES:
+            return self.get_response(request)
+        with replicas.reading():
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match.app_name == "admin":
+            replicas.use_primary()
+
+
+class AnonymousMiddleware:
+    """
+    Give the requests of anonymous visitors (see is_anonymous_read()) a plain
+    AnonymousUser, so nothing loads their session or looks them up. Goes
+    after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if is_anonymous_read(request):
+            # Not importable where django.contrib.auth isn't installed.
+            from django.contrib.auth.models import AnonymousUser
+
+            request.user = AnonymousUser()
+        return self.get_response(request)
+
+
+class SignedInCookieMiddleware:
+    """
+    Set the marker cookie of ``voc.account`` on the response that signs a
+    user in, and delete it on the one that signs them out.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        signed_in = getattr(request, "signed_in", None)
+        if signed_in:
+            # As long as the session cookie.
+            max_age = settings.SESSION_COOKIE_AGE
+            if settings.SESSION_EXPIRE_AT_BROWSER_CLOSE:
+                max_age = None
+            response.set_cookie(
+                account.SIGNED_IN_COOKIE,
+                "1",
+                max_age=max_age,
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                secure=settings.SESSION_COOKIE_SECURE,
+                # Read by account.js.
+                httponly=False,
+                samesite="Lax",
+            )
+        elif signed_in is False:
+            response.delete_cookie(
+                account.SIGNED_IN_COOKIE,
+                path=settings.SESSION_COOKIE_PATH,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                samesite="Lax",
+            )
+        return response
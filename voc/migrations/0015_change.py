@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0014_alter_author_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Model')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Object id')),
+                ('action', models.CharField(choices=[('CREATE', 'Create'), ('UPDATE', 'Update'), ('DELETE', 'Delete')], max_length=10, verbose_name='Action')),
+                ('entry_ids', models.JSONField(blank=True, default=list, verbose_name='Affected entries')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Change',
+                'verbose_name_plural': 'Changes',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+# A copy of voc.graph.compute_clusters() as it was, so the migration keeps
+# working whatever becomes of it.
+def compute_clusters(edges):
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for a, b in edges:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return {x: find(x) for x in parent}
+
+
+def build_synonym_clusters(apps, schema_editor):
+    Entry = apps.get_model("voc", "Entry")
+    EntryRelations = apps.get_model("voc", "EntryRelations")
+    edges = EntryRelations.objects.filter(type="SYNONYM").values_list(
+        "entry_id", "related_entry_id"
+    )
+    by_cluster = {}
+    for entry_id, cluster in compute_clusters(edges).items():
+        by_cluster.setdefault(cluster, []).append(entry_id)
+    for cluster, entry_ids in by_cluster.items():
+        Entry.objects.filter(pk__in=entry_ids).update(synonym_cluster=cluster)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0015_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='synonym_cluster',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, editable=False, help_text='Smallest entry id of the group of entries connected by synonymy.', null=True, verbose_name='Synonym cluster'),
+        ),
+        migrations.RunPython(build_synonym_clusters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0016_entry_synonym_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=16, verbose_name='Fingerprint')),
+                ('sql', models.TextField(verbose_name='Normalized SQL')),
+                ('call_site', models.CharField(max_length=255, verbose_name='Call site')),
+                ('view', models.CharField(max_length=100, verbose_name='View')),
+                ('duration', models.FloatField(verbose_name='Duration (ms)')),
+                ('explain', models.TextField(blank=True, verbose_name='Query plan')),
+                ('captured_at', models.DateTimeField(auto_now_add=True, verbose_name='Captured at')),
+            ],
+            options={
+                'verbose_name': 'Slow Query',
+                'verbose_name_plural': 'Slow Queries',
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:08
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def author_name(author):
+    # Author.__str__, which historical models don't have.
+    if author.full_name:
+        return author.full_name
+    return f"{author.last_name}, {author.first_name}" if author.first_name else author.last_name
+
+
+def fill_display_columns(apps, schema_editor):
+    from voc.models import format_authors, homonym_suffix
+
+    Reference = apps.get_model("voc", "Reference")
+    Entry = apps.get_model("voc", "Entry")
+
+    references = []
+    for reference in Reference.objects.prefetch_related("authors"):
+        authors = sorted(reference.authors.all(), key=lambda author: (author.first_name, author.pk))
+        names = [author_name(author) for author in authors]
+        reference.authors_display = format_authors(names)[:255]
+        references.append(reference)
+    Reference.objects.bulk_update(references, ["authors_display"], batch_size=2000)
+
+    counts = dict(Entry.objects.order_by().values_list("term").annotate(count=Count("pk")))
+    entries = []
+    for entry in Entry.objects.select_related("term"):
+        entry.homonym_count = counts[entry.term_id]
+        suffix = homonym_suffix(entry.homonym_number, entry.homonym_count)
+        entry.display_name = f"{entry.term.text}{suffix}"[:255]
+        entries.append(entry)
+    Entry.objects.bulk_update(entries, ["homonym_count", "display_name"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0017_slowquery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='display_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Term and homonym number, kept up to date automatically.', max_length=255, verbose_name='Display name'),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='homonym_count',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, help_text='Number of entries of the term, this one included.', verbose_name='Number of homonyms'),
+        ),
+        migrations.AddField(
+            model_name='reference',
+            name='authors_display',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Short label of the authors, kept up to date automatically.', max_length=255, verbose_name='Authors display'),
+        ),
+        migrations.RunPython(fill_display_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0018_display_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=10, verbose_name='Language')),
+                ('slug', models.SlugField(db_index=False, max_length=255, verbose_name='Slug')),
+                ('version', models.PositiveSmallIntegerField(verbose_name='Format version')),
+                ('data', models.JSONField(verbose_name='Data')),
+                ('built_at', models.DateTimeField(auto_now=True, verbose_name='Built at')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='voc.entry', verbose_name='Entry')),
+            ],
+            options={
+                'verbose_name': 'Entry Document',
+                'verbose_name_plural': 'Entry Documents',
+                'unique_together': {('slug', 'language')},
+            },
+        ),
+    ]
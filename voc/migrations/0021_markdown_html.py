@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0020_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Description (HTML)'),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='concept_anl_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Conceptual analysis (HTML)'),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='note_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Note (HTML)'),
+        ),
+        migrations.AddField(
+            model_name='reference',
+            name='citation_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Formatted citation (HTML)'),
+        ),
+        migrations.AddField(
+            model_name='tradterm',
+            name='definition_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='Traditional term definition (HTML)'),
+        ),
+    ]
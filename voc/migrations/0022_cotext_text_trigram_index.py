@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# Django's icontains compares UPPER(text) on PostgreSQL, hence the
+# expression index. Other databases (the SQLite of development and of the
+# read-only copy) scan the cotexts instead.
+CREATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS voc_cotext_text_trgm
+    ON voc_cotext USING gin (UPPER(text) gin_trgm_ops)
+"""
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS voc_cotext_text_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0021_markdown_html'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
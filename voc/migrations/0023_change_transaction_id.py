@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:03
+
+from django.db import migrations, models
+
+
+# Each change records the id of the transaction that wrote it, so the feed
+# can tell which changes may still be joined by ones of transactions that
+# haven't committed. Other databases serialize their writes and keep 0.
+
+
+def default_to_transaction_id(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE voc_change ALTER COLUMN transaction_id "
+        "SET DEFAULT pg_current_xact_id()::text::bigint"
+    )
+
+
+def default_to_zero(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("ALTER TABLE voc_change ALTER COLUMN transaction_id SET DEFAULT 0")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0022_cotext_text_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='change',
+            name='transaction_id',
+            field=models.BigIntegerField(db_default=0, editable=False, verbose_name='Transaction id'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['transaction_id', 'id'], name='voc_change_feed_idx'),
+        ),
+        migrations.RunPython(default_to_transaction_id, default_to_zero),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0023_change_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slowquery',
+            name='database',
+            field=models.CharField(default='default', max_length=100, verbose_name='Database'),
+        ),
+        migrations.AddField(
+            model_name='slowquery',
+            name='to_explain',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Query to explain'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0024_slow_query_explain_job'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='entry',
+            name='concept_anl_html',
+        ),
+    ]
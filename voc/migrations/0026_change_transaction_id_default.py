@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:36
+
+import voc.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voc', '0025_remove_entry_concept_anl_html'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='transaction_id',
+            field=models.BigIntegerField(db_default=voc.models.CurrentTransactionId(), editable=False, verbose_name='Transaction id'),
+        ),
+    ]
@@ -1,14 +1,36 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import F, Max
 from django.db.models.functions import Lower
-from django.db.models.signals import post_delete
-from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.text import slugify
+from django.utils import timezone
 from django.utils.formats import get_format, date_format
 from django.utils.translation import gettext_lazy as _
 
 
+SUPERSCRIPTS = "⁰¹²³⁴⁵⁶⁷⁸⁹"
+
+
+def format_authors(names):
+    """Short label of a list of author names; empty when there are none."""
+    if not names:
+        return ""
+    if len(names) == 1:
+        return names[0]
+    elif len(names) == 2:
+        return f"{names[0]} & {names[1]}"
+    else:
+        return f"{names[0]} et al."
+
+
+def homonym_suffix(homonym_number, homonym_count):
+    """Superscript homonym number, shown when the term has other entries."""
+    if homonym_count <= 1 and homonym_number <= 1:
+        return ""
+    return "".join(SUPERSCRIPTS[int(d)] for d in str(homonym_number))
+
+
 class Author(models.Model):
     """Represents an author of a bibliographic reference."""
 
@@ -21,6 +43,7 @@ class Author(models.Model):
         blank=True,
     )
     description = models.TextField(_("Description"), blank=True, null=True)
+    description_html = models.TextField(_("Description (HTML)"), blank=True, editable=False)
     slug = models.SlugField(
         _("Slug"),
         unique=True,
@@ -80,17 +103,26 @@ class Reference(models.Model):
         blank=True,
         help_text=_("Optional preformatted citation text (e.g. APA or ABNT style)."),
     )
+    citation_html = models.TextField(
+        _("Formatted citation (HTML)"), blank=True, editable=False
+    )
+    authors_display = models.CharField(
+        _("Authors display"),
+        max_length=255,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_("Short label of the authors, kept up to date automatically."),
+    )
+
+    def compute_authors_display(self):
+        # Author.Meta.ordering, with the id breaking ties so the label
+        # doesn't depend on the order the database returns them in.
+        authors = sorted(self.authors.all(), key=lambda author: (author.first_name, author.pk))
+        return format_authors([str(author) for author in authors])[:255]
 
     def formatted_authors(self):
-        authors = self.authors.all()
-        if not authors:
-            return _("Unknown author")
-        if len(authors) == 1:
-            return str(authors[0])
-        elif len(authors) == 2:
-            return f"{authors[0]} & {authors[1]}"
-        else:
-            return f"{authors[0]} et al."
+        return self.authors_display or _("Unknown author")
 
     def __str__(self):
         base = f"{self.formatted_authors()}: {self.title}"
@@ -170,6 +202,9 @@ class Cotext(models.Model):
 class TradTerm(models.Model):
     text = models.CharField(_("Traditional term"), max_length=255)
     definition = models.TextField(_("Traditional term definition"))
+    definition_html = models.TextField(
+        _("Traditional term definition (HTML)"), blank=True, editable=False
+    )
     slug = models.SlugField(
         _("Slug"),
         unique=True,
@@ -338,12 +373,34 @@ class EntryRelations(models.Model):
         if symmetrical:
             symmetrical.delete()
 
+class SortableLower(Lower):
+    """
+    ``Lower``, which SQLite sorts by code point unless told to use the
+    collation of voc.readonly.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        from voc.readonly import COLLATION
+
+        sql, params = self.as_sql(compiler, connection, **extra_context)
+        return f"{sql} COLLATE {COLLATION}", params
+
+
 class EntryQuerySet(models.QuerySet):
     def order_by_abc_lowercase(self, precedent_fields=[], subsequent_fields=[]):
-        return self.annotate(term_lowercase=Lower(F("term__text"))).order_by(
+        return self.annotate(term_lowercase=SortableLower(F("term__text"))).order_by(
             *precedent_fields, "term_lowercase", "homonym_number", *subsequent_fields
         )
 
+    def with_citation_data(self):
+        """
+        Fetch the cotext, reference and authors along with the entries, for
+        pages that cite where each entry comes from.
+        """
+        return self.select_related("cotext__reference").prefetch_related(
+            "cotext__reference__authors"
+        )
+
 
 class EntryManager(models.Manager):
     def get_queryset(self):
@@ -409,6 +466,7 @@ class Entry(models.Model):
         related_name="entries",
     )
     note = models.TextField(_("Note"), null=True, blank=True)
+    note_html = models.TextField(_("Note (HTML)"), blank=True, editable=False)
     created_at = models.DateTimeField(verbose_name=_("Created at"), auto_now_add=True)
     updated_at = models.DateTimeField(verbose_name=_("Updated at"), auto_now=True)
     slug = models.SlugField(
@@ -419,6 +477,28 @@ class Entry(models.Model):
         max_length=255,
         help_text=_("Auto-generated from term text and homonym number if not provided."),
     )
+    synonym_cluster = models.PositiveBigIntegerField(
+        _("Synonym cluster"),
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_("Smallest entry id of the group of entries connected by synonymy."),
+    )
+    homonym_count = models.PositiveSmallIntegerField(
+        _("Number of homonyms"),
+        default=1,
+        editable=False,
+        help_text=_("Number of entries of the term, this one included."),
+    )
+    display_name = models.CharField(
+        _("Display name"),
+        max_length=255,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_("Term and homonym number, kept up to date automatically."),
+    )
 
     objects = EntryManager()
 
@@ -429,7 +509,10 @@ class Entry(models.Model):
         unique_together = ("term", "homonym_number")
 
     def __str__(self):
-        return f"{self.term}{self.homonym_suffix}"
+        return self.display_name or self.compute_display_name()
+
+    def compute_display_name(self):
+        return f"{self.term}{self.homonym_suffix}"[:255]
 
     def authors_slugs(self):
         return [author.slug for author in self.cotext.reference.authors.all()]
@@ -446,7 +529,7 @@ class Entry(models.Model):
 
     @property
     def has_homonyms(self):
-        return Entry.objects.filter(term=self.term).count() > 1
+        return self.homonym_count > 1
 
     @property
     def has_synonyms(self):
@@ -471,11 +554,7 @@ class Entry(models.Model):
     @property
     def homonym_suffix(self):
         """Return the superscript number for display."""
-        superscripts = "⁰¹²³⁴⁵⁶⁷⁸⁹"
-        if not self.has_homonyms and self.homonym_number <= 1:
-            return ""
-        number_str = "".join(superscripts[int(d)] for d in str(self.homonym_number))
-        return number_str
+        return homonym_suffix(self.homonym_number, self.homonym_count)
 
     def homonyms(self):
         return (
@@ -488,10 +567,11 @@ class Entry(models.Model):
         return self.term_def.all()
 
     def definitions_textblock(self):
-        defs = self.definitions()
-        if defs.count() > 1:
+        # Evaluate once so a prefetched ``term_def`` doesn't trigger new queries.
+        defs = list(self.definitions())
+        if len(defs) > 1:
             return " ".join([f"{n}. {d}" for n, d in enumerate(defs, 1)])
-        return defs.first()
+        return str(defs[0]) if defs else ""
 
     def get_absolute_url(self):
         return reverse("entry-detail", args=[str(self.slug)])
@@ -523,6 +603,9 @@ class Entry(models.Model):
 
             self.slug = unique_slug
 
+        # Homonym counts are refreshed after saving, see voc.display.
+        self.display_name = self.compute_display_name()
+
         super().save(*args, **kwargs)
 
 entry_definition_intermediate = Entry.term_def.through
@@ -533,15 +616,181 @@ entry_specificchar_intermediate.specificchar.verbose_name = _("Specific characte
 entry_specificchar_intermediate.__str__ = lambda obj: ""
 entry_specificchar_intermediate._meta.ordering = ["entry", "specificchar"]
 
-# 🔁 SIGNAL: Reorder homonym numbers after deletion
-@receiver(post_delete, sender=Entry)
-def reorder_homonym_numbers(sender, instance, **kwargs):
+def renumber_homonyms(term_ids):
     """
-    After an entry is deleted, renumber remaining entries of the same term.
+    Renumber the entries of the given terms from 1, after one of them was
+    deleted (queued by voc.display).
     """
-    siblings = Entry.objects.filter(term=instance.term).order_by("homonym_number", "id")
+    siblings = Entry.objects.filter(term__in=term_ids).order_by("term", "homonym_number", "id")
 
-    for i, entry in enumerate(siblings, start=1):
+    numbers = {}
+    for entry in siblings:
+        i = numbers[entry.term_id] = numbers.get(entry.term_id, 0) + 1
         if entry.homonym_number != i:
             entry.homonym_number = i
             entry.save(update_fields=["homonym_number"])
+
+
+class CurrentTransactionId(models.Func):
+    """
+    Id of the current transaction on PostgreSQL, 0 on databases that
+    serialize their writes (see voc.changes).
+    """
+
+    template = "0"
+    output_field = models.BigIntegerField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return "pg_current_xact_id()::text::bigint", []
+
+
+class SnapshotHorizon(models.Func):
+    """
+    Transaction id below which every transaction has finished, on
+    PostgreSQL (the xmin of the current snapshot).
+    """
+
+    template = "pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+    output_field = models.BigIntegerField()
+
+
+class Change(models.Model):
+    """
+    Append-only log of changes to the vocabulary, filled by the signal
+    handlers in ``voc.changes`` and served by the ``api/changes/`` feed.
+    """
+
+    CREATE = "CREATE"
+    UPDATE = "UPDATE"
+    DELETE = "DELETE"
+
+    model = models.CharField(_("Model"), max_length=100)
+    object_id = models.PositiveBigIntegerField(_("Object id"))
+    action = models.CharField(
+        _("Action"),
+        max_length=10,
+        choices=[
+            (CREATE, _("Create")),
+            (UPDATE, _("Update")),
+            (DELETE, _("Delete")),
+        ],
+    )
+    entry_ids = models.JSONField(_("Affected entries"), default=list, blank=True)
+    created_at = models.DateTimeField(verbose_name=_("Created at"), auto_now_add=True)
+    # Id of the transaction that recorded the change, the column default;
+    # 0 on other databases and for older changes.
+    transaction_id = models.BigIntegerField(
+        _("Transaction id"), db_default=CurrentTransactionId(), editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Change")
+        verbose_name_plural = _("Changes")
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["transaction_id", "id"], name="voc_change_feed_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.action.capitalize()}: {self.model} {self.object_id}"
+
+
+class EntryDocument(models.Model):
+    """
+    Everything the detail page of an entry shows, in one language, built by
+    ``voc.documents`` so the page is a single lookup by slug.
+    """
+
+    entry = models.ForeignKey(
+        Entry, on_delete=models.CASCADE, related_name="documents", verbose_name=_("Entry")
+    )
+    language = models.CharField(_("Language"), max_length=10)
+    slug = models.SlugField(_("Slug"), max_length=255, db_index=False)
+    version = models.PositiveSmallIntegerField(_("Format version"))
+    data = models.JSONField(_("Data"))
+    built_at = models.DateTimeField(_("Built at"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("Entry Document")
+        verbose_name_plural = _("Entry Documents")
+        # Also the index of the detail page's lookup.
+        unique_together = ("slug", "language")
+
+    def __str__(self):
+        return f"{self.slug} ({self.language})"
+
+
+class SlowQuery(models.Model):
+    """
+    A database query that took longer than ``SLOW_QUERY_THRESHOLD_MS``,
+    captured by ``voc.slow_queries``. Only the last ``SLOW_QUERY_BUFFER_SIZE``
+    are kept.
+    """
+
+    fingerprint = models.CharField(_("Fingerprint"), max_length=16, db_index=True)
+    sql = models.TextField(_("Normalized SQL"))
+    call_site = models.CharField(_("Call site"), max_length=255)
+    view = models.CharField(_("View"), max_length=100)
+    duration = models.FloatField(_("Duration (ms)"))
+    database = models.CharField(_("Database"), max_length=100, default="default")
+    explain = models.TextField(_("Query plan"), blank=True)
+    # [sql, params] of a query sampled for its plan, until the job that
+    # captures it runs.
+    to_explain = models.JSONField(
+        _("Query to explain"), null=True, blank=True, encoder=DjangoJSONEncoder
+    )
+    captured_at = models.DateTimeField(_("Captured at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Slow Query")
+        verbose_name_plural = _("Slow Queries")
+        ordering = ["-id"]
+
+    def __str__(self):
+        return f"{self.fingerprint} ({self.duration:.0f} ms)"
+
+
+class Job(models.Model):
+    """
+    Derived-data maintenance queued by ``voc.jobs`` for the ``run_jobs``
+    worker: run ``task`` on ``key`` (an entry, a term...). A target has at
+    most one pending job per task.
+    """
+
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    FAILED = "FAILED"
+
+    task = models.CharField(_("Task"), max_length=50)
+    key = models.CharField(_("Key"), max_length=100)
+    status = models.CharField(
+        _("Status"),
+        max_length=10,
+        choices=[
+            (PENDING, _("Pending")),
+            (RUNNING, _("Running")),
+            (FAILED, _("Failed")),
+        ],
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0)
+    run_after = models.DateTimeField(_("Run after"), default=timezone.now)
+    started_at = models.DateTimeField(_("Started at"), null=True, blank=True)
+    last_error = models.TextField(_("Last error"), blank=True)
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Job")
+        verbose_name_plural = _("Jobs")
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["task", "key"],
+                condition=models.Q(status="PENDING"),
+                name="voc_job_one_pending_per_target",
+            ),
+        ]
+        indexes = [models.Index(fields=["status", "run_after"], name="voc_job_due")]
+
+    def __str__(self):
+        return f"{self.task}: {self.key}"
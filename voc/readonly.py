@@ -0,0 +1,329 @@
+"""
+Read-only SQLite copy of the vocabulary, bundled with the deployment.
+
+``export_readonly_db`` (run by ``build_files.sh``) copies the tables of the
+published vocabulary from Postgres into an indexed SQLite file, along with
+the version of the database it was taken at. ``ReadOnlyRouter`` sends the
+reads of those models to it during anonymous public requests (flagged by
+``ReadOnlyMiddleware``). The file is opened in immutable mode and
+memory-mapped, so reading it costs no round trip to the database host.
+
+Reads only go to the copy while it's as recent as the database, which is
+checked at most every ``READONLY_DB_CHECK_INTERVAL`` seconds; the admin and
+every write always use Postgres.
+
+The copy is only exported at build time: the first edit after a deploy
+leaves it stale, and the reads go back to Postgres until the next deploy.
+
+SQLite only folds the case of ASCII letters, in ``LIKE`` (which ``icontains``
+and the other lookups use), ``upper()`` and ``lower()``, and sorts text by
+code point, so "É" would neither match "é" nor sort next to "e". The
+connections to the copy get Unicode versions of these functions (which,
+being Python functions, SQLite can't answer from an index), and every SQLite
+connection gets the ``COLLATION`` collation, which sorts as the database
+does (accents and case only break ties). The text columns of the copy are
+declared with it, so other clients need it too
+(``create_collation(COLLATION, collate)``).
+"""
+
+import functools
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections, models
+from django.db.backends.signals import connection_created
+
+from voc import metrics
+from voc.models import (
+    Author,
+    Cotext,
+    Definition,
+    Entry,
+    EntryDocument,
+    EntryRelations,
+    GeneralChar,
+    GrammClass,
+    Reference,
+    SpecificChar,
+    Term,
+    TradRelation,
+    TradTerm,
+)
+from voc.snapshot import read_version
+
+
+logger = logging.getLogger(__name__)
+
+ALIAS = "readonly"
+
+# Copied tables, in an order that satisfies their foreign keys.
+MODELS = [
+    GrammClass,
+    GeneralChar,
+    TradRelation,
+    TradTerm,
+    SpecificChar,
+    Definition,
+    Term,
+    Author,
+    Reference,
+    Reference.authors.through,
+    Cotext,
+    Entry,
+    Entry.term_def.through,
+    Entry.specific_char.through,
+    EntryRelations,
+    EntryDocument,
+]
+LABELS = {model._meta.label for model in MODELS}
+
+VERSION_TABLE = "voc_readonly_version"
+
+COLLATION = "voc_unicode"
+
+_active = ContextVar("voc_readonly_active", default=False)
+
+fresh_gauge = metrics.Gauge(
+    "voc_readonly_db_fresh",
+    "1 while the read-only SQLite copy is as recent as the database, else 0.",
+)
+
+_lock = threading.Lock()
+_checked_at = float("-inf")
+_fresh = False
+_exported_version = None
+
+
+@contextmanager
+def reading():
+    """Send the reads of the vocabulary to the copy, while it's fresh."""
+    token = _active.set(True)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def configured():
+    return ALIAS in settings.DATABASES
+
+
+def available():
+    """Whether this deployment has a copy to read from."""
+    if not configured() or not os.path.exists(settings.READONLY_DB):
+        return False
+    # Test databases mirror the default one instead.
+    return connections[ALIAS].settings_dict["NAME"] != connections["default"].settings_dict["NAME"]
+
+
+def exported_version():
+    """Version of the database the copy was taken at (the file never changes)."""
+    global _exported_version
+    if _exported_version is None:
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute(f"SELECT change_id, entry_id, document_id FROM {VERSION_TABLE}")
+            _exported_version = tuple(cursor.fetchone())
+    return _exported_version
+
+
+def fresh():
+    """Whether the copy exists and the database hasn't changed since."""
+    global _checked_at, _fresh
+    now = time.monotonic()
+    with _lock:
+        if now - _checked_at < settings.READONLY_DB_CHECK_INTERVAL:
+            return _fresh
+        _checked_at = now
+    is_fresh = False
+    if available():
+        try:
+            exported = exported_version()
+        except DatabaseError:
+            logger.exception("Couldn't read the version of the read-only copy.")
+        else:
+            try:
+                is_fresh = exported == read_version(using="default")
+            except DatabaseError:
+                # The copy is better than nothing while the database is down.
+                logger.warning("Couldn't check the read-only copy against the database.")
+                is_fresh = True
+    with _lock:
+        _fresh = is_fresh
+    fresh_gauge.set(int(is_fresh))
+    return is_fresh
+
+
+@functools.lru_cache(maxsize=4096)
+def sort_key(text):
+    folded = text.casefold()
+    unaccented = "".join(
+        char for char in unicodedata.normalize("NFD", folded) if not unicodedata.combining(char)
+    )
+    return unaccented, folded, text
+
+
+def collate(text1, text2):
+    key1, key2 = sort_key(text1), sort_key(text2)
+    return (key1 > key2) - (key1 < key2)
+
+
+@functools.lru_cache(maxsize=256)
+def like_pattern(pattern, escape):
+    parts = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == escape:
+            parts.append(re.escape(next(chars, "")))
+        elif char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def like(pattern, text, escape=None):
+    """SQLite's ``text LIKE pattern``, ignoring the case of every letter."""
+    if pattern is None or text is None:
+        return None
+    return like_pattern(pattern.casefold(), escape).fullmatch(text.casefold()) is not None
+
+
+def null_safe(function):
+    return lambda text: None if text is None else function(str(text))
+
+
+def unicode_functions(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    database = connection.connection
+    database.create_collation(COLLATION, collate)
+    # The copy and the connection exporting it (readonly_export).
+    if connection.alias.startswith(ALIAS):
+        database.create_function("like", 2, like, deterministic=True)
+        database.create_function("like", 3, like, deterministic=True)
+        database.create_function("upper", 1, null_safe(str.upper), deterministic=True)
+        database.create_function("lower", 1, null_safe(str.lower), deterministic=True)
+
+
+class ReadOnlyRouter:
+    def db_for_read(self, model, **hints):
+        if _active.get() and model._meta.label in LABELS and fresh():
+            return ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both hold the same rows.
+        if {obj1._state.db, obj2._state.db} <= {"default", ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The copy is created by export(), never migrated.
+        if db == ALIAS:
+            return False
+        return None
+
+
+def collated(editor_class):
+    """A schema editor declaring the text columns with ``COLLATION``."""
+
+    class CollatedSchemaEditor(editor_class):
+        def column_sql(self, model, field, include_default=False):
+            sql, params = super().column_sql(model, field, include_default)
+            if (
+                sql is not None
+                and not field.is_relation
+                and isinstance(field, (models.CharField, models.TextField))
+            ):
+                sql = f"{sql} COLLATE {COLLATION}"
+            return sql, params
+
+    return CollatedSchemaEditor
+
+
+def copy_table(model, writable, batch_size, log):
+    # Plain inserts: bulk_create() would overwrite the auto_now fields.
+    fields = model._meta.concrete_fields
+    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+        writable.ops.quote_name(model._meta.db_table),
+        ", ".join(writable.ops.quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    rows = (
+        model._base_manager.using("default")
+        .order_by("pk")
+        .values_list(*[field.attname for field in fields])
+        .iterator(chunk_size=batch_size)
+    )
+    count = 0
+    with writable.cursor() as cursor:
+        while batch := list(itertools.islice(rows, batch_size)):
+            cursor.executemany(
+                sql,
+                [
+                    [field.get_db_prep_save(value, writable) for field, value in zip(fields, row)]
+                    for row in batch
+                ],
+            )
+            count += len(batch)
+    log(f"{model._meta.label}: {count} rows.")
+
+
+def export(path, batch_size=2000, log=print):
+    """Copy the vocabulary from the default database into a new SQLite file."""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    # Read first, so changes made during the export leave the copy stale.
+    version = read_version(using="default")
+
+    # A connection of its own, writing to the new file.
+    alias = f"{ALIAS}_export"
+    wrapper_class = type(connections[ALIAS])
+    writable = wrapper_class(
+        {**connections[ALIAS].settings_dict, "NAME": tmp_path, "OPTIONS": {}}, alias
+    )
+    writable.SchemaEditorClass = collated(wrapper_class.SchemaEditorClass)
+    connections[alias] = writable
+    try:
+        with writable.schema_editor() as editor:
+            for model in MODELS:
+                if not model._meta.auto_created:  # Created with their models.
+                    editor.create_model(model)
+            editor.execute(
+                f"CREATE TABLE {VERSION_TABLE} "
+                "(change_id integer, entry_id integer, document_id integer)"
+            )
+            editor.execute(f"INSERT INTO {VERSION_TABLE} VALUES (%s, %s, %s)", version)
+
+        writable.set_autocommit(False)
+        for model in MODELS:
+            copy_table(model, writable, batch_size, log)
+        writable.commit()
+        writable.set_autocommit(True)
+
+        with writable.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("VACUUM")
+    finally:
+        writable.close()
+        del connections[alias]
+    os.replace(tmp_path, path)
+
+
+def connect():
+    connection_created.connect(unicode_functions, dispatch_uid="voc.readonly")
@@ -0,0 +1,152 @@
+"""
+Read replicas.
+
+``ReplicaMiddleware`` flags the GET requests of the public pages, the API
+and the search; ``ReplicaRouter`` sends their reads to one of the replicas
+in ``REPLICA_ALIASES`` (see ``POSTGRES_REPLICA_HOSTS`` in the settings), the
+same one for the whole request. Everything else stays on the primary: the
+admin, every write, the reads that follow a write in the same request, and
+the requests of an editor who has written in the last
+``READ_YOUR_WRITES_SECONDS`` (flagged by a cookie), so they see their
+changes.
+
+The lag of each replica is read at most every ``REPLICA_LAG_CHECK_INTERVAL``
+seconds; replicas behind by more than ``REPLICA_MAX_LAG`` seconds, or that
+can't be reached, aren't used until they catch up. With no replica left,
+reads go to the primary.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from voc import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Set after a write, so the editor's next requests read from the primary.
+WRITE_COOKIE = "voc_recent_write"
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+lag_gauge = metrics.Gauge(
+    "voc_replica_lag_seconds",
+    "Replication lag of each read replica, when last checked.",
+    ["database"],
+)
+reads = metrics.Counter(
+    "voc_replica_requests_total",
+    "Requests flagged for the replicas, by the database that served their reads.",
+    ["database"],
+)
+
+
+class Routing:
+    """Where the reads of a request go."""
+
+    __slots__ = ("database", "primary")
+
+    def __init__(self):
+        self.database = None
+        self.primary = False
+
+
+_current = ContextVar("voc_replica_routing", default=None)
+
+_lock = threading.Lock()
+_checked_at = float("-inf")
+_healthy = []
+
+
+@contextmanager
+def reading():
+    """Send the reads of the current request to a replica."""
+    token = _current.set(Routing())
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def use_primary():
+    """Keep the rest of the current request on the primary."""
+    routing = _current.get()
+    if routing is not None:
+        routing.primary = True
+
+
+def lag(alias):
+    """Seconds the replica is behind the primary (0 for other databases)."""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+def healthy():
+    """The replicas that are close enough to the primary."""
+    global _checked_at, _healthy
+    now = time.monotonic()
+    with _lock:
+        if now - _checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return _healthy
+        _checked_at = now
+    aliases = []
+    for alias in settings.REPLICA_ALIASES:
+        try:
+            seconds = lag(alias)
+        except DatabaseError:
+            logger.warning("Couldn't read the lag of the %s replica.", alias)
+            continue
+        lag_gauge.set(seconds, database=alias)
+        if seconds <= settings.REPLICA_MAX_LAG:
+            aliases.append(alias)
+        else:
+            logger.warning("The %s replica is %.1f s behind.", alias, seconds)
+    with _lock:
+        _healthy = aliases
+    return aliases
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if routing is None or routing.primary:
+            return None
+        if routing.database is None:
+            aliases = healthy()
+            routing.database = random.choice(aliases) if aliases else "default"
+            reads.inc(database=routing.database)
+        return routing.database if routing.database != "default" else None
+
+    def db_for_write(self, model, **hints):
+        # Later reads in the request see the write.
+        use_primary()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both hold the same rows.
+        databases = {"default", *settings.REPLICA_ALIASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_ALIASES:
+            return False
+        return None
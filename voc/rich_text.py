@@ -0,0 +1,146 @@
+"""
+Markdown in the long text fields.
+
+The fields in ``FIELDS`` are written in Markdown and shown as HTML, which
+is rendered when they're saved and stored next to them, in ``<field>_html``,
+so pages print it without rendering anything. Raw HTML in the source is
+escaped, not passed through, and links and images keep their URL only if
+it's relative or ``http``, ``https`` or ``mailto``: the stored HTML is safe
+to print as is. A single paragraph is rendered without its ``<p>``, since
+most of these fields are shown within a sentence, and the fields shown
+capitalized have their first letter capitalized in the source, the HTML
+possibly starting with a tag.
+
+Bulk operations (``QuerySet.update()``, ``bulk_create()``...) don't send
+signals; ``check()`` (the ``render_markdown`` command) finds and renders
+again the HTML they left stale, and the HTML of every row when the
+rendering changes.
+"""
+
+import re
+import threading
+from urllib.parse import urlsplit
+
+import markdown
+from markdown.treeprocessors import Treeprocessor
+from django.db.models.signals import pre_save
+
+from voc.models import Author, Entry, Reference, TradTerm
+
+
+FIELDS = {
+    Entry: ["note"],
+    Author: ["description"],
+    TradTerm: ["definition"],
+    Reference: ["citation"],
+}
+
+# Fields shown capitalized: the category definitions, in the lists' tooltips.
+CAPITALIZED = {
+    TradTerm: ["definition"],
+}
+
+FIRST_LETTER = re.compile(r"[^\W\d_]")
+
+SAFE_SCHEMES = {"", "http", "https", "mailto"}
+
+_local = threading.local()
+
+
+def html_field(field):
+    return f"{field}_html"
+
+
+def is_safe_url(url):
+    # Browsers ignore control characters and spaces within the scheme.
+    return urlsplit(re.sub(r"[\x00-\x20]", "", url)).scheme.lower() in SAFE_SCHEMES
+
+
+class SafeLinks(Treeprocessor):
+    """Drop the URLs of links and images that could run code."""
+
+    def run(self, root):
+        for element in root.iter():
+            for attribute in ("href", "src"):
+                url = element.get(attribute)
+                if url is not None and not is_safe_url(url):
+                    del element.attrib[attribute]
+
+
+def converter():
+    # Markdown instances keep state between conversions: one per thread.
+    if not hasattr(_local, "converter"):
+        converter = markdown.Markdown(output_format="html")
+        converter.preprocessors.deregister("html_block")
+        converter.inlinePatterns.deregister("html")
+        converter.treeprocessors.register(SafeLinks(converter), "safe_links", 0)
+        _local.converter = converter
+    return _local.converter.reset()
+
+
+def render(text):
+    """The sanitized HTML of the Markdown ``text``."""
+    if not text:
+        return ""
+    html = converter().convert(text)
+    if html.startswith("<p>") and html.endswith("</p>") and html.count("<p>") == 1:
+        html = html[3:-4]
+    return html
+
+
+def render_field(model, field, text):
+    """The HTML of the ``field`` of ``model`` whose source is ``text``."""
+    if text and field in CAPITALIZED.get(model, ()):
+        text = FIRST_LETTER.sub(lambda letter: letter.group().upper(), text, count=1)
+    return render(text)
+
+
+def source_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    rendered = {}
+    for field in FIELDS[sender]:
+        if update_fields is None or field in update_fields:
+            rendered[html_field(field)] = render_field(sender, field, getattr(instance, field))
+    for field, html in rendered.items():
+        setattr(instance, field, html)
+    unsaved = {
+        field: html
+        for field, html in rendered.items()
+        if update_fields is not None and field not in update_fields
+    }
+    if unsaved:
+        # The source is among the fields saved, but not its HTML.
+        sender.objects.filter(pk=instance.pk).update(**unsaved)
+
+
+def check(fix=False, chunk_size=2000):
+    """
+    Compare the stored HTML with the rendering of its source and return the
+    ``(model, pk, field, stored, expected)`` differences, fixing them if
+    ``fix``.
+    """
+    differences = []
+    for model, fields in FIELDS.items():
+        html_fields = [html_field(field) for field in fields]
+        stale = []
+        rows = model.objects.only("pk", *fields, *html_fields).order_by("pk")
+        for row in rows.iterator(chunk_size=chunk_size):
+            changed = False
+            for field in fields:
+                stored = getattr(row, html_field(field))
+                expected = render_field(model, field, getattr(row, field))
+                if stored != expected:
+                    differences.append((model, row.pk, html_field(field), stored, expected))
+                    setattr(row, html_field(field), expected)
+                    changed = True
+            if changed:
+                stale.append(row)
+        if fix:
+            model.objects.bulk_update(stale, html_fields, batch_size=chunk_size)
+    return differences
+
+
+def connect():
+    for model in FIELDS:
+        pre_save.connect(source_saving, sender=model, dispatch_uid="voc.rich_text")
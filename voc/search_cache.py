@@ -0,0 +1,105 @@
+"""
+Short-lived cache of search results, for the typeahead.
+
+Results are kept by normalized query for ``SEARCH_CACHE_TTL`` seconds, in
+the memory of the process. Every result of a query contains its text, so
+those of a longer query are among them: when the query extends a cached one
+whose results are complete (no list was cut at ``SEARCH_MAX_RESULTS``),
+they're narrowed in memory instead of searched again, which is what typing
+a word one letter at a time does.
+
+Results are the records of ``voc.snapshot`` (whose ``search_text`` is what
+the query is matched against), whether they come from the snapshot or the
+database. The key includes the source, so a new snapshot starts afresh,
+and every recorded change (``voc.changes``) empties the cache of the process
+that made it; the others see it within ``SEARCH_CACHE_TTL``.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_save
+
+from voc.models import Change
+
+
+KINDS = ["entries", "authors", "categories"]
+
+
+def normalize(query):
+    return " ".join(query.split()).lower()
+
+
+def narrow(results, query):
+    return {
+        kind: [record for record in records if query in record.search_text]
+        for kind, records in results.items()
+    }
+
+
+def is_complete(results):
+    return all(len(records) <= settings.SEARCH_MAX_RESULTS for records in results.values())
+
+
+class ResultCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, source, query):
+        """
+        The results of ``query``, cached or narrowed from those of a cached
+        prefix; None if there are none.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for end in range(len(query), 0, -1):
+                cached = self.entries.get((source, query[:end]))
+                if cached is None:
+                    continue
+                results, complete, expires = cached
+                if expires < now:
+                    del self.entries[(source, query[:end])]
+                    continue
+                if end == len(query):
+                    self.entries.move_to_end((source, query))
+                    return results
+                if complete:
+                    break
+            else:
+                return None
+        results = narrow(results, query)
+        self.put(source, query, results)
+        return results
+
+    def put(self, source, query, results):
+        complete = is_complete(results)
+        if not complete:
+            results = {
+                kind: records[: settings.SEARCH_MAX_RESULTS]
+                for kind, records in results.items()
+            }
+        expires = time.monotonic() + settings.SEARCH_CACHE_TTL
+        with self.lock:
+            self.entries[(source, query)] = (results, complete, expires)
+            self.entries.move_to_end((source, query))
+            while len(self.entries) > settings.SEARCH_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = ResultCache()
+
+
+def change_recorded(sender, instance, created, **kwargs):
+    cache.clear()
+
+
+def connect():
+    post_save.connect(change_recorded, sender=Change, dispatch_uid="voc.search_cache")
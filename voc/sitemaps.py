@@ -0,0 +1,149 @@
+"""
+Sitemaps of the public pages.
+
+``sitemap.xml`` is an index of the sitemaps of the entries, authors and
+categories, each split into chunks of ``CHUNK_SIZE`` primary keys, so
+crawlers find every page without walking the paginated lists. A chunk is
+rendered by streaming its rows in key order (a range scan of the primary
+key, never an OFFSET) and cached under its fingerprint, the count, last key
+and last ``updated_at`` of its rows, or a digest of their slugs for the
+models that have no ``updated_at`` (authors, categories): a change to an
+entry or a renamed author only makes its own chunk render again, in every
+process, whatever the cache backend.
+
+Pages aren't addressed by language (it comes from the language cookie or
+Accept-Language), so each page is listed once and serves every language.
+"""
+
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.db.models import Aggregate, Count, F, Max, TextField
+from django.urls import reverse
+
+from voc.models import Author, Entry, TradTerm
+
+
+# Primary keys per chunk, well under the 50,000 URLs a sitemap may hold.
+CHUNK_SIZE = 10_000
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# URL names of the pages that don't depend on the vocabulary.
+PAGES = ["entry-list", "author-list", "category-list", "entry-by-category-list", "about"]
+
+URLSET = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+SITEMAPINDEX = '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def url_element(location, lastmod=None):
+    lastmod = f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else ""
+    return f"<url><loc>{escape(location)}</loc>{lastmod}</url>\n"
+
+
+class SlugDigest(Aggregate):
+    """
+    Changes whenever a slug of the rows does: their MD5 on PostgreSQL, their
+    concatenation elsewhere (the SQLite of development).
+    """
+
+    function = "GROUP_CONCAT"
+    output_field = TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template="MD5(STRING_AGG(%(expressions)s, ' ' ORDER BY %(expressions)s))",
+            **extra_context,
+        )
+
+
+class Section:
+    """The pages of one model, linked by slug, in chunks of primary keys."""
+
+    def __init__(self, model, url_name, lastmod_field=None):
+        self.model = model
+        self.url_name = url_name
+        self.lastmod_field = lastmod_field
+
+    def aggregates(self, fingerprint=False):
+        aggregates = {"count": Count("pk"), "last_pk": Max("pk")}
+        if self.lastmod_field:
+            aggregates["lastmod"] = Max(self.lastmod_field)
+        elif fingerprint:
+            aggregates["slugs"] = SlugDigest("slug")
+        return aggregates
+
+    def chunks(self):
+        """``{chunk: fingerprint}`` of the chunks that hold rows, in order."""
+        rows = (
+            self.model.objects.all()
+            .order_by()
+            .annotate(chunk=F("pk") / CHUNK_SIZE)
+            .values("chunk")
+            .annotate(**self.aggregates())
+            .order_by("chunk")
+        )
+        return {row.pop("chunk"): row for row in rows}
+
+    def fingerprint(self, chunk):
+        return self.rows(chunk).aggregate(**self.aggregates(fingerprint=True))
+
+    def rows(self, chunk):
+        return self.model.objects.filter(
+            pk__gte=chunk * CHUNK_SIZE, pk__lt=(chunk + 1) * CHUNK_SIZE
+        )
+
+    def render(self, chunk, base_url):
+        # The location of every page, from that of a placeholder slug.
+        location = base_url + reverse(self.url_name, args=["__slug__"])
+        fields = ["slug"] + ([self.lastmod_field] if self.lastmod_field else [])
+        rows = self.rows(chunk).order_by("pk").values_list(*fields)
+        parts = [URLSET]
+        for slug, *lastmod in rows.iterator(chunk_size=2000):
+            parts.append(url_element(location.replace("__slug__", slug), *lastmod))
+        parts.append("</urlset>\n")
+        return "".join(parts)
+
+
+SECTIONS = {
+    "entries": Section(Entry, "entry-detail", "updated_at"),
+    "authors": Section(Author, "author-entry-list"),
+    "categories": Section(TradTerm, "category-entry-list"),
+}
+
+
+def index(base_url):
+    parts = [SITEMAPINDEX]
+    locations = [(base_url + reverse("sitemap-pages"), None)]
+    for name, section in SECTIONS.items():
+        for chunk, fingerprint in section.chunks().items():
+            location = base_url + reverse("sitemap", args=[name, chunk])
+            locations.append((location, fingerprint.get("lastmod")))
+    for location, lastmod in locations:
+        lastmod = f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else ""
+        parts.append(f"<sitemap><loc>{escape(location)}</loc>{lastmod}</sitemap>\n")
+    parts.append("</sitemapindex>\n")
+    return "".join(parts)
+
+
+def pages(base_url):
+    elements = [url_element(base_url + reverse(url_name)) for url_name in PAGES]
+    return URLSET + "".join(elements) + "</urlset>\n"
+
+
+def chunk(name, number, base_url):
+    """The sitemap of a chunk of a section, from the cache if it's unchanged."""
+    section = SECTIONS[name]
+    fingerprint = section.fingerprint(number)
+    if not fingerprint["count"]:
+        return None
+    digest = hashlib.sha1(repr(sorted(fingerprint.items())).encode()).hexdigest()
+    key = f"voc:sitemap:{base_url}:{name}:{number}:{digest}"
+    content = cache.get(key)
+    if content is None:
+        content = section.render(number, base_url)
+        cache.set(key, content, CACHE_TIMEOUT)
+    return content
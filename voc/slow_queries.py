@@ -0,0 +1,160 @@
+"""
+Slow query sampler.
+
+Queries slower than ``SLOW_QUERY_THRESHOLD_MS`` are noted by the request's
+``RequestStats`` and saved by ``InstrumentationMiddleware`` when the request
+ends, fingerprinted by their normalized SQL and the project code that ran
+them. A ``SLOW_QUERY_EXPLAIN_RATE`` fraction of the slow SELECTs also get
+their ``EXPLAIN (ANALYZE, BUFFERS)`` plan captured, which runs them again:
+the request only keeps their SQL and parameters, and a background job
+(voc.jobs) runs them on the database they ran on. Without
+``BACKGROUND_JOBS`` there's no worker, and no plans.
+"""
+
+import hashlib
+import json
+import random
+import re
+import traceback
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+
+from voc import jobs
+from voc.benchmarking import percentile
+from voc.models import SlowQuery
+
+
+# Modules of the sampling machinery itself, never the call site of a query.
+IGNORED_MODULES = ("voc/instrumentation.py", "voc/middleware.py", "voc/slow_queries.py")
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """SQL with literals replaced by ``?`` and lists of values collapsed."""
+    sql = STRING_LITERAL.sub("?", sql)
+    sql = NUMBER_LITERAL.sub("?", sql)
+    sql = VALUE_LIST.sub("(...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized_sql, call_site):
+    return hashlib.sha1(f"{normalized_sql}\n{call_site}".encode()).hexdigest()[:16]
+
+
+def call_site():
+    """The innermost frame of project code in the current stack."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if not frame.filename.startswith(base_dir) or "site-packages" in frame.filename:
+            continue
+        filename = frame.filename[len(base_dir) + 1 :]
+        if filename.endswith(IGNORED_MODULES):
+            continue
+        return f"{filename}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+def explain(sql, params, using="default"):
+    if using not in connections:
+        # A replica removed from the settings since.
+        return ""
+    connection = connections[using]
+    if connection.vendor != "postgresql" or not sql.lstrip().upper().startswith("SELECT"):
+        return ""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def to_explain(sql, params):
+    """The ``[sql, params]`` of a query sampled for its plan, or None."""
+    if not settings.BACKGROUND_JOBS or random.random() >= settings.SLOW_QUERY_EXPLAIN_RATE:
+        return None
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    try:
+        json.dumps(params, cls=DjangoJSONEncoder)
+    except TypeError:
+        return None
+    return [sql, list(params or ())]
+
+
+def save(slow_queries, view):
+    """
+    Store the ``(sql, params, duration, call_site, database)`` slow queries
+    of a request, and queue the job that captures the plans of the sampled
+    ones and drops the oldest rows beyond the buffer size.
+    """
+    if not slow_queries:
+        return
+    rows = []
+    for sql, params, duration, site, using in slow_queries:
+        normalized = normalize_sql(sql)
+        rows.append(
+            SlowQuery(
+                fingerprint=fingerprint(normalized, site),
+                sql=normalized,
+                call_site=site[:255],
+                view=view,
+                duration=duration * 1000,
+                database=using,
+                to_explain=to_explain(sql, params),
+            )
+        )
+    try:
+        rows = SlowQuery.objects.bulk_create(rows)
+    except DatabaseError:
+        # Sampling must never break the request it observes.
+        return
+    jobs.enqueue("slow-queries", [row.pk for row in rows])
+
+
+def explain_saved(keys):
+    """Capture the plans of the sampled slow queries ``keys``, then trim."""
+    sampled = SlowQuery.objects.filter(pk__in=keys, to_explain__isnull=False)
+    for query in sampled.order_by("pk"):
+        sql, params = query.to_explain
+        try:
+            query.explain = explain(sql, params, query.database)
+        except DatabaseError:
+            # The query can't run again (a dropped table...); no plan then.
+            query.explain = ""
+        query.to_explain = None
+        query.save(update_fields=["explain", "to_explain"])
+    last = max(int(key) for key in keys)
+    SlowQuery.objects.filter(id__lte=last - settings.SLOW_QUERY_BUFFER_SIZE).delete()
+
+
+def summary():
+    """Count and latency of the captured slow queries, per fingerprint."""
+    by_fingerprint = {}
+    for query in SlowQuery.objects.order_by("id"):
+        by_fingerprint.setdefault(query.fingerprint, []).append(query)
+
+    rows = []
+    for key, queries in by_fingerprint.items():
+        durations = [query.duration for query in queries]
+        rows.append(
+            {
+                "fingerprint": key,
+                "sql": queries[-1].sql,
+                "call_site": queries[-1].call_site,
+                "views": sorted({query.view for query in queries}),
+                "count": len(queries),
+                "p95": percentile(durations, 95),
+                "max": max(durations),
+                "last_seen": queries[-1].captured_at,
+                "has_plan": any(query.explain for query in queries),
+            }
+        )
+    return sorted(rows, key=lambda row: row["p95"] * row["count"], reverse=True)
+
+
+def connect():
+    jobs.register("slow-queries", explain_saved)
@@ -0,0 +1,323 @@
+"""
+In-memory snapshot of the published vocabulary.
+
+The public pages read the entries, terms, authors and categories from a
+``Snapshot`` held by the process instead of querying them for every
+request: compact records (``__slots__`` classes) in the orders the pages list
+them in, indexes by slug, author and category, and the entry documents of
+the detail pages (see ``voc.documents``), which carry the related entries.
+
+A snapshot is never modified. When the vocabulary changes, a new one is
+built in a background thread and swapped in. ``current()`` reads the
+version of the database (the last change, entry and document ids) at most
+every ``LEXICON_SNAPSHOT_CHECK_INTERVAL`` seconds and returns None while
+there's no snapshot yet or it's stale; the views then use the ORM.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, TextField
+from django.db.models.functions import Cast
+
+from voc import metrics
+from voc.models import Author, Change, Entry, EntryDocument, TradTerm
+
+
+logger = logging.getLogger(__name__)
+
+
+class EntryRecord:
+    __slots__ = ("pk", "slug", "name", "search_text", "trad_term")
+
+    def __init__(self, pk, slug, name, search_text, trad_term):
+        self.pk = pk
+        self.slug = slug
+        self.name = name
+        self.search_text = search_text
+        self.trad_term = trad_term
+
+    def __str__(self):
+        return self.name
+
+
+class AuthorRecord:
+    __slots__ = ("pk", "slug", "name", "description_html", "search_text")
+
+    def __init__(self, pk, slug, name, description_html, search_text):
+        self.pk = pk
+        self.slug = slug
+        self.name = name
+        self.description_html = description_html
+        self.search_text = search_text
+
+    def __str__(self):
+        return self.name
+
+
+class CategoryRecord:
+    __slots__ = ("pk", "slug", "text", "definition_html", "search_text")
+
+    def __init__(self, pk, slug, text, definition_html):
+        self.pk = pk
+        self.slug = slug
+        self.text = text
+        self.definition_html = definition_html
+        self.search_text = text.lower()
+
+    def __str__(self):
+        return self.text
+
+
+class Snapshot:
+    __slots__ = (
+        "version",
+        "built_at",
+        "entries",
+        "entries_by_category_order",
+        "entries_by_id",
+        "authors",
+        "author_by_slug",
+        "entries_by_author",
+        "categories",
+        "category_by_slug",
+        "entries_by_category",
+        "documents",
+    )
+
+    # Parts reported by footprint(), in the order their records are counted.
+    PARTS = [
+        "entries",
+        "entries_by_category_order",
+        "entries_by_id",
+        "authors",
+        "author_by_slug",
+        "entries_by_author",
+        "categories",
+        "category_by_slug",
+        "entries_by_category",
+        "documents",
+    ]
+
+    def entry_list(self, author_slugs=(), category_slug=None):
+        """
+        Entries in alphabetical order, of any of the given authors and in
+        the given category; None if one of them doesn't exist.
+        """
+        entries = self.entries
+        if author_slugs:
+            authors = {self.author_by_slug.get(slug) for slug in author_slugs} - {None}
+            if not authors:
+                return None
+            if len(authors) == 1:
+                entries = self.entries_by_author.get(authors.pop().pk, ())
+            else:
+                selected = set()
+                for author in authors:
+                    selected.update(self.entries_by_author.get(author.pk, ()))
+                entries = [entry for entry in entries if entry in selected]
+        if category_slug is not None:
+            category = self.category_by_slug.get(category_slug)
+            if category is None:
+                return None
+            if author_slugs:
+                entries = [entry for entry in entries if entry.trad_term is category]
+            else:
+                entries = self.entries_by_category.get(category.pk, ())
+        return entries
+
+    def document(self, slug, language):
+        data = self.documents.get((slug, language))
+        return json.loads(zlib.decompress(data)) if data is not None else None
+
+    def search(self, query, limit=None):
+        """Entries, authors and categories whose text contains ``query``."""
+        query = query.lower()
+
+        def matches(records):
+            found = [record for record in records if query in record.search_text]
+            return found[:limit]
+
+        return {
+            "entries": matches(self.entries_by_id),
+            "authors": matches(self.authors),
+            "categories": matches(self.categories),
+        }
+
+    def footprint(self):
+        """Approximate memory used by each part of the snapshot, in bytes."""
+        seen = set()
+        return {part: deep_size(getattr(self, part), seen) for part in self.PARTS}
+
+
+def deep_size(obj, seen):
+    """Size of ``obj`` and of what it holds, not counting objects in ``seen``."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(type(obj), "__slots__"):
+        size += sum(deep_size(getattr(obj, slot), seen) for slot in type(obj).__slots__)
+    return size
+
+
+def read_version(using=None):
+    """Changes to the vocabulary move at least one of these ids."""
+    return tuple(
+        model.objects.using(using).aggregate(Max("pk"))["pk__max"]
+        for model in [Change, Entry, EntryDocument]
+    )
+
+
+def build():
+    """Read the vocabulary and return a new snapshot of it."""
+    snapshot = Snapshot()
+    # Read first, so changes made during the build leave it stale.
+    snapshot.version = read_version()
+    snapshot.built_at = time.time()
+
+    categories = [
+        CategoryRecord(pk, slug, text, definition_html)
+        for pk, slug, text, definition_html in TradTerm.objects.values_list(
+            "pk", "slug", "text", "definition_html"
+        )
+    ]
+    category_by_pk = {category.pk: category for category in categories}
+    snapshot.categories = tuple(categories)
+    snapshot.category_by_slug = {category.slug: category for category in categories}
+
+    authors = [
+        AuthorRecord(
+            author.pk,
+            author.slug,
+            str(author),
+            author.description_html,
+            author.full_name.lower(),
+        )
+        for author in Author.objects.all()
+    ]
+    snapshot.authors = tuple(authors)
+    snapshot.author_by_slug = {author.slug: author for author in authors}
+
+    # The database orders the lists, as the ORM path does (its collation
+    # doesn't sort accented letters the way Python does).
+    entries = [
+        EntryRecord(pk, slug, display_name, term.lower(), category_by_pk.get(trad_term))
+        for pk, slug, display_name, term, trad_term in Entry.objects.all()
+        .order_by_abc_lowercase()
+        .values_list("pk", "slug", "display_name", "term__text", "trad_term")
+    ]
+    entry_by_pk = {entry.pk: entry for entry in entries}
+    snapshot.entries = tuple(entries)
+    snapshot.entries_by_category_order = tuple(
+        entry_by_pk[pk]
+        for pk in Entry.objects.all()
+        .order_by_abc_lowercase(["trad_term"])
+        .values_list("pk", flat=True)
+        if pk in entry_by_pk
+    )
+    snapshot.entries_by_id = tuple(sorted(entries, key=lambda entry: entry.pk))
+
+    entry_authors = {}
+    for entry_id, author_id in Entry.objects.filter(
+        cotext__reference__authors__isnull=False
+    ).values_list("pk", "cotext__reference__authors"):
+        entry_authors.setdefault(entry_id, []).append(author_id)
+    by_author, by_category = {}, {}
+    for entry in entries:
+        for author_id in entry_authors.get(entry.pk, ()):
+            by_author.setdefault(author_id, []).append(entry)
+        if entry.trad_term is not None:
+            by_category.setdefault(entry.trad_term.pk, []).append(entry)
+    snapshot.entries_by_author = {pk: tuple(e) for pk, e in by_author.items()}
+    snapshot.entries_by_category = {pk: tuple(e) for pk, e in by_category.items()}
+
+    # Kept as compressed JSON text, several times smaller than the parsed
+    # documents; decompressing and parsing one takes some 30 µs.
+    snapshot.documents = {
+        (slug, language): zlib.compress(text.encode())
+        for slug, language, text in EntryDocument.objects.annotate(
+            text=Cast("data", TextField())
+        )
+        .values_list("slug", "language", "text")
+        .iterator(chunk_size=2000)
+    }
+    return snapshot
+
+
+snapshot_bytes = metrics.Gauge(
+    "voc_snapshot_bytes",
+    "Approximate memory used by the vocabulary snapshot, by part.",
+    ["part"],
+)
+snapshot_built_at = metrics.Gauge(
+    "voc_snapshot_built_at_seconds", "When the vocabulary snapshot was built."
+)
+
+_snapshot = None
+_stale = True
+_checked_at = float("-inf")
+_lock = threading.Lock()
+_building = threading.Event()
+
+
+def refresh():
+    """Build a snapshot and swap it in."""
+    global _snapshot, _stale
+    snapshot = build()
+    for part, size in snapshot.footprint().items():
+        snapshot_bytes.set(size, part=part)
+    snapshot_built_at.set(snapshot.built_at)
+    with _lock:
+        _snapshot = snapshot
+        _stale = False
+
+
+def refresh_in_background():
+    """Run refresh() in a thread; ``_building`` is set until it's done."""
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            logger.exception("Building the vocabulary snapshot failed.")
+        finally:
+            _building.clear()
+            connections.close_all()
+
+    threading.Thread(target=run, name="voc-snapshot", daemon=True).start()
+
+
+def current():
+    """The snapshot, if it's up to date; None if the ORM has to be used."""
+    global _stale, _checked_at
+    if not settings.LEXICON_SNAPSHOT:
+        return None
+    now = time.monotonic()
+    with _lock:
+        check = now - _checked_at >= settings.LEXICON_SNAPSHOT_CHECK_INTERVAL
+        if check:
+            _checked_at = now
+    if check:
+        version = read_version()
+        with _lock:
+            _stale = _snapshot is None or _snapshot.version != version
+            rebuild = _stale and not _building.is_set()
+            if rebuild:
+                _building.set()
+        if rebuild:
+            refresh_in_background()
+    with _lock:
+        snapshot = None if _stale else _snapshot
+    metrics.record_cache("snapshot", snapshot is not None)
+    return snapshot
@@ -0,0 +1,20 @@
+// Pages are the same for every visitor, so they can be cached: the navbar
+// links of signed-in users ("Admin" instead of "Sign In") are fetched after
+// the page loads. Signing in sets a marker cookie (voc.account), signing out
+// deletes it, so the other visitors don't ask.
+(function () {
+  const links = document.querySelectorAll("[data-account-nav]");
+  const signedIn = document.cookie
+    .split("; ")
+    .some(cookie => cookie.startsWith("voc_signed_in="));
+  if (!links.length || !signedIn) {
+    return;
+  }
+  fetch(links[0].getAttribute("data-account-nav"), { credentials: "same-origin" })
+    .then(response => (response.ok ? response.text() : Promise.reject(response)))
+    .then(html => {
+      links[0].insertAdjacentHTML("beforebegin", html);
+      links.forEach(link => link.remove());
+    })
+    .catch(() => {});
+})();
@@ -1,7 +1,11 @@
+// The search URL, from the script tag, which knows the deployment's prefix.
+const SEARCH_URL = document.currentScript.getAttribute("data-url");
+
 document.addEventListener("DOMContentLoaded", function () {
   const input = document.getElementById("search-input");
   const resultsBox = document.getElementById("search-results");
   let timeout = null;
+  let controller = null;
 
   input.addEventListener("keyup", function () {
     clearTimeout(timeout);
@@ -12,11 +16,17 @@ document.addEventListener("DOMContentLoaded", function () {
     }
 
     timeout = setTimeout(() => {
-      fetch(`/search/?q=${encodeURIComponent(query)}`, {
-        headers: { "X-Requested-With": "XMLHttpRequest" }
+      // Only the latest query's results matter: drop the previous request.
+      if (controller) controller.abort();
+      controller = new AbortController();
+      fetch(`${SEARCH_URL}?q=${encodeURIComponent(query)}`, {
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+        signal: controller.signal
       })
         .then(response => response.json())
         .then(data => {
+          // Throttled: keep the results shown until the next keystroke.
+          if (data.throttled) return;
           const { results } = data;
           let html = "";
 
@@ -24,13 +34,16 @@ document.addEventListener("DOMContentLoaded", function () {
             if (items.list.length > 0) {
               html += `<h6 class="dropdown-header text-uppercase">${category}</h6>`;
               items.list.forEach(item => {
-                html += `<a class="dropdown-item" href="/${items.url}${item.slug}">${item.text}</a>`;
+                html += `<a class="dropdown-item" href="${items.url}${item.slug}">${item.text}</a>`;
               });
             }
           }
 
           resultsBox.innerHTML = html || '<span class="dropdown-item disabled">No results found</span>';
           resultsBox.style.display = "block";
+        })
+        .catch(error => {
+          if (error.name !== "AbortError") throw error;
         });
     }, 300); // debounce delay
   });
@@ -1,4 +1,84 @@
-var tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'))
-var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
-    return new bootstrap.Tooltip(tooltipTriggerEl)
-})
\ No newline at end of file
+// Tooltips are only instantiated when first hovered or focused, instead of
+// creating a Bootstrap tooltip for every element up front.
+function showTooltip(el, title) {
+  el.setAttribute("data-bs-title", title);
+  bootstrap.Tooltip.getOrCreateInstance(el).show();
+}
+
+document.addEventListener("mouseover", onTooltipTrigger);
+document.addEventListener("focusin", onTooltipTrigger);
+
+function onTooltipTrigger(e) {
+  const el = e.target.closest('[data-bs-toggle="tooltip"], [data-definition-id]');
+  if (!el || bootstrap.Tooltip.getInstance(el)) {
+    return;
+  }
+  if (el.hasAttribute("data-definition-id")) {
+    const id = el.getAttribute("data-definition-id");
+    definitions.get(id).then(text => {
+      if (text && el.matches(":hover, :focus")) {
+        showTooltip(el, text);
+      }
+    });
+  } else {
+    bootstrap.Tooltip.getOrCreateInstance(el).show();
+  }
+}
+
+// Entry definitions are fetched lazily from the definitions endpoint (the
+// script tag's data-url), in batches, and kept in a client-side cache for the
+// rest of the page's life.
+const definitions = (function () {
+  const ENDPOINT = document.currentScript.getAttribute("data-url");
+  const BATCH_SIZE = 100;
+  const BATCH_DELAY = 50;
+  const cache = new Map(); // id -> Promise of the definition text
+  const waiting = new Map(); // id -> resolve function of a pending batch
+  let timeout = null;
+
+  function flush() {
+    timeout = null;
+    const batch = new Map([...waiting].slice(0, BATCH_SIZE));
+    batch.forEach((_, id) => waiting.delete(id));
+    if (waiting.size > 0) {
+      timeout = setTimeout(flush, BATCH_DELAY);
+    }
+
+    // Sorted ids give the same URL for the same batch, so it can be cached.
+    const ids = [...batch.keys()].sort((a, b) => a - b);
+    fetch(`${ENDPOINT}?ids=${ids.join(",")}`)
+      .then(response => response.json())
+      .then(data => data.definitions)
+      .catch(() => ({}))
+      .then(defs => {
+        batch.forEach((resolve, id) => resolve(defs[id] || ""));
+      });
+  }
+
+  function get(id) {
+    if (!cache.has(id)) {
+      cache.set(id, new Promise(resolve => waiting.set(id, resolve)));
+      if (timeout === null) {
+        timeout = setTimeout(flush, BATCH_DELAY);
+      }
+    }
+    return cache.get(id);
+  }
+
+  return { get };
+})();
+
+// Prefetch the definitions of the entry links as they scroll into view, so
+// hovering them usually doesn't have to wait for the network.
+if ("IntersectionObserver" in window) {
+  const observer = new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+      if (entry.isIntersecting) {
+        definitions.get(entry.target.getAttribute("data-definition-id"));
+        observer.unobserve(entry.target);
+      }
+    });
+  }, { rootMargin: "200px" });
+
+  document.querySelectorAll("[data-definition-id]").forEach(el => observer.observe(el));
+}
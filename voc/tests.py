@@ -1,3 +1,1491 @@
-from django.test import TestCase
+"""
+Query budget regression tests, the denormalized display columns, the entry
+documents and the vocabulary snapshot.
+
+Every page is requested with a small vocabulary, then again after the
+vocabulary has grown: the number of queries it runs must not change, so a
+query per row (an N+1) fails the test and lists the queries that were run.
+"""
+
+import datetime
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import runpy
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
+from unittest import mock, skipUnless
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext, override_script_prefix
+from django.urls import resolve as resolve_url, reverse
+from django.utils import timezone
+
+from voc import (
+    account,
+    benchmarking,
+    changes,
+    corpus,
+    display,
+    documents,
+    graph,
+    health,
+    instrumentation,
+    jobs,
+    metrics,
+    readonly,
+    replicas,
+    rich_text,
+    search_cache,
+    sitemaps,
+    slow_queries,
+    snapshot,
+    throttle,
+    timeouts,
+    views,
+)
+from voc.models import (
+    Author,
+    Change,
+    Cotext,
+    Definition,
+    Entry,
+    EntryDocument,
+    EntryRelations,
+    GeneralChar,
+    GrammClass,
+    Job,
+    Reference,
+    SlowQuery,
+    SpecificChar,
+    Term,
+    TradRelation,
+    TradTerm,
+)
+
+
+PAGE_SIZES = [5, 25, 100]
+
+# Ordered so the hub has a synonym from the second entry on.
+RELATION_TYPES = ["ANTONYM", "NEAR-SYNONYM", "SYNONYM"]
+
+
+class Vocabulary:
+    """
+    Grows a vocabulary with everything the pages show. All the entries are
+    related to the first one, share its author and half share its category,
+    so the hub's pages grow with the rest of the vocabulary. Every other
+    entry is a homonym of the previous one, and every reference has several
+    authors.
+    """
+
+    def __init__(self):
+        self.counter = itertools.count(1)
+        self.gramm_class = GrammClass.objects.create(text="substantivo")
+        self.general_char = GeneralChar.objects.create(text="geral")
+        self.trad_relation = TradRelation.objects.create(text="equivalente")
+        self.hub_author = Author.objects.create(first_name="Clarice", last_name="Lispector")
+        self.hub_category = TradTerm.objects.create(text="poesia", definition="arte do verso")
+        self.hub = None
+        self.term = None
+
+    def grow(self, n):
+        for _ in range(n):
+            self.add_entry(next(self.counter))
+
+    def add_entry(self, i):
+        author = Author.objects.create(first_name=f"Nome {i}", last_name=f"Autor {i}")
+        reference = Reference.objects.create(title=f"Obra {i}", year=1900 + i)
+        reference.authors.set([self.hub_author, author])
+        cotext = Cotext.objects.create(
+            text=f'"Texto {i}"',
+            text_date=datetime.date(1900 + i, 1 + i % 12, 1 + i % 28),
+            date_granularity=i % 4,
+            reference=reference,
+            loc_in_ref=f"p. {i}",
+        )
+        if i % 2:
+            self.term = Term.objects.create(text=f"termo {i}")
+            category = TradTerm.objects.create(text=f"categoria {i}", definition="")
+        else:
+            category = self.hub_category
+
+        entry = Entry.objects.create(
+            term=self.term,
+            cotext=cotext,
+            general_char=self.general_char,
+            trad_term=category,
+            trad_relation=self.trad_relation,
+            term_gramm_class=self.gramm_class,
+        )
+        entry.term_def.set(
+            [Definition.objects.create(text=f"definição {i}.{n}") for n in range(2)]
+        )
+        entry.specific_char.set(
+            [SpecificChar.objects.create(text=f"específica {i}.{n}") for n in range(2)]
+        )
+
+        if self.hub is None:
+            self.hub = entry
+        else:
+            EntryRelations.objects.create(
+                entry=self.hub,
+                related_entry=entry,
+                type=RELATION_TYPES[i % len(RELATION_TYPES)],
+            )
+        return entry
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    # Keep the slow query sampler from adding its own queries.
+    SLOW_QUERY_THRESHOLD_MS=float("inf"),
+    # The ORM path; SnapshotTests covers the snapshot.
+    LEXICON_SNAPSHOT=False,
+)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(2)
+        self.user = get_user_model().objects.create_superuser("admin", password="x")
+
+        # Each request would log a line.
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def count_queries(self, url):
+        # A first request warms up what's cached across requests.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, url)
+        return context.captured_queries
+
+    def assertConstantQueries(self, url):
+        """
+        Assert ``url`` (or the URL it returns, if callable) runs as many
+        queries once the vocabulary has grown, and no more than the budget of
+        its view in QUERY_BUDGETS. The growth is rolled back afterwards, so
+        every check starts from the same small vocabulary.
+        """
+        resolve = url if callable(url) else lambda: url
+        term = self.vocabulary.term
+        with transaction.atomic():
+            small = self.count_queries(resolve())
+            self.vocabulary.grow(10)
+            grown = self.count_queries(resolve())
+            transaction.set_rollback(True)
+        self.vocabulary.term = term
+
+        if len(grown) != len(small):
+            queries = "\n".join(
+                f"{n}. {query['sql']}" for n, query in enumerate(grown, 1)
+            )
+            self.fail(
+                f"{resolve()} ran {len(small)} queries, "
+                f"then {len(grown)} once the vocabulary grew:\n{queries}"
+            )
+        view = resolve_url(urlsplit(resolve()).path).url_name
+        budget = settings.QUERY_BUDGETS.get(view)
+        if budget is not None:
+            self.assertLessEqual(len(grown), budget, f"{resolve()} is over its budget.")
+
+    def test_public_pages(self):
+        vocabulary = self.vocabulary
+        urls = {
+            "index": reverse("index"),
+            "entry-list": reverse("entry-list"),
+            "entry-list-by-author": reverse("entry-list")
+            + f"?author={vocabulary.hub_author.slug}",
+            "entry-detail": reverse("entry-detail", args=[vocabulary.hub.slug]),
+            "author-list": reverse("author-list"),
+            "author-entry-list": reverse(
+                "author-entry-list", args=[vocabulary.hub_author.slug]
+            ),
+            "category-list": reverse("category-list"),
+            "entry-by-category-list": reverse("entry-by-category-list"),
+            "category-entry-list": reverse(
+                "category-entry-list", args=[vocabulary.hub_category.slug]
+            ),
+            "search": reverse("search") + "?q=o",
+            "concordance": reverse("concordance") + "?q=texto",
+            "about": reverse("about"),
+            "robots": reverse("robots"),
+            "sitemap-index": reverse("sitemap-index"),
+            "sitemap-pages": reverse("sitemap-pages"),
+            "sitemap-entries": reverse("sitemap", args=["entries", 0]),
+            "sitemap-authors": reverse("sitemap", args=["authors", 0]),
+            "sitemap-categories": reverse("sitemap", args=["categories", 0]),
+            "language": reverse("language") + "?language=pt-br&next=/",
+            "account-nav": reverse("account-nav"),
+        }
+        list_views = [
+            views.EntryListView,
+            views.AuthorListView,
+            views.AuthorEntryListView,
+            views.CategoryListView,
+            views.EntryByCategoryListView,
+            views.CategoryEntryListView,
+        ]
+        for page_size in PAGE_SIZES:
+            with ExitStack() as stack:
+                for view in list_views:
+                    stack.enter_context(
+                        mock.patch.object(view, "paginate_by", page_size)
+                    )
+                for name, url in urls.items():
+                    with self.subTest(name, page_size=page_size):
+                        self.assertConstantQueries(url)
+
+    def test_account_nav_of_staff(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse("account-nav"))
+
+    def test_search_dropdown(self):
+        url = reverse("search") + "?q=o"
+        self.client.defaults["HTTP_X_REQUESTED_WITH"] = "XMLHttpRequest"
+        self.assertConstantQueries(url)
+
+    @override_settings(METRICS_TOKEN="token")
+    def test_api(self):
+        vocabulary = self.vocabulary
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer token"
+
+        def definitions_url():
+            ids = ",".join(str(pk) for pk in Entry.objects.values_list("pk", flat=True))
+            return reverse("api-definitions") + f"?ids={ids}"
+
+        def synonym_cluster_url():
+            vocabulary.hub.refresh_from_db()
+            return reverse("api-synonym-cluster", args=[vocabulary.hub.synonym_cluster])
+
+        urls = {
+            "api-metrics": reverse("api-metrics"),
+            "api-definitions": definitions_url,
+            "api-changes": reverse("api-changes") + "?since=0",
+            "api-concordance": reverse("api-concordance") + "?q=texto",
+            "api-entry-graph": reverse("api-entry-graph", args=[vocabulary.hub.slug]),
+            "api-synonym-cluster": synonym_cluster_url,
+        }
+        for name, url in urls.items():
+            with self.subTest(name):
+                self.assertConstantQueries(url)
+
+    @skipUnless(connection.vendor == "postgresql", "reads PostgreSQL statistics")
+    def test_api_status(self):
+        self.assertConstantQueries(reverse("api-status"))
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.user)
+        for model in [Entry, Cotext, EntryRelations]:
+            model_admin = admin.site._registry[model]
+            url = reverse(f"admin:voc_{model._meta.model_name}_changelist")
+            for page_size in PAGE_SIZES:
+                with (
+                    self.subTest(model.__name__, page_size=page_size),
+                    mock.patch.object(model_admin, "list_per_page", page_size),
+                ):
+                    self.assertConstantQueries(url)
+
+
+class DisplayColumnsTests(TestCase):
+    def test_columns_follow_changes(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(2)
+        entry, homonym = Entry.objects.order_by("pk")
+        reference = homonym.cotext.reference
+        self.assertEqual(
+            (entry.display_name, entry.homonym_count, homonym.display_name),
+            ("termo 1¹", 2, "termo 1²"),
+        )
+        self.assertEqual(reference.authors_display, "Lispector, Clarice & Autor 2, Nome 2")
+
+        vocabulary.term.text = "termo"
+        vocabulary.term.save()
+        homonym.delete()
+        entry.refresh_from_db()
+        self.assertEqual((entry.display_name, entry.homonym_count), ("termo", 1))
+
+        vocabulary.hub_author.full_name = "Clarice"
+        vocabulary.hub_author.save()
+        reference.authors.remove(reference.authors.exclude(pk=vocabulary.hub_author.pk).get())
+        reference.refresh_from_db()
+        self.assertEqual(reference.authors_display, "Clarice")
+        self.assertEqual(display.check(), [])
+
+    def test_check_fixes_bulk_updates(self):
+        Vocabulary().grow(2)
+        Entry.objects.update(display_name="")
+        self.assertEqual(len(display.check()), 2)
+        display.check(fix=True)
+        self.assertEqual(display.check(), [])
+
+
+class RichTextTests(TestCase):
+    def test_markdown_is_rendered_on_save_and_sanitized(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(1)
+        author = vocabulary.hub_author
+        author.description = "Escritora *brasileira* <script>alert(1)</script>"
+        author.save()
+        self.assertEqual(
+            Author.objects.get(pk=author.pk).description_html,
+            "Escritora <em>brasileira</em> &lt;script&gt;alert(1)&lt;/script&gt;",
+        )
+
+        entry = vocabulary.hub
+        entry.note = "[um](https://example.com) [dois](java\tscript:alert(1))\n\nOutro parágrafo."
+        entry.save(update_fields=["note"])
+        entry.refresh_from_db()
+        self.assertEqual(
+            entry.note_html,
+            '<p><a href="https://example.com">um</a> <a>dois</a></p>\n<p>Outro parágrafo.</p>',
+        )
+        self.assertEqual(rich_text.check(), [])
+
+    def test_check_renders_bulk_updates(self):
+        Vocabulary().grow(2)
+        TradTerm.objects.update(definition="**arte**")
+        self.assertEqual(len(rich_text.check()), TradTerm.objects.count())
+        rich_text.check(fix=True)
+        self.assertEqual(rich_text.check(), [])
+        self.assertEqual(TradTerm.objects.first().definition_html, "<strong>Arte</strong>")
+
+    def test_capitalized_before_rendering(self):
+        category = TradTerm.objects.create(text="prosa", definition="[*é* arte](https://example.com)")
+        self.assertEqual(
+            category.definition_html, '<a href="https://example.com"><em>É</em> arte</a>'
+        )
+
+    def test_generated_corpus_is_rendered(self):
+        corpus.generate(20, log=lambda message: None)
+        self.assertEqual(rich_text.check(), [])
+        self.assertEqual(EntryDocument.objects.count(), Entry.objects.count() * len(settings.LANGUAGES))
+
+
+@override_settings(LEXICON_SNAPSHOT=False)
+class EntryDocumentTests(TestCase):
+    def setUp(self):
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_detail_page_is_one_query(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(4)
+        url = reverse("entry-detail", args=[vocabulary.hub.slug])
+        self.client.get(url)  # Builds the missing document.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertContains(response, str(vocabulary.hub))
+
+    def test_build_queries_dont_grow(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(2)
+        with CaptureQueriesContext(connection) as small:
+            documents.build(Entry.objects.values_list("pk", flat=True))
+        vocabulary.grow(10)
+        with CaptureQueriesContext(connection) as grown:
+            documents.build(Entry.objects.values_list("pk", flat=True))
+        self.assertEqual(len(small), len(grown))
+
+    def test_rebuilt_on_commit(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(3)
+        documents.build(Entry.objects.values_list("pk", flat=True))
+        hub_reference = vocabulary.hub.cotext.reference
+
+        with (
+            mock.patch.object(documents, "build", wraps=documents.build) as build,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            vocabulary.hub_author.full_name = "C. Lispector"
+            vocabulary.hub_author.save()
+            hub_reference.citation = "LISPECTOR, C."
+            hub_reference.save()
+            build.assert_not_called()
+        # Once per change, each over every entry showing the reference.
+        self.assertEqual(build.call_count, 2)
+        entry_ids = sorted(Entry.objects.values_list("pk", flat=True))
+        for call in build.call_args_list:
+            self.assertEqual(sorted(call.args[0]), entry_ids)
+
+        for document in EntryDocument.objects.all():
+            self.assertIn("C. Lispector", document.data["author"]["name"])
+            for related in document.data["related_entries"]:
+                self.assertIn("C. Lispector", related["author"]["name"])
+        hub = EntryDocument.objects.get(entry=vocabulary.hub, language="en-us")
+        self.assertEqual(hub.data["citation_html"], "LISPECTOR, C.")
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(12)
+        documents.build(Entry.objects.values_list("pk", flat=True))
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_pages_match_the_orm(self):
+        vocabulary = self.vocabulary
+        urls = [
+            reverse("entry-list"),
+            reverse("entry-list") + f"?author={vocabulary.hub_author.slug}",
+            reverse("entry-list") + f"?category={vocabulary.hub_category.slug}",
+            reverse("entry-detail", args=[vocabulary.hub.slug]),
+            reverse("author-list"),
+            reverse("author-entry-list", args=[vocabulary.hub_author.slug]),
+            reverse("category-list"),
+            reverse("entry-by-category-list"),
+            reverse("category-entry-list", args=[vocabulary.hub_category.slug]),
+            reverse("search") + "?q=termo",
+        ]
+        lexicon = snapshot.build()
+        for url in urls:
+            with self.subTest(url):
+                expected = self.client.get(url)
+                with (
+                    mock.patch.object(snapshot, "current", return_value=lexicon),
+                    self.assertNumQueries(0),
+                ):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+        with mock.patch.object(snapshot, "current", return_value=lexicon):
+            self.assertEqual(self.client.get(reverse("entry-list") + "?author=x").status_code, 404)
+
+    def test_stale_snapshot_falls_back_to_the_orm(self):
+        refresh_in_background = mock.Mock()
+        with (
+            override_settings(LEXICON_SNAPSHOT=True, LEXICON_SNAPSHOT_CHECK_INTERVAL=0),
+            mock.patch.object(snapshot, "refresh_in_background", refresh_in_background),
+            mock.patch.object(snapshot, "_building", threading.Event()),
+            mock.patch.object(snapshot, "_snapshot", None),
+            mock.patch.object(snapshot, "_stale", True),
+        ):
+            # No snapshot yet: the ORM serves the request while it's built.
+            self.assertIsNone(snapshot.current())
+            refresh_in_background.assert_called_once()
+            snapshot._building.clear()
+            snapshot.refresh()
+            self.assertIsNotNone(snapshot.current())
+
+            self.vocabulary.grow(1)
+            self.assertIsNone(snapshot.current())
+            self.assertEqual(refresh_in_background.call_count, 2)
+
+
+class ReadOnlyDatabaseTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(4)
+        documents.build(Entry.objects.values_list("pk", flat=True))
+
+    def test_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "readonly.sqlite3")
+            readonly.export(path, batch_size=3, log=lambda message: None)
+            with closing(sqlite3.connect(path)) as copy:
+                copy.create_collation(readonly.COLLATION, readonly.collate)
+                for model in readonly.MODELS:
+                    table = model._meta.db_table
+                    (count,) = copy.execute(f"SELECT count(*) FROM {table}").fetchone()
+                    self.assertEqual(count, model._base_manager.count(), table)
+                version = copy.execute(f"SELECT * FROM {readonly.VERSION_TABLE}").fetchone()
+        self.assertEqual(version, snapshot.read_version())
+
+    def test_anonymous_reads_use_the_copy_while_its_fresh(self):
+        router = readonly.ReadOnlyRouter()
+        with mock.patch.object(readonly, "fresh", return_value=True):
+            self.assertIsNone(router.db_for_read(Entry))
+            with readonly.reading():
+                self.assertEqual(router.db_for_read(Entry), readonly.ALIAS)
+                self.assertEqual(router.db_for_read(EntryDocument), readonly.ALIAS)
+                # Not in the copy.
+                self.assertIsNone(router.db_for_read(get_user_model()))
+                self.assertIsNone(router.db_for_write(Entry))
+        with mock.patch.object(readonly, "fresh", return_value=False), readonly.reading():
+            self.assertIsNone(router.db_for_read(Entry))
+
+    def test_fresh_until_the_database_changes(self):
+        with (
+            override_settings(READONLY_DB_CHECK_INTERVAL=0),
+            mock.patch.object(readonly, "available", return_value=True),
+            mock.patch.object(readonly, "_exported_version", snapshot.read_version()),
+        ):
+            self.assertTrue(readonly.fresh())
+            self.vocabulary.grow(1)
+            self.assertFalse(readonly.fresh())
+
+    def test_export_fails_over_the_size_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "readonly.sqlite3")
+            with (
+                override_settings(READONLY_DB=path, READONLY_DB_MAX_SIZE=1000),
+                self.assertRaisesMessage(CommandError, "over READONLY_DB_MAX_SIZE"),
+            ):
+                call_command("export_readonly_db", stdout=io.StringIO())
+            self.assertFalse(os.path.exists(path))
+
+    def test_accented_letters_match_and_sort_as_in_the_database(self):
+        Term.objects.filter(text="termo 1").update(text="Étimo")
+        for text in ["etapa", "éter", "fim"]:
+            Term.objects.create(text=text)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "readonly.sqlite3")
+            readonly.export(path, log=lambda message: None)
+            alias = f"{readonly.ALIAS}_copy"
+            wrapper_class = type(connections[readonly.ALIAS])
+            connections[alias] = wrapper_class(
+                {**connections[readonly.ALIAS].settings_dict, "NAME": path, "OPTIONS": {}},
+                alias,
+            )
+            try:
+                terms = Term.objects.using(alias)
+                self.assertEqual(
+                    list(terms.filter(text__icontains="ÉT").values_list("text", flat=True)),
+                    ["éter", "Étimo"],
+                )
+                self.assertEqual(
+                    list(terms.order_by("text").values_list("text", flat=True)),
+                    ["etapa", "éter", "Étimo", "fim", "termo 3"],
+                )
+                entries = Entry.objects.using(alias).order_by_abc_lowercase()
+                self.assertEqual(
+                    list(entries.values_list("term__text", flat=True)),
+                    ["Étimo", "Étimo", "termo 3", "termo 3"],
+                )
+            finally:
+                connections[alias].close()
+                del connections[alias]
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+    REPLICA_ALIASES=["replica"],
+    REPLICA_LAG_CHECK_INTERVAL=0,
+)
+class ReplicaTests(TestCase):
+    def setUp(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(2)
+
+        # A second local database, holding the vocabulary as it was.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "replica.sqlite3")
+        readonly.export(path, log=lambda message: None)
+        wrapper_class = type(connections[readonly.ALIAS])
+        connections["replica"] = wrapper_class(
+            {**connections[readonly.ALIAS].settings_dict, "NAME": path, "OPTIONS": {}},
+            "replica",
+        )
+        self.addCleanup(connections.__delitem__, "replica")
+        self.addCleanup(connections["replica"].close)
+
+        # Not replicated yet.
+        vocabulary.add_entry(99)
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_reads_go_to_the_replica(self):
+        for url in [reverse("entry-list"), reverse("search") + "?q=termo"]:
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertContains(response, "termo 1")
+                self.assertNotContains(response, "termo 99")
+
+    def test_writer_reads_from_the_primary(self):
+        response = self.client.post(reverse("set_language"), {"language": "en-us"})
+        self.assertIn(replicas.WRITE_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse("entry-list")), "termo 99")
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(replicas, "lag", return_value=60.0):
+            self.assertContains(self.client.get(reverse("entry-list")), "termo 99")
+
+    def test_replica_settings(self):
+        path = os.path.join(settings.BASE_DIR, "config", "settings.py")
+        with mock.patch.dict(os.environ, {"POSTGRES_REPLICA_HOSTS": "h1, h2:6432"}):
+            replica_settings = runpy.run_path(path)
+        self.assertEqual(replica_settings["REPLICA_ALIASES"], ["replica1", "replica2"])
+        databases = replica_settings["DATABASES"]
+        self.assertEqual(databases["replica1"]["HOST"], "h1")
+        self.assertEqual(
+            (databases["replica2"]["HOST"], databases["replica2"]["PORT"]), ("h2", "6432")
+        )
+        # The translations of the languages still load.
+        self.assertTrue(all(str(name) for code, name in replica_settings["LANGUAGES"]))
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class PublicPageTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(2)
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_pages_are_the_same_for_everyone_and_cacheable(self):
+        url = reverse("entry-list")
+        with CaptureQueriesContext(connection) as queries:
+            anonymous = self.client.get(url)
+        self.assertFalse(anonymous.cookies)
+        self.assertIn("public", anonymous["Cache-Control"])
+        self.assertIn("Cookie", anonymous["Vary"])
+        self.assertNotContains(anonymous, "csrfmiddlewaretoken")
+        self.assertFalse(
+            [query for query in queries if "django_session" in query["sql"]]
+        )
+
+        staff = get_user_model().objects.create_superuser("admin", password="x")
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).content, anonymous.content)
+
+    def test_account_nav(self):
+        url = reverse("account-nav")
+        self.assertContains(self.client.get(url), "Sign In")
+        staff = get_user_model().objects.create_superuser("admin", password="x")
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertContains(response, reverse("admin:index"))
+        self.assertNotContains(response, "Sign In")
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_signed_in_cookie(self):
+        get_user_model().objects.create_superuser("admin", password="x")
+        response = self.client.post(
+            reverse("admin:login"), {"username": "admin", "password": "x"}
+        )
+        cookie = response.cookies[account.SIGNED_IN_COOKIE]
+        self.assertEqual(cookie.value, "1")
+        self.assertFalse(cookie["httponly"])
+        self.assertTrue(response.cookies[settings.SESSION_COOKIE_NAME]["httponly"])
+        # Public pages leave it alone.
+        self.assertNotIn(account.SIGNED_IN_COOKIE, self.client.get(reverse("about")).cookies)
+
+        response = self.client.post(reverse("admin:logout"))
+        self.assertEqual(response.cookies[account.SIGNED_IN_COOKIE]["max-age"], 0)
+
+    def test_scripts_get_their_urls(self):
+        url = reverse("about")
+        search_url = reverse("search")
+        with override_script_prefix("/vocabulario/"):
+            response = self.client.get(url)
+            dropdown = self.client.get(
+                search_url, {"q": "o"}, headers={"X-Requested-With": "XMLHttpRequest"}
+            )
+        self.assertContains(response, 'data-url="/vocabulario/api/definitions/"')
+        self.assertContains(response, 'data-url="/vocabulario/search/"')
+        self.assertEqual(
+            {category["url"] for category in dropdown.json()["results"].values()},
+            {
+                "/vocabulario/entries/",
+                "/vocabulario/entries/?author=",
+                "/vocabulario/entries/?category=",
+            },
+        )
+
+    def test_set_language(self):
+        url = reverse("language")
+        response = self.client.get(url, {"language": "pt-br", "next": "/authors/"})
+        self.assertRedirects(response, "/authors/", fetch_redirect_response=False)
+        self.assertEqual(response.cookies[settings.LANGUAGE_COOKIE_NAME].value, "pt-br")
+
+        response = self.client.get(url, {"language": "xx", "next": "https://example.com/"})
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        self.assertNotIn(settings.LANGUAGE_COOKIE_NAME, response.cookies)
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class StatementTimeoutTests(TestCase):
+    def setUp(self):
+        Vocabulary().grow(2)
+        cache.clear()
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def timing_out(self):
+        return mock.patch.object(
+            timeouts, "limit", side_effect=timeouts.QueryTimeout("test")
+        )
+
+    def test_lists_fall_back_to_their_last_copy(self):
+        url = reverse("entry-list")
+        rendered = self.client.get(url)
+        with self.timing_out():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, rendered.content)
+            self.assertIn("no-cache", response["Cache-Control"])
+
+            response = self.client.get(reverse("author-list"))
+            self.assertEqual(response.status_code, 503)
+
+    def test_fallback_is_kept_by_validated_parameters(self):
+        url = reverse("entry-list")
+        category = TradTerm.objects.get(text="poesia").slug
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            rendered = self.client.get(url, {"category": category, "utm_source": "x"})
+            self.client.get(url, {"category": category, "page": 1})
+        self.assertEqual(cache_set.call_count, 1)
+
+        with self.timing_out():
+            response = self.client.get(url, {"page": "1", "category": category, "ref": "y"})
+            self.assertEqual(response.content, rendered.content)
+            self.assertEqual(self.client.get(url).status_code, 503)
+
+    def test_search_leaves_out_cancelled_lookups(self):
+        with self.timing_out():
+            response = self.client.get(reverse("search"), {"q": "termo"})
+        self.assertEqual(response.context["partial"], ["entries", "authors", "categories"])
+        self.assertContains(response, "left out")
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    @skipUnless(connection.vendor == "postgresql", "uses PostgreSQL's statement_timeout")
+    def test_slow_query_is_cancelled(self):
+        counts = timeouts.statement_timeouts.values
+        before = counts.get(("slow",), 0)
+        with (
+            override_settings(STATEMENT_TIMEOUTS={"slow": 10}),
+            self.assertRaises(timeouts.QueryTimeout),
+            timeouts.limit("slow", Entry),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute("SELECT pg_sleep(1)")
+        self.assertEqual(counts[("slow",)], before + 1)
+
+
+@override_settings(LEXICON_SNAPSHOT=False)
+class SearchTimeBudgetTests(TransactionTestCase):
+    # Committed rows, since the lookups run on connections of their own.
+
+    def setUp(self):
+        Vocabulary().grow(2)
+        cache.clear()
+        search_cache.cache.clear()
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_slow_lookup_is_left_out_within_the_budget(self):
+        released = threading.Event()
+        self.addCleanup(released.set)
+
+        def slow_entries(query):
+            released.wait(5)
+            return []
+
+        with (
+            mock.patch.object(views, "SEARCH_TIME_BUDGET", 0.5),
+            mock.patch.object(views, "search_entries", slow_entries),
+        ):
+            start = time.monotonic()
+            response = self.client.get(reverse("search"), {"q": "1"})
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 2)
+        self.assertEqual(response.context["partial"], ["entries"])
+        results = response.context["results"]
+        self.assertEqual([category.text for category in results["categories"]], ["categoria 1"])
+        self.assertEqual(results["entries"], [])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_lookups_waiting_for_a_connection_are_dropped_at_the_budget(self):
+        # Every search thread (and so every pooled connection they may use)
+        # is taken.
+        released = threading.Event()
+        self.addCleanup(released.set)
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        executor.submit(released.wait, 5)
+
+        lookup = mock.Mock(return_value=[])
+        with (
+            mock.patch.object(views, "SEARCH_TIME_BUDGET", 0.5),
+            mock.patch.object(views, "search_executor", executor),
+            mock.patch.multiple(
+                views, search_entries=lookup, search_authors=lookup, search_categories=lookup
+            ),
+        ):
+            start = time.monotonic()
+            response = self.client.get(reverse("search"), {"q": "1"})
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 2)
+        self.assertEqual(response.context["partial"], ["entries", "authors", "categories"])
+        released.set()
+        executor.shutdown()
+        lookup.assert_not_called()
+
+    def test_queries_of_the_lookups_are_counted(self):
+        with (
+            mock.patch.object(logging.getLogger("voc.requests"), "disabled", False),
+            self.assertLogs("voc.requests", "INFO") as logs,
+        ):
+            self.client.get(reverse("search"), {"q": "1"})
+        record = json.loads(logs.records[-1].getMessage())
+        # One query per lookup, in the search threads.
+        self.assertGreaterEqual(record["queries"], 3)
+
+    def test_threads_fit_in_the_pool(self):
+        path = os.path.join(settings.BASE_DIR, "config", "settings.py")
+        with mock.patch.dict(os.environ, {"POSTGRES_POOL_MAX_SIZE": "6"}):
+            self.assertEqual(runpy.run_path(path)["SEARCH_THREADS"], 5)
+        with mock.patch.dict(os.environ, {"POSTGRES_POOL_MAX_SIZE": "1"}):
+            self.assertEqual(runpy.run_path(path)["SEARCH_THREADS"], 1)
+
+
+@mock.patch.object(sitemaps, "CHUNK_SIZE", 2)
+class SitemapTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(5)
+        cache.clear()
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def chunk_urls(self):
+        index = self.client.get(reverse("sitemap-index")).content.decode()
+        return re.findall(r"<loc>http://testserver(/sitemap-entries-\d+\.xml)</loc>", index)
+
+    def test_every_entry_is_listed(self):
+        urls = self.chunk_urls()
+        self.assertEqual(len(urls), len({entry.pk // 2 for entry in Entry.objects.all()}))
+        content = "".join(self.client.get(url).content.decode() for url in urls)
+        for entry in Entry.objects.all():
+            self.assertIn(entry.get_absolute_url(), content)
+            self.assertIn(entry.updated_at.isoformat(), content)
+        self.assertEqual(self.client.get(reverse("sitemap", args=["entries", 99])).status_code, 404)
+
+    def test_only_changed_chunks_are_rendered_again(self):
+        urls = self.chunk_urls()
+        for url in urls:
+            self.client.get(url)
+        entry = Entry.objects.order_by("pk").last()
+        entry.note = "nova nota"
+        entry.save()
+
+        with mock.patch.object(
+            sitemaps.Section, "render", autospec=True, side_effect=sitemaps.Section.render
+        ) as render:
+            for url in urls:
+                self.client.get(url)
+        render.assert_called_once_with(mock.ANY, entry.pk // 2, mock.ANY)
+
+    def test_renamed_authors_are_listed_again(self):
+        author = Author.objects.order_by("pk").last()
+        url = reverse("sitemap", args=["authors", author.pk // 2])
+        self.assertContains(self.client.get(url), author.slug)
+        old_slug, author.slug = author.slug, "outro-nome"
+        author.save()
+        content = self.client.get(url).content.decode()
+        self.assertIn("outro-nome", content)
+        self.assertNotIn(old_slug, content)
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class SearchThrottleAndCacheTests(TestCase):
+    def setUp(self):
+        Vocabulary().grow(12)
+        self.client.defaults["HTTP_X_REQUESTED_WITH"] = "XMLHttpRequest"
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def search(self, query, **extra):
+        return self.client.get(reverse("search"), {"q": query}, **extra)
+
+    def test_fast_clients_are_throttled(self):
+        with mock.patch.object(views, "search_throttle", throttle.TokenBucket(1, 2)):
+            statuses = [self.search("termo").status_code for _ in range(2)]
+            throttled = self.search("termo")
+            other = self.search("termo", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(throttled.status_code, 429)
+        self.assertTrue(throttled.json()["throttled"])
+        self.assertEqual(throttled["Retry-After"], "1")
+        self.assertEqual(other.status_code, 200)
+
+    def test_longer_queries_are_narrowed_from_the_cache(self):
+        self.search("termo")
+        with self.assertNumQueries(0):
+            narrowed = self.search("Termo  1").json()
+            cached = self.search("termo 1").json()
+        search_cache.cache.clear()
+        self.assertEqual(narrowed, self.search("termo 1").json())
+        self.assertEqual(narrowed, cached)
+        self.assertEqual(
+            [item["text"] for item in narrowed["results"]["entries"]["list"]],
+            ["termo 1¹", "termo 1²", "termo 11¹", "termo 11²"],
+        )
+
+    def test_changes_empty_the_cache(self):
+        self.search("termo")
+        Term.objects.create(text="termo novo")
+        with CaptureQueriesContext(connection) as queries:
+            self.search("termo")
+        self.assertTrue(queries)
+
+
+class BackgroundJobTests(TestCase):
+    def test_edits_queue_one_job_per_target(self):
+        vocabulary = Vocabulary()
+        with (
+            override_settings(BACKGROUND_JOBS=True),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            vocabulary.grow(2)
+            vocabulary.hub.note = "nota"
+            vocabulary.hub.save()
+        with (
+            override_settings(BACKGROUND_JOBS=True),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            Entry.objects.order_by("pk").first().delete()
+        self.assertFalse(EntryDocument.objects.exists())
+        queued = list(Job.objects.values_list("task", "key"))
+        self.assertEqual(len(queued), len(set(queued)))
+        self.assertIn(("homonyms", str(vocabulary.term.pk)), queued)
+
+        self.assertEqual(jobs.work(100), len(queued))
+        self.assertFalse(Job.objects.exists())
+        remaining = Entry.objects.get()
+        self.assertEqual(remaining.homonym_number, 1)
+        self.assertTrue(EntryDocument.objects.filter(entry=remaining).exists())
+
+    def test_rolled_back_keys_are_dropped(self):
+        task = mock.Mock()
+        with mock.patch.dict(jobs.TASKS, {"task": task}):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("task", [1])
+                with transaction.atomic():
+                    jobs.enqueue("task", [2])
+                    transaction.set_rollback(True)
+                jobs.enqueue("task", [3, 1])
+            self.assertEqual(task.call_args_list, [mock.call(["1"]), mock.call(["1", "3"])])
+
+            task.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    jobs.enqueue("task", [4])
+                    transaction.set_rollback(True)
+            task.assert_not_called()
+
+        with override_settings(BACKGROUND_JOBS=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("task", [1])
+                with transaction.atomic():
+                    jobs.enqueue("task", [2])
+                    transaction.set_rollback(True)
+                jobs.enqueue("task", [3, 1])
+        self.assertEqual(sorted(Job.objects.values_list("key", flat=True)), ["1", "3"])
+
+    @override_settings(BACKGROUND_JOBS=True, JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=10)
+    def test_failed_jobs_are_retried_later_then_kept(self):
+        task = mock.Mock(side_effect=ValueError("boom"))
+        with (
+            mock.patch.dict(jobs.TASKS, {"boom": task}),
+            mock.patch.object(jobs.logger, "disabled", True),
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("boom", [1])
+            jobs.work(10)
+            job = Job.objects.get()
+            self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=9))
+            self.assertEqual(jobs.work(10), 0)
+
+            Job.objects.update(run_after=timezone.now())
+            jobs.work(10)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+            self.assertIn("boom", job.last_error)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                jobs.enqueue("boom", [1])
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+        self.assertEqual(task.call_count, 2)
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class ConcordanceTests(TestCase):
+    def setUp(self):
+        self.vocabulary = Vocabulary()
+        self.vocabulary.grow(3)
+        Cotext.objects.filter(pk=self.vocabulary.hub.cotext_id).update(
+            text='"A escrita, escritas e a Escrita de novo."'
+        )
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def api(self, **params):
+        return self.client.get(reverse("api-concordance"), params)
+
+    def test_lines_of_whole_words_with_their_context(self):
+        data = self.api(q="escrita", window=5).json()
+        self.assertEqual(
+            [(line["left"], line["keyword"], line["right"]) for line in data["lines"]],
+            [('"A ', "escrita", ", esc"), (" e a ", "Escrita", " de n")],
+        )
+        line = data["lines"][0]
+        self.assertEqual(line["cotext"], self.vocabulary.hub.cotext_id)
+        self.assertEqual(line["entries"][0]["slug"], self.vocabulary.hub.slug)
+        self.assertFalse(data["has_more"])
+
+        self.assertEqual(self.api(q="es").status_code, 400)
+        self.assertEqual(self.api(q="texto", **{"from": "nunca"}).status_code, 400)
+
+    def test_pages_and_filters(self):
+        cotexts = list(Cotext.objects.filter(text__startswith='"Texto').order_by("pk"))
+        first = self.api(q="texto", limit=1).json()
+        self.assertEqual([line["cotext"] for line in first["lines"]], [cotexts[0].pk])
+        self.assertTrue(first["has_more"])
+        rest = self.api(q="texto", after=first["next"]).json()
+        self.assertEqual([line["cotext"] for line in rest["lines"]], [c.pk for c in cotexts[1:]])
+
+        last = cotexts[-1]
+        by_reference = self.api(q="texto", reference=last.reference_id).json()
+        self.assertEqual([line["cotext"] for line in by_reference["lines"]], [last.pk])
+        by_date = self.api(q="texto", **{"from": last.text_date.isoformat()}).json()
+        self.assertEqual([line["cotext"] for line in by_date["lines"]], [last.pk])
+        author = last.reference.authors.exclude(pk=self.vocabulary.hub_author.pk).get()
+        by_author = self.api(q="texto", author=author.slug).json()
+        self.assertEqual([line["cotext"] for line in by_author["lines"]], [last.pk])
+
+    def test_pages_are_full_despite_partial_words(self):
+        self.vocabulary.grow(3)
+        cotexts = list(Cotext.objects.filter(text__startswith='"Texto').order_by("pk"))
+        # Found by icontains, but not whole words.
+        Cotext.objects.filter(pk__in=[c.pk for c in cotexts[:3]]).update(text='"Textos"')
+        first = self.api(q="texto", limit=1).json()
+        self.assertEqual([line["cotext"] for line in first["lines"]], [cotexts[3].pk])
+        self.assertTrue(first["has_more"])
+        rest = self.api(q="texto", limit=1, after=first["next"]).json()
+        self.assertEqual([line["cotext"] for line in rest["lines"]], [cotexts[4].pk])
+        self.assertFalse(rest["has_more"])
+
+    def test_page(self):
+        response = self.client.get(reverse("concordance"), {"q": "escrita"})
+        self.assertContains(response, "<strong>Escrita</strong>", html=True)
+        self.assertEqual(self.client.get(reverse("concordance")).status_code, 200)
+
+        # Without the snapshot, the author filter keeps its value.
+        author = self.vocabulary.hub_author.slug
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("concordance"), {"q": "escrita", "author": author})
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["concordance"])
+        self.assertContains(response, f'<option value="{author}" selected>{author}</option>', html=True)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def record(self, transaction_id):
+        return Change.objects.create(
+            model="voc.term", object_id=1, action=Change.UPDATE, transaction_id=transaction_id
+        )
+
+    def test_late_commits_are_not_skipped(self):
+        first = self.record(10)
+        # Transaction 11 is still running when 12 commits.
+        second = self.record(12)
+        page, has_more = changes.page((0, 0), 10, horizon=11)
+        self.assertEqual((page, has_more), ([first], False))
+
+        # 11 commits last, with the highest id, but comes before 12.
+        late = self.record(11)
+        self.assertGreater(late.pk, second.pk)
+        page, has_more = changes.page((10, first.pk), 10, horizon=13)
+        self.assertEqual(page, [late, second])
+
+    def test_feed(self):
+        older = self.record(0)
+        recorded = [self.record(5), self.record(5)]
+        url = reverse("api-changes")
+        with self.assertNumQueries(settings.QUERY_BUDGETS["api-changes"]):
+            data = self.client.get(url, {"since": older.pk, "limit": 1}).json()
+        self.assertEqual(data["next"], f"5:{recorded[0].pk}")
+        self.assertTrue(data["has_more"])
+        data = self.client.get(url, {"since": data["next"]}).json()
+        self.assertEqual([change["cursor"] for change in data["changes"]], [f"5:{recorded[1].pk}"])
+        self.assertEqual(data["next"], data["changes"][-1]["cursor"])
+        self.assertEqual(self.client.get(url, {"since": "a:1"}).status_code, 400)
+
+
+class SlowQueryTests(TestCase):
+    SQL = "SELECT * FROM voc_term WHERE text = 'a''b' AND id IN (%s, %s, %s) LIMIT 21"
+
+    def test_fingerprint_ignores_literals(self):
+        normalized = slow_queries.normalize_sql(self.SQL)
+        self.assertEqual(
+            normalized, "SELECT * FROM voc_term WHERE text = ? AND id IN (...) LIMIT ?"
+        )
+        other = slow_queries.normalize_sql(self.SQL.replace("21", "100").replace("'a''b'", "'c'"))
+        self.assertEqual(
+            slow_queries.fingerprint(normalized, "voc/views.py:1 in f"),
+            slow_queries.fingerprint(other, "voc/views.py:1 in f"),
+        )
+        self.assertNotEqual(
+            slow_queries.fingerprint(normalized, "voc/views.py:1 in f"),
+            slow_queries.fingerprint(normalized, "voc/views.py:2 in g"),
+        )
+
+    @override_settings(BACKGROUND_JOBS=True, SLOW_QUERY_EXPLAIN_RATE=1, SLOW_QUERY_BUFFER_SIZE=2)
+    def test_plans_are_captured_by_a_job(self):
+        queries = [
+            ("SELECT 1 WHERE 1 = %s", (1,), 0.5, "voc/views.py:1 in f", "default"),
+            ("UPDATE voc_term SET text = %s", ("x",), 0.2, "voc/views.py:2 in g", "default"),
+            ("SELECT 2", (), 0.3, "voc/views.py:3 in h", readonly.ALIAS),
+        ]
+        with mock.patch.object(slow_queries, "explain", return_value="plan") as explain:
+            with self.captureOnCommitCallbacks(execute=True):
+                slow_queries.save(queries, "entry-list")
+            saved = list(SlowQuery.objects.order_by("pk"))
+            self.assertEqual([query.duration for query in saved], [500, 200, 300])
+            self.assertEqual(
+                [query.to_explain for query in saved],
+                [["SELECT 1 WHERE 1 = %s", [1]], None, ["SELECT 2", []]],
+            )
+            explain.assert_not_called()
+            self.assertEqual(Job.objects.filter(task="slow-queries").count(), 3)
+
+            jobs.work(10)
+        explain.assert_has_calls(
+            [mock.call("SELECT 1 WHERE 1 = %s", [1], "default"), mock.call("SELECT 2", [], readonly.ALIAS)]
+        )
+        # Trimmed to the last SLOW_QUERY_BUFFER_SIZE.
+        kept = list(SlowQuery.objects.order_by("pk"))
+        self.assertEqual([query.pk for query in kept], [query.pk for query in saved[1:]])
+        self.assertEqual([(query.explain, query.to_explain) for query in kept], [("", None), ("plan", None)])
+
+    def test_no_plans_without_a_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            slow_queries.save([("SELECT 1", (), 0.5, "voc/views.py:1 in f", "default")], "search")
+        self.assertIsNone(SlowQuery.objects.get().to_explain)
+        self.assertFalse(Job.objects.exists())
+
+
+class GraphTests(TestCase):
+    def setUp(self):
+        vocabulary = Vocabulary()
+        vocabulary.grow(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryRelations.objects.all().delete()
+        self.entries = list(Entry.objects.order_by("pk").values_list("pk", flat=True))
+        e = self.entries
+        # A synonym chain with an antonym shortcut, then a near-synonym.
+        for a, b, type in [
+            (e[0], e[1], "SYNONYM"),
+            (e[1], e[2], "SYNONYM"),
+            (e[0], e[2], "ANTONYM"),
+            (e[2], e[3], "SYNONYM"),
+            (e[3], e[4], "NEAR-SYNONYM"),
+        ]:
+            # Saving a relation creates its symmetrical one.
+            EntryRelations.objects.create(entry_id=a, related_entry_id=b, type=type)
+
+    def test_neighborhood(self):
+        e = self.entries
+        self.assertEqual(graph.neighborhood(e[0], 1), {e[0]: 0, e[1]: 1, e[2]: 1})
+        self.assertEqual(
+            graph.neighborhood(e[0], 3), {e[0]: 0, e[1]: 1, e[2]: 1, e[3]: 2, e[4]: 3}
+        )
+        self.assertEqual(
+            graph.neighborhood(e[0], 4, ["SYNONYM"]), {e[0]: 0, e[1]: 1, e[2]: 2, e[3]: 3}
+        )
+        self.assertEqual(graph.neighborhood(e[0], 4, limit=2), {e[0]: 0, e[1]: 1})
+        self.assertEqual(graph.neighborhood(e[4], 0), {e[4]: 0})
+
+    def test_synonym_clusters(self):
+        self.assertEqual(
+            graph.compute_clusters([(1, 2), (3, 4), (2, 3), (6, 5)]),
+            {1: 1, 2: 1, 3: 1, 4: 1, 5: 5, 6: 5},
+        )
+        e = self.entries
+        clusters = dict(Entry.objects.values_list("pk", "synonym_cluster"))
+        self.assertEqual(clusters, {e[0]: e[0], e[1]: e[0], e[2]: e[0], e[3]: e[0], e[4]: None})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryRelations.objects.filter(
+                entry__in=[e[1], e[2]], related_entry__in=[e[1], e[2]]
+            ).delete()
+        clusters = dict(Entry.objects.values_list("pk", "synonym_cluster"))
+        self.assertEqual(clusters, {e[0]: e[0], e[1]: e[0], e[2]: e[2], e[3]: e[2], e[4]: None})
+        self.assertEqual(graph.rebuild_synonym_clusters(), {e[0]: e[0], e[1]: e[0], e[2]: e[2], e[3]: e[2]})
+
+
+class HealthTests(TestCase):
+    def setUp(self):
+        for name, value in [
+            ("last_check", None),
+            ("static_facts", {}),
+            ("dynamic_facts", {"opened_connections": None, "updated_at": None, "error": None}),
+        ]:
+            patch = mock.patch.object(health, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        patch = mock.patch.object(logging.getLogger("voc.requests"), "disabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_one_request_refreshes_at_a_time(self):
+        calls = []
+
+        def read(include_static):
+            calls.append(include_static)
+            time.sleep(0.2)
+            return {"version": "17", "max_connections": "100", "opened_connections": 3}
+
+        # The requests all find the facts stale before any refreshes them.
+        stale = threading.Barrier(4)
+        snapshots = []
+        with (
+            mock.patch.object(health, "read_database_facts", read),
+            mock.patch.object(metrics, "record_cache", lambda name, hit: stale.wait(5)),
+        ):
+            threads = [
+                threading.Thread(target=lambda: snapshots.append(async_to_sync(health.snapshot)()))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, [True])
+        self.assertEqual(len(snapshots), 4)
+        self.assertEqual(async_to_sync(health.snapshot)()["opened_connections"], 3)
+
+    @mock.patch.object(health, "QUERY_TIMEOUT", 0.05)
+    def test_slow_database_is_an_error(self):
+        with mock.patch.object(health, "read_database_facts", lambda include_static: time.sleep(0.2)):
+            snapshot = async_to_sync(health.snapshot)()
+        self.assertEqual(snapshot["error"], "Timed out.")
+        self.assertEqual(self.client.get(reverse("api-status")).status_code, 503)
+
+    def test_metrics_need_the_token(self):
+        url = reverse("api-metrics")
+        with override_settings(METRICS_TOKEN=None, DEBUG=False):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(METRICS_TOKEN=None, DEBUG=True):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get(url).status_code, 401)
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+            self.assertContains(response, "voc_requests_total")
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class TemplateTimingTests(TestCase):
+    def record(self, url):
+        with self.assertLogs("voc.requests", "INFO") as logs:
+            response = self.client.get(url)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_render_is_timed(self):
+        Vocabulary().grow(2)
+        for url in [reverse("about"), reverse("concordance") + "?q=texto", reverse("entry-list")]:
+            with self.subTest(url), override_settings(DEBUG=True):
+                response, record = self.record(url)
+                self.assertGreater(record["template_ms"], 0)
+                self.assertLessEqual(
+                    record["view_ms"] + record["template_ms"], record["duration_ms"] + 0.2
+                )
+                self.assertIn("tpl;dur=", response["Server-Timing"])
+
+    def test_nested_renders_are_counted_once(self):
+        stats = instrumentation.RequestStats()
+        stats.render_started()
+        stats.render_started()
+        stats.render_finished()
+        self.assertIsNone(stats.render_time)
+        stats.render_finished()
+        self.assertGreater(stats.render_time, 0)
+
+
+@override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+    LEXICON_SNAPSHOT=False,
+)
+class BenchmarkCommandTests(TransactionTestCase):
+    # Committed rows, since the requests are sent from other threads.
+
+    def setUp(self):
+        Vocabulary().grow(2)
+        logger = logging.getLogger("voc.requests")
+        self.addCleanup(setattr, logger, "disabled", logger.disabled)
+
+    @override_settings(ALLOWED_HOSTS=[".example.com"])
+    def test_bench_load(self):
+        from voc.management.commands import bench_load
+
+        output = io.StringIO()
+        options = {"requests": 2, "warmup": 0, "concurrency": 2, "stdout": output}
+        call_command(
+            "bench_load", endpoint=["about", "entry-detail", "search"], **options
+        )
+        self.assertEqual(output.getvalue().count(" req/s"), 6)
+        self.assertNotIn("errors", output.getvalue())
+
+        with (
+            mock.patch.object(bench_load, "wsgi_request", return_value=(500, 0.01)),
+            self.assertRaisesMessage(CommandError, "2 requests failed."),
+        ):
+            call_command("bench_load", endpoint=["about"], server="wsgi", **options)
+
+    def test_bench_cold_start(self):
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            results = os.path.join(directory, "cold_start.json")
+            call_command(
+                "bench_cold_start",
+                runs=1,
+                budget_ms=60000,
+                output=results,
+                compare=settings.BASE_DIR / "benchmarks" / "cold_start.json",
+                stdout=output,
+            )
+            saved = benchmarking.load_results(results)
+        self.assertEqual(saved["benchmark"], "cold_start")
+        self.assertEqual(saved["results"]["total_ms"]["n"], 1)
+        self.assertIn("/about/ (200 OK)", output.getvalue())
+        self.assertIn("within the 60000 ms budget", output.getvalue())
+
+    def test_profile_imports(self):
+        output = io.StringIO()
+        call_command("profile_imports", limit=3, stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertRegex(lines[0], r"^\d+ modules imported in [\d.]+ ms")
+        self.assertEqual(len([line for line in lines if line.endswith("config.wsgi_public")]), 1)
+
+    def test_bench_models(self):
+        from voc.management.commands import bench_models
+
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            results = os.path.join(directory, "models.json")
+            # Compared with the committed baseline.
+            call_command(
+                "bench_models", repeat=2, min_time=0.001, output=results, stdout=output
+            )
+            saved = benchmarking.load_results(results)
+        self.assertEqual(
+            set(saved["results"]), set(bench_models.benchmarks(bench_models.fixtures()))
+        )
+        # One line per benchmark, and a warning per regression, if any.
+        self.assertEqual(output.getvalue().count(" p50 "), len(saved["results"]))
+
+    def test_generate_corpus(self):
+        with self.assertRaisesMessage(CommandError, "already has entries"):
+            call_command("generate_corpus", entries=20)
+        call_command("flush", interactive=False)
+
+        output = io.StringIO()
+        call_command("generate_corpus", entries=20, documents=False, stdout=output)
+        self.assertRegex(output.getvalue(), r"20/20 entries\. \([\d.]+ s\)")
+        self.assertIn("run build_entry_documents", output.getvalue())
+        self.assertEqual(Entry.objects.count(), 20)
+        self.assertFalse(EntryDocument.objects.exists())
+
+        call_command("build_entry_documents", stdout=io.StringIO())
+        self.assertEqual(EntryDocument.objects.count(), 20 * len(settings.LANGUAGES))
 
-# Create your tests here.
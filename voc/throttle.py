@@ -0,0 +1,56 @@
+"""
+Token-bucket throttling of expensive endpoints, by client.
+
+Each client has a bucket of ``burst`` tokens, refilled at ``rate`` tokens
+per second; a request takes one, and is refused while the bucket is empty.
+Buckets live in the memory of the process (the least recently seen clients
+are forgotten past ``max_clients``), so each process throttles on its own.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def client_key(request):
+    """
+    The client's address: from ``CLIENT_IP_HEADER`` when a proxy in front
+    of the app sets it (such as ``X-Real-IP``), else from the connection.
+    """
+    if settings.CLIENT_IP_HEADER:
+        address = request.headers.get(settings.CLIENT_IP_HEADER, "")
+        address = address.split(",")[0].strip()
+        if address:
+            return address
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, max_clients=10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """
+        Take a token from the bucket of ``key`` and return 0, or return the
+        seconds until there's one.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return wait
@@ -0,0 +1,97 @@
+"""
+Per-view statement timeouts.
+
+The queries of the views in ``STATEMENT_TIMEOUTS`` (by URL name) run in a
+transaction with ``SET LOCAL statement_timeout``, so PostgreSQL cancels the
+ones over the view's budget instead of letting a pathological request (a
+one-letter search, a deep page of a multi-author filter) hold a backend and
+a connection for seconds. Being local to the transaction, the setting never
+outlives it, even behind a transaction-pooling PgBouncer.
+
+A cancelled query raises ``QueryTimeout`` and is counted in
+``voc_statement_timeouts_total``. The views degrade instead of failing: the
+search leaves the lookup out of its results, with a notice, and the lists
+serve the last copy of the page they rendered (see ``fallback()``), kept by
+the parameters the view validated, not its URL, and copied again at most
+every ``FALLBACK_REFRESH`` seconds.
+"""
+
+import hashlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connections, router, transaction
+from django.utils.translation import get_language
+
+from voc import metrics
+
+
+# SQLSTATE of a query cancelled by statement_timeout.
+QUERY_CANCELED = "57014"
+
+# How long the lists keep the last copy of each page, to serve when its
+# queries time out, and how often it's copied again.
+FALLBACK_TIMEOUT = 24 * 60 * 60
+FALLBACK_REFRESH = 5 * 60
+
+statement_timeouts = metrics.Counter(
+    "voc_statement_timeouts_total",
+    "Queries cancelled for going over their view's statement timeout, by view.",
+    ["view"],
+)
+
+
+class QueryTimeout(Exception):
+    """A query went over its view's statement timeout and was cancelled."""
+
+
+def is_cancelled(error):
+    return getattr(error.__cause__, "sqlstate", None) == QUERY_CANCELED
+
+
+@contextmanager
+def limit(view, model, at_most=None):
+    """
+    Run the queries of ``model`` (and of the models read from the same
+    database) within the statement timeout of ``view``, or ``at_most``
+    milliseconds if that's shorter.
+    """
+    milliseconds = settings.STATEMENT_TIMEOUTS.get(view)
+    if at_most is not None:
+        milliseconds = min(milliseconds or at_most, at_most)
+    using = router.db_for_read(model)
+    connection = connections[using]
+    if not milliseconds or connection.vendor != "postgresql":
+        yield
+        return
+    try:
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(milliseconds)}")
+            yield
+    except OperationalError as error:
+        if not is_cancelled(error):
+            raise
+        statement_timeouts.inc(view=view)
+        raise QueryTimeout(view) from error
+
+
+def fallback_key(view, params):
+    """The cache key of the page of ``view`` with the ``params`` it validated."""
+    digest = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+    return f"voc:fallback:{get_language()}:{view}:{digest}"
+
+
+def remember(key, response):
+    """
+    Keep the content of a rendered page, to serve if its queries time out,
+    unless a copy was kept less than FALLBACK_REFRESH seconds ago.
+    """
+    if response.status_code == 200 and cache.add(f"{key}:fresh", True, FALLBACK_REFRESH):
+        cache.set(key, response.content, FALLBACK_TIMEOUT)
+
+
+def fallback(key):
+    """The last content of the page kept by remember(), or None."""
+    return cache.get(key)
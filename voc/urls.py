@@ -30,6 +30,16 @@ urlpatterns = [
     ),
     # Search
     path("search/", views.search, name="search"),
+    # Concordance of the cotexts
+    path("concordance/", views.concordance_view, name="concordance"),
     # About
     path("about/", views.about, name="about"),
+    # Sitemaps
+    path("robots.txt", views.robots_txt, name="robots"),
+    path("sitemap.xml", views.sitemap_index, name="sitemap-index"),
+    path("sitemap-pages.xml", views.sitemap_pages, name="sitemap-pages"),
+    path("sitemap-<slug:section>-<int:chunk>.xml", views.sitemap, name="sitemap"),
+    # Language switcher and the links of signed-in users, see base.html
+    path("language/", views.set_language, name="language"),
+    path("account-nav/", views.account_nav, name="account-nav"),
 ]
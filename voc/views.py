@@ -1,68 +1,318 @@
-import os
-from django.http import JsonResponse
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404, get_list_or_404
-from django.db import connection
+from django.urls import reverse
+from django.utils.cache import add_never_cache_headers, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.translation import check_for_language
+from django.views.decorators.cache import cache_control, never_cache
 from django.views.generic import ListView, DetailView
-from datetime import datetime
-from dotenv import load_dotenv
+from datetime import date
 from django.utils.formats import get_format
-from django.utils.translation import gettext as _
+from django.utils.translation import get_language, gettext as _
+
+from voc import changes as change_log
+from voc import (
+    concordance,
+    documents,
+    graph,
+    health,
+    instrumentation,
+    metrics,
+    search_cache,
+    sitemaps,
+    snapshot,
+    throttle,
+    timeouts,
+)
+from voc.models import Author, Cotext, Entry, TradTerm
 
 
+def index(request):
+    return redirect("author-list")
 
-from voc.models import Author, Entry, TradTerm
-
-load_dotenv()
 
+def cacheable(response):
+    # The language comes from the cookie, when it's set.
+    if response.status_code == 200 and not response.has_header("Cache-Control"):
+        patch_cache_control(response, public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE)
+        patch_vary_headers(response, ["Cookie"])
+    return response
 
-def query(query_object):
-    with connection.cursor() as cursor:
-        return cursor.execute(**query_object).fetchall()
 
+def public_page(view):
+    """
+    Let browsers and shared caches keep the page for PUBLIC_PAGE_MAX_AGE
+    seconds. Public pages are the same for every visitor: the links of
+    signed-in users are fetched by account.js (see account_nav()).
+    """
+    if iscoroutinefunction(view):
 
-def index(request):
-    return redirect("author-list")
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            return cacheable(await view(request, *args, **kwargs))
 
+    else:
 
-def status(request):
-    updated_at = datetime.now().isoformat()
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return cacheable(view(request, *args, **kwargs))
 
-    db_version_res = query({"sql": "SHOW server_version;"})
-    db_version_val = db_version_res[0][0]
+    return wrapper
 
-    db_max_conn_res = query({"sql": "SHOW max_connections;"})
-    db_max_conn_val = db_max_conn_res[0][0]
 
-    db_name = os.getenv("POSTGRES_DB")
-    db_open_conn_res = query(
-        {
-            "sql": "SELECT count(*)::int FROM pg_stat_activity WHERE datname = %s",
-            "params": (db_name,),
-        }
+@never_cache
+def account_nav(request):
+    """The navbar links of the visitor: "Admin" for staff, else "Sign In"."""
+    return render(
+        request, "partials/account_nav.html", {"user": getattr(request, "user", None)}
     )
-    db_open_conn_val = db_open_conn_res[0][0]
+
+
+@never_cache
+def set_language(request):
+    """
+    Switch the language of the pages and go back to ``next``. Unlike
+    Django's set_language it takes a GET, so the language form needs no
+    CSRF token, which would make every page different.
+    """
+    next_url = request.GET.get("next", "/")
+    if not url_has_allowed_host_and_scheme(
+        next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()
+    ):
+        next_url = "/"
+    response = HttpResponseRedirect(next_url)
+    language = request.GET.get("language")
+    if language and check_for_language(language):
+        response.set_cookie(
+            settings.LANGUAGE_COOKIE_NAME,
+            language,
+            max_age=settings.LANGUAGE_COOKIE_AGE,
+            path=settings.LANGUAGE_COOKIE_PATH,
+            domain=settings.LANGUAGE_COOKIE_DOMAIN,
+            secure=settings.LANGUAGE_COOKIE_SECURE,
+            httponly=settings.LANGUAGE_COOKIE_HTTPONLY,
+            samesite=settings.LANGUAGE_COOKIE_SAMESITE,
+        )
+    return response
+
+
+async def status(request):
+    snapshot = await health.snapshot()
 
     data = {
-        "updated_at": updated_at,
+        "updated_at": snapshot["updated_at"],
         "dependencies": {
             "database": {
-                "version": db_version_val,
-                "max_connections": db_max_conn_val,
-                "opened_connections": db_open_conn_val,
+                "version": snapshot.get("version"),
+                "max_connections": snapshot.get("max_connections"),
+                "opened_connections": snapshot["opened_connections"],
+                "pool": health.pool_stats(),
+                "error": snapshot["error"],
             },
         },
     }
 
+    return JsonResponse(data, status=503 if snapshot["error"] else 200)
+
+
+def prometheus_metrics(request):
+    """Process metrics in the Prometheus text format."""
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            raise Http404
+    elif request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# Maximum number of entries a single tooltip batch may ask for.
+DEFINITIONS_BATCH_SIZE = 100
+
+
+@cache_control(public=True, max_age=60 * 60)
+def definitions(request):
+    """
+    Return the definitions text of a batch of entries, keyed by entry id.
+    Used by tooltips.js to lazily fill in the tooltips of entry links, so
+    list pages don't need to compute and ship every definition up front.
+    """
+    ids = set()
+    for value in request.GET.get("ids", "").split(","):
+        if value.strip().isdigit():
+            ids.add(int(value))
+        if len(ids) >= DEFINITIONS_BATCH_SIZE:
+            break
+
+    entries = Entry.objects.filter(pk__in=ids).prefetch_related("term_def")
+    data = {
+        "definitions": {
+            entry.pk: entry.definitions_textblock() for entry in entries
+        },
+    }
+
+    return JsonResponse(data)
+
+
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 1000
+
+
+def changes(request):
+    """
+    Change feed: return the changes recorded after the ``since`` cursor, in
+    commit order. Consumers keep the returned ``next`` cursor and pass it as
+    ``since`` in their following request.
+    """
+    try:
+        since = change_log.parse_cursor(request.GET.get("since", 0))
+        limit = int(request.GET.get("limit", CHANGES_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor or limit."}, status=400)
+    limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
+
+    page, has_more = change_log.page(since, limit)
+    last = (page[-1].transaction_id, page[-1].pk) if page else since
+
+    data = {
+        "changes": [
+            {
+                "cursor": change_log.format_cursor(change.transaction_id, change.pk),
+                "model": change.model,
+                "object_id": change.object_id,
+                "action": change.action,
+                "entry_ids": change.entry_ids,
+                "created_at": change.created_at.isoformat(),
+            }
+            for change in page
+        ],
+        "next": change_log.format_cursor(*last),
+        "has_more": has_more,
+    }
+
     return JsonResponse(data)
 
 
-class EntryListView(ListView):
+def entry_graph(request, slug):
+    """
+    Return the neighborhood of an entry in the relation graph as nodes and
+    edges. ``depth`` sets the number of hops and ``type`` (repeatable) the
+    relation types to follow.
+    """
+    entry = get_object_or_404(Entry, slug=slug)
+    try:
+        depth = int(request.GET.get("depth", 1))
+    except ValueError:
+        return JsonResponse({"error": "Invalid depth."}, status=400)
+    types = [t for t in request.GET.getlist("type") if t in graph.RELATION_TYPES]
+
+    distances = graph.neighborhood(entry.pk, depth, types)
+    data = graph.graph_json(list(distances), distances, types)
+    data["truncated"] = len(distances) >= graph.MAX_NODES
+
+    return JsonResponse(data)
+
+
+def synonym_cluster(request, cluster):
+    """Return the entries of a synonym cluster and the synonymy between them."""
+    entry_ids = list(
+        Entry.objects.filter(synonym_cluster=cluster).values_list("pk", flat=True)
+    )
+    if not entry_ids:
+        raise Http404
+    data = graph.graph_json(entry_ids, types=[graph.SYNONYM])
+    data["cluster"] = cluster
+
+    return JsonResponse(data)
+
+
+class SnapshotMixin:
+    """
+    Serve the view from the in-memory snapshot of the vocabulary (see
+    voc.snapshot), if it's up to date; ``self.lexicon`` is None otherwise.
+    """
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.lexicon = snapshot.current()
+
+
+class StatementTimeoutMixin:
+    """
+    Run the queries of the list, those of its template included, within the
+    view's statement timeout (see voc.timeouts). If one is cancelled, serve
+    the last copy of the page, or a 503 if there's none.
+    """
+
+    def fallback_params(self):
+        """The parameters the page depends on, besides its number."""
+        return dict(self.kwargs)
+
+    def fallback_key(self, page):
+        params = {**self.fallback_params(), self.page_kwarg: page}
+        return timeouts.fallback_key(self.request.resolver_match.url_name, params)
+
+    def get(self, request, *args, **kwargs):
+        if self.lexicon is not None:
+            return super().get(request, *args, **kwargs)
+        try:
+            with timeouts.limit(request.resolver_match.url_name, self.model):
+                response = super().get(request, *args, **kwargs)
+                response.render()
+        except timeouts.QueryTimeout:
+            page = request.GET.get(self.page_kwarg) or "1"
+            content = timeouts.fallback(
+                self.fallback_key(int(page) if page.isdigit() else page)
+            )
+            if content is None:
+                response = HttpResponse(
+                    _("The vocabulary is busy, please try again in a moment."),
+                    content_type="text/plain; charset=utf-8",
+                    status=503,
+                    headers={"Retry-After": "5"},
+                )
+            else:
+                response = HttpResponse(content)
+            add_never_cache_headers(response)
+            return response
+        page = response.context_data.get("page_obj") if response.context_data else None
+        timeouts.remember(self.fallback_key(page.number if page else 1), response)
+        return response
+
+
+@method_decorator(public_page, name="dispatch")
+class PublicPageMixin:
+    """Cacheable public page, see public_page()."""
+
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+
+class EntryListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = Entry
     template_name = "voc/entry_list.html"
     context_object_name = "entry_list"
     paginate_by = 100
 
     def get_queryset(self):
+        if self.lexicon is not None:
+            entries = self.lexicon.entry_list(
+                self.request.GET.getlist("author"),
+                self.request.GET.get("category") or None,
+            )
+            if entries is None:
+                raise Http404
+            return entries
+
         queryset = Entry.objects.all().order_by_abc_lowercase()
 
         # Get query string parameters
@@ -80,44 +330,46 @@ class EntryListView(ListView):
 
         return queryset
 
+    def fallback_params(self):
+        return {
+            "author": sorted(set(self.request.GET.getlist("author"))),
+            "category": self.request.GET.get("category") or None,
+        }
+
+
+class EntryDetailView(PublicPageMixin, SnapshotMixin, DetailView):
+    """
+    Rendered from the entry's precomputed document (see voc.documents), in
+    a single lookup by slug.
+    """
 
-class EntryDetailView(DetailView):
-    model = Entry
     template_name = "voc/entry_detail.html"
     context_object_name = "entry"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        entry = context["entry"]
-        context["related_entries"] = []
-        for related_list, type in [
-            (entry.antonyms(), _("antonym")),
-            (entry.homonyms(), _("homonym")),
-            (entry.synonyms(), _("synonym")),
-            (entry.near_synonyms(), _("near-synonym")),
-        ]:
-            for e in related_list:
-                context["related_entries"].append(
-                    {
-                        "type": type,
-                        "author": {
-                            "name": e.cotext.reference.formatted_authors(),
-                            "slugs": e.authors_slugs(),
-                        },
-                        "entry": e,
-                    }
-                )
-        return context
+    def get_object(self, queryset=None):
+        entry = None
+        if self.lexicon is not None:
+            entry = self.lexicon.document(self.kwargs["slug"], get_language())
+        if entry is None:
+            entry = documents.get(self.kwargs["slug"], get_language())
+        if entry is None:
+            raise Http404(_("No entry found matching the query"))
+        return entry
 
 
-class AuthorListView(ListView):
+class AuthorListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = Author
     template_name = "voc/author_list.html"
     context_object_name = "author_list"
     paginate_by = 100
 
+    def get_queryset(self):
+        if self.lexicon is not None:
+            return self.lexicon.authors
+        return super().get_queryset()
+
 
-class AuthorEntryListView(ListView):
+class AuthorEntryListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = Entry
     template_name = "voc/author_entry_list.html"
     context_object_name = "entry_list"
@@ -126,10 +378,18 @@ class AuthorEntryListView(ListView):
     @property
     def author(self):
         author_slug = self.kwargs["author_slug"]
+        if self.lexicon is not None:
+            author = self.lexicon.author_by_slug.get(author_slug)
+            if author is None:
+                raise Http404
+            return author
         author = get_object_or_404(Author, slug=author_slug)
         return author
 
     def get_queryset(self):
+        if self.lexicon is not None:
+            return self.lexicon.entries_by_author.get(self.author.pk, ())
+
         queryset = Entry.objects.filter(
             cotext__reference__authors=self.author
         ).order_by_abc_lowercase()
@@ -141,25 +401,36 @@ class AuthorEntryListView(ListView):
         return context
 
 
-class CategoryListView(ListView):
+class CategoryListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = TradTerm
     template_name = "voc/category_list.html"
     context_object_name = "category_list"
     paginate_by = 100
 
+    def get_queryset(self):
+        if self.lexicon is not None:
+            return self.lexicon.categories
+        return super().get_queryset()
 
-class EntryByCategoryListView(ListView):
+
+class EntryByCategoryListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = Entry
     template_name = "voc/entry_by_category_list.html"
     context_object_name = "entry_list"
     paginate_by = 100
 
     def get_queryset(self):
-        queryset = Entry.objects.all().order_by_abc_lowercase(["trad_term"])
+        if self.lexicon is not None:
+            return self.lexicon.entries_by_category_order
+
+        queryset = (
+            Entry.objects.select_related("trad_term")
+            .order_by_abc_lowercase(["trad_term"])
+        )
         return queryset
 
 
-class CategoryEntryListView(ListView):
+class CategoryEntryListView(PublicPageMixin, StatementTimeoutMixin, SnapshotMixin, ListView):
     model = Entry
     template_name = "voc/category_entry_list.html"
     context_object_name = "entry_list"
@@ -168,10 +439,18 @@ class CategoryEntryListView(ListView):
     @property
     def trad_term(self):
         trad_term_slug = self.kwargs["category_slug"]
+        if self.lexicon is not None:
+            trad_term = self.lexicon.category_by_slug.get(trad_term_slug)
+            if trad_term is None:
+                raise Http404
+            return trad_term
         trad_term = get_object_or_404(TradTerm, slug=trad_term_slug)
         return trad_term
 
     def get_queryset(self):
+        if self.lexicon is not None:
+            return self.lexicon.entries_by_category.get(self.trad_term.pk, ())
+
         queryset = Entry.objects.filter(
             trad_term=self.trad_term
         ).order_by_abc_lowercase()
@@ -183,65 +462,334 @@ class CategoryEntryListView(ListView):
         return context
 
 
-def search(request):
+search_throttle = throttle.TokenBucket(
+    settings.SEARCH_THROTTLE_RATE, settings.SEARCH_THROTTLE_BURST
+)
+search_throttled = metrics.Counter(
+    "voc_search_throttled_total", "Searches refused for coming too fast from a client."
+)
+
+# Time the search may spend on its lookups; categories that take longer are
+# left out of the results instead of delaying the whole response.
+SEARCH_TIME_BUDGET = 2.0
+
+# Threads of the search lookups, as many as the connection pool can serve
+# (SEARCH_THREADS): the loop's default executor is shut down, waiting for the
+# lookups left behind, when a WSGI server's request ends.
+search_executor = ThreadPoolExecutor(
+    max_workers=settings.SEARCH_THREADS, thread_name_prefix="voc-search"
+)
+
+
+# Each lookup returns the records of voc.snapshot, up to one past
+# SEARCH_MAX_RESULTS so voc.search_cache knows whether they're complete. Its
+# statement timeout (voc.timeouts) is at most the time budget, so PostgreSQL
+# stops the queries the search stopped waiting for.
+
+
+def search_entries(query):
+    with timeouts.limit("search", Entry, SEARCH_TIME_BUDGET * 1000):
+        rows = Entry.objects.filter(term__text__icontains=query).values_list(
+            "pk", "slug", "display_name", "term__text"
+        )
+        return [
+            snapshot.EntryRecord(pk, slug, name, text.lower(), None)
+            for pk, slug, name, text in rows[: settings.SEARCH_MAX_RESULTS + 1]
+        ]
+
+
+def search_authors(query):
+    with timeouts.limit("search", Author, SEARCH_TIME_BUDGET * 1000):
+        authors = Author.objects.filter(full_name__icontains=query)
+        return [
+            snapshot.AuthorRecord(
+                author.pk, author.slug, str(author), author.description_html, author.full_name.lower()
+            )
+            for author in authors[: settings.SEARCH_MAX_RESULTS + 1]
+        ]
+
+
+def search_categories(query):
+    with timeouts.limit("search", TradTerm, SEARCH_TIME_BUDGET * 1000):
+        rows = TradTerm.objects.filter(text__icontains=query).values_list(
+            "pk", "slug", "text", "definition_html"
+        )
+        return [
+            snapshot.CategoryRecord(*row) for row in rows[: settings.SEARCH_MAX_RESULTS + 1]
+        ]
+
+
+def in_transaction():
+    return any(
+        connection.in_atomic_block for connection in connections.all(initialized_only=True)
+    )
+
+
+def closing_connections(function):
+    """
+    ``function``, counting its queries for the request and closing the
+    connections it opened in its thread.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            with instrumentation.counting_queries():
+                return function(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return wrapper
+
+
+async def run_lookup(function, *args):
+    """
+    Run the sync ``function`` in a thread of ``search_executor``, on
+    connections of its own, so lookups run concurrently. Within a transaction (a test, an
+    ATOMIC_REQUESTS deployment) they run in the request's thread instead,
+    one after the other: other connections wouldn't see its writes.
+    """
+    if await sync_to_async(in_transaction)():
+        return await sync_to_async(function)(*args)
+    return await sync_to_async(
+        closing_connections(function), thread_sensitive=False, executor=search_executor
+    )(*args)
+
+
+async def gather_within(lookups, timeout):
+    """
+    Run the ``{name: coroutine}`` lookups concurrently and return their
+    results after at most ``timeout`` seconds, along with the names of the
+    lookups that didn't finish in time or whose queries were cancelled
+    (whose results are empty).
+    """
+    tasks = {name: asyncio.ensure_future(lookup) for name, lookup in lookups.items()}
+    done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    results, timed_out = {}, []
+    for name, task in tasks.items():
+        results[name] = []
+        if task not in done:
+            timed_out.append(name)
+            continue
+        try:
+            results[name] = task.result()
+        except timeouts.QueryTimeout:
+            timed_out.append(name)
+    return results, timed_out
+
+
+@public_page
+async def search(request):
     """
     Handles both JSON and HTML search results.
     If the request is AJAX (live typing), return JSON.
     If it's a normal GET (button click or Enter), render a template.
+    Entries, authors and categories are found in the vocabulary snapshot or,
+    when it's stale, looked up concurrently, within SEARCH_TIME_BUDGET and
+    the search's statement timeout; the ones that didn't make it are listed
+    in ``partial``, and the incomplete results aren't cached.
     """
+    is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
     query = request.GET.get("q", "").strip()
+    if query and settings.SEARCH_THROTTLE_RATE:
+        wait = search_throttle.take(throttle.client_key(request))
+        if wait:
+            search_throttled.inc()
+            response = (
+                JsonResponse({"results": {}, "throttled": True}, status=429)
+                if is_ajax
+                else HttpResponse(_("Too many searches, please slow down."), status=429)
+            )
+            response["Retry-After"] = str(math.ceil(wait))
+            add_never_cache_headers(response)
+            return response
     if not query:
         # For empty search, show empty page or redirect
 
-        if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        if is_ajax:
             return JsonResponse({"results": {}})
-        return render(request, "voc/search_results.html", {"query": "", "results": {}})
+        return await sync_to_async(render)(
+            request, "voc/search_results.html", {"query": "", "results": {}}
+        )
 
-    entries_objs = Entry.objects.filter(term__text__icontains=query)
-    entries_list = [
-        {"slug": entry.slug, "text": str(entry)} for entry in entries_objs[:5]
-    ]
-    authors_objs = Author.objects.filter(full_name__icontains=query)
-    authors_list = [
-        {"slug": author.slug, "text": str(author)} for author in authors_objs[:5]
-    ]
-    categories_objs = TradTerm.objects.filter(text__icontains=query)
-    categories_list = [
-        {"slug": category.slug, "text": str(category)}
-        for category in categories_objs[:5]
-    ]
+    limit = 5 if is_ajax else None
+    normalized = search_cache.normalize(query)
+    lexicon = await sync_to_async(snapshot.current)()
+    source = lexicon.version if lexicon is not None else "database"
+    found, partial = search_cache.cache.get(source, normalized), []
+    metrics.record_cache("search", found is not None)
+    if found is None:
+        if lexicon is not None:
+            found = lexicon.search(normalized)
+        else:
+            found, partial = await gather_within(
+                {
+                    "entries": run_lookup(search_entries, normalized),
+                    "authors": run_lookup(search_authors, normalized),
+                    "categories": run_lookup(search_categories, normalized),
+                },
+                SEARCH_TIME_BUDGET,
+            )
+        if not partial:
+            found = search_cache.cache.put(source, normalized, found)
+    results = {
+        kind: records[: settings.SEARCH_MAX_RESULTS][:limit] for kind, records in found.items()
+    }
 
     # Handle AJAX (dropdown)
-    if request.headers.get("x-requested-with") == "XMLHttpRequest":
-        return JsonResponse(
+    if is_ajax:
+        entries_list = [
+            {"slug": entry.slug, "text": str(entry)} for entry in results["entries"]
+        ]
+        authors_list = [
+            {"slug": author.slug, "text": str(author)} for author in results["authors"]
+        ]
+        categories_list = [
+            {"slug": category.slug, "text": str(category)}
+            for category in results["categories"]
+        ]
+        entries_url = reverse("entry-list")
+        response = JsonResponse(
             {
                 "results": {
-                    _("authors"): {"list": authors_list, "url": "entries/?author="},
+                    _("authors"): {"list": authors_list, "url": f"{entries_url}?author="},
                     _("categories"): {
                         "list": categories_list,
-                        "url": "entries/?category=",
+                        "url": f"{entries_url}?category=",
                     },
-                    _("entries"): {"list": entries_list, "url": "entries/"},
-                }
+                    _("entries"): {"list": entries_list, "url": entries_url},
+                },
+                "partial": partial,
             }
         )
-
-    # Handle full search (button click or enter)
-    return render(
-        request,
-        "voc/search_results.html",
-        {
-            "query": query,
-            "results": {
-                "entries": entries_objs,
-                "authors": authors_objs,
-                "categories": categories_objs,
+    else:
+        # Handle full search (button click or enter)
+        response = await sync_to_async(render)(
+            request,
+            "voc/search_results.html",
+            {
+                "query": query,
+                "results": results,
+                "partial": partial,
             },
-        },
-    )
+        )
+    if partial:
+        add_never_cache_headers(response)
+    return response
+
+def concordance_params(request):
+    """The concordance's arguments, from the query string; ValueError if invalid."""
+    get = request.GET
+    window = int(get.get("window", concordance.DEFAULT_WINDOW))
+    return {
+        "query": concordance.normalize(get.get("q", "")),
+        "window": max(1, min(window, concordance.MAX_WINDOW)),
+        "after": int(get.get("after", 0)),
+        "author": get.get("author") or None,
+        "reference": int(get["reference"]) if get.get("reference") else None,
+        "date_from": date.fromisoformat(get["from"]) if get.get("from") else None,
+        "date_to": date.fromisoformat(get["to"]) if get.get("to") else None,
+    }
+
+
+@public_page
+def concordance_view(request):
+    """
+    Keyword-in-context lines of a word or phrase across the cotexts, a page
+    of cotexts at a time, within the concordance's statement timeout. The
+    authors to filter by are those of the snapshot, when it's up to date.
+    """
+    lexicon = snapshot.current()
+    context = {
+        "authors": lexicon.authors if lexicon is not None else [],
+        "min_length": concordance.MIN_QUERY_LENGTH,
+        "lines": None,
+    }
+    try:
+        params = concordance_params(request)
+    except ValueError:
+        return render(request, "voc/concordance.html", {**context, "invalid": True}, status=400)
+    context["params"] = params
+    if len(params["query"]) < concordance.MIN_QUERY_LENGTH:
+        return render(request, "voc/concordance.html", context)
+    try:
+        with timeouts.limit("concordance", Cotext):
+            lines, after, has_more = concordance.page(**params)
+    except timeouts.QueryTimeout:
+        response = render(
+            request, "voc/concordance.html", {**context, "timed_out": True}, status=503
+        )
+        add_never_cache_headers(response)
+        return response
+    context.update(lines=lines, next=after if has_more else None)
+    return render(request, "voc/concordance.html", context)
 
+
+def concordance_api(request):
+    """
+    The concordance as JSON: the lines of a page of cotexts, the ``next``
+    cursor (pass it as ``after``) and whether there are more. ``limit`` sets
+    the cotexts per page.
+    """
+    try:
+        params = concordance_params(request)
+        limit = int(request.GET.get("limit", concordance.PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({"error": "Invalid parameters."}, status=400)
+    limit = max(1, min(limit, concordance.MAX_PAGE_SIZE))
+    if len(params["query"]) < concordance.MIN_QUERY_LENGTH:
+        return JsonResponse(
+            {"error": f"The query needs {concordance.MIN_QUERY_LENGTH} characters or more."},
+            status=400,
+        )
+    try:
+        with timeouts.limit("api-concordance", Cotext):
+            lines, after, has_more = concordance.page(**params, limit=limit)
+    except timeouts.QueryTimeout:
+        return JsonResponse({"error": "The query took too long."}, status=503)
+    return JsonResponse({"lines": lines, "next": after, "has_more": has_more})
+
+
+@public_page
 def about(request):
     return render(
         request,
         "voc/about.html"
-    )
\ No newline at end of file
+    )
+
+
+def base_url(request):
+    return request.build_absolute_uri("/").rstrip("/")
+
+
+@public_page
+def sitemap_index(request):
+    return HttpResponse(sitemaps.index(base_url(request)), content_type="application/xml")
+
+
+@public_page
+def sitemap_pages(request):
+    return HttpResponse(sitemaps.pages(base_url(request)), content_type="application/xml")
+
+
+@public_page
+def sitemap(request, section, chunk):
+    if section not in sitemaps.SECTIONS:
+        raise Http404
+    content = sitemaps.chunk(section, chunk, base_url(request))
+    if content is None:
+        raise Http404
+    return HttpResponse(content, content_type="application/xml")
+
+
+@public_page
+def robots_txt(request):
+    lines = [
+        "User-agent: *",
+        "Disallow: /admin/",
+        f"Sitemap: {base_url(request)}{reverse('sitemap-index')}",
+    ]
+    return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; charset=utf-8")